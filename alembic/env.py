@@ -9,16 +9,20 @@ from app.database.base import Base
 
 from app.models import (
     discount,
+    idempotency_key,
     order,
     product,
     user,
     orders_products,
     points,
     product,
+    product_sales_stats,
     products_sales,
     review,
     sale,
+    stock_reservation,
     store,
+    store_daily_sales,
     user,
 )
 
@@ -0,0 +1,31 @@
+"""store pending order timeout
+
+Revision ID: 1d32989930fb
+Revises: 5fa6e644a393
+Create Date: 2026-10-17 16:41:09.527310
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "1d32989930fb"
+down_revision: Union[str, None] = "5fa6e644a393"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "stores", sa.Column("pending_order_timeout", sa.Integer(), nullable=True)
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("stores", "pending_order_timeout")
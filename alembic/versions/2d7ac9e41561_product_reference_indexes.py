@@ -0,0 +1,40 @@
+"""product reference indexes
+
+Revision ID: 2d7ac9e41561
+Revises: f357c9664c6d
+Create Date: 2026-10-17 22:04:51.730226
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "2d7ac9e41561"
+down_revision: Union[str, None] = "f357c9664c6d"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        "ix_orders_products_product_id",
+        "orders_products",
+        ["product_id"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_products_sales_product_id",
+        "products_sales",
+        ["product_id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_products_sales_product_id", table_name="products_sales")
+    op.drop_index("ix_orders_products_product_id", table_name="orders_products")
@@ -0,0 +1,107 @@
+"""product sales counters
+
+Revision ID: 449d89b11cd1
+Revises: 6eba1c5a8240
+Create Date: 2026-10-17 12:27:05.664091
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "449d89b11cd1"
+down_revision: Union[str, None] = "6eba1c5a8240"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "product_sales_totals",
+        sa.Column("id", sa.BigInteger(), nullable=False),
+        sa.Column("product_id", sa.BigInteger(), nullable=False),
+        sa.Column("store_id", sa.BigInteger(), nullable=False),
+        sa.Column("units", postgresql.DOUBLE_PRECISION(precision=53), nullable=False),
+        sa.Column("revenue", sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.Column("last_sold_at", sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["product_id"],
+            ["products.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["store_id"],
+            ["stores.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("product_id"),
+    )
+    op.create_index(
+        "ix_product_sales_totals_store_id_units",
+        "product_sales_totals",
+        ["store_id", "units"],
+        unique=False,
+    )
+    op.create_table(
+        "product_daily_sales",
+        sa.Column("id", sa.BigInteger(), nullable=False),
+        sa.Column("product_id", sa.BigInteger(), nullable=False),
+        sa.Column("store_id", sa.BigInteger(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("units", postgresql.DOUBLE_PRECISION(precision=53), nullable=False),
+        sa.Column("revenue", sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["product_id"],
+            ["products.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["store_id"],
+            ["stores.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("product_id", "day", name="product_daily_sales_key"),
+    )
+    op.create_index(
+        "ix_product_daily_sales_store_id_day",
+        "product_daily_sales",
+        ["store_id", "day"],
+        unique=False,
+    )
+    # backfill from the existing sales. products_sales doesn't store the unit price, so the current one is used
+    op.execute(
+        """
+        INSERT INTO product_sales_totals (product_id, store_id, units, revenue, last_sold_at)
+        SELECT p.id, p.store_id, SUM(ps.quantity), SUM(p.price * ps.quantity), MAX(s."timestamp")
+        FROM products_sales ps
+        JOIN sales s ON s.id = ps.sale_id
+        JOIN products p ON p.id = ps.product_id
+        GROUP BY p.id, p.store_id
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO product_daily_sales (product_id, store_id, day, units, revenue)
+        SELECT p.id, p.store_id, CAST(timezone(INTERVAL '-03:00', s."timestamp") AS DATE),
+               SUM(ps.quantity), SUM(p.price * ps.quantity)
+        FROM products_sales ps
+        JOIN sales s ON s.id = ps.sale_id
+        JOIN products p ON p.id = ps.product_id
+        GROUP BY 1, 2, 3
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        "ix_product_daily_sales_store_id_day", table_name="product_daily_sales"
+    )
+    op.drop_table("product_daily_sales")
+    op.drop_index(
+        "ix_product_sales_totals_store_id_units", table_name="product_sales_totals"
+    )
+    op.drop_table("product_sales_totals")
@@ -0,0 +1,96 @@
+"""stock reservations
+
+Revision ID: 5fa6e644a393
+Revises: 449d89b11cd1
+Create Date: 2026-10-17 15:02:41.318204
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "5fa6e644a393"
+down_revision: Union[str, None] = "449d89b11cd1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "products",
+        sa.Column(
+            "reserved_quantity",
+            postgresql.DOUBLE_PRECISION(precision=53),
+            nullable=False,
+            server_default="0",
+        ),
+    )
+    op.create_table(
+        "stock_reservations",
+        sa.Column("id", sa.BigInteger(), nullable=False),
+        sa.Column("order_id", sa.BigInteger(), nullable=False),
+        sa.Column("product_id", sa.BigInteger(), nullable=False),
+        sa.Column(
+            "quantity", postgresql.DOUBLE_PRECISION(precision=53), nullable=False
+        ),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["order_id"],
+            ["orders.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["product_id"],
+            ["products.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("order_id", "product_id", name="stock_reservations_key"),
+    )
+    op.create_index(
+        "ix_stock_reservations_expires_at",
+        "stock_reservations",
+        ["expires_at"],
+        unique=False,
+    )
+    # Orders that haven't been received yet took their stock out of products.quantity when they were placed:
+    # turn that into reservations and give the stock back to the on-hand quantity. Pending orders get a fresh
+    # expiry, accepted ones keep their stock until they're received or cancelled.
+    op.execute(
+        """
+        INSERT INTO stock_reservations (order_id, product_id, quantity, expires_at, created_at)
+        SELECT op.order_id, op.product_id, SUM(op.quantity),
+               CASE WHEN o.status = 'PENDING' THEN now() + INTERVAL '30 minutes' END,
+               now()
+        FROM orders_products op
+        JOIN orders o ON o.id = op.order_id
+        WHERE o.status IN ('PENDING', 'ACCEPTED')
+        GROUP BY op.order_id, op.product_id, o.status
+        """
+    )
+    op.execute(
+        """
+        UPDATE products p
+        SET quantity = p.quantity + r.quantity, reserved_quantity = r.quantity
+        FROM (
+            SELECT product_id, SUM(quantity) AS quantity
+            FROM stock_reservations
+            GROUP BY product_id
+        ) r
+        WHERE p.id = r.product_id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(
+        "UPDATE products SET quantity = quantity - reserved_quantity WHERE reserved_quantity > 0"
+    )
+    op.drop_index("ix_stock_reservations_expires_at", table_name="stock_reservations")
+    op.drop_table("stock_reservations")
+    op.drop_column("products", "reserved_quantity")
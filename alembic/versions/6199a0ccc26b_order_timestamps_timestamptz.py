@@ -0,0 +1,102 @@
+"""order timestamps timestamptz
+
+Revision ID: 6199a0ccc26b
+Revises: 1d32989930fb
+Create Date: 2026-10-17 17:58:22.104385
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "6199a0ccc26b"
+down_revision: Union[str, None] = "1d32989930fb"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# TIME columns never stored the date: put every time on the most recent day on which it isn't in the future
+_LATEST_OCCURRENCE = """
+    (CURRENT_DATE + {column})
+    - CASE WHEN CURRENT_DATE + {column} > now() THEN INTERVAL '1 day' ELSE INTERVAL '0 days' END
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.alter_column(
+        "orders",
+        "created_at",
+        existing_type=postgresql.TIME(timezone=True),
+        type_=postgresql.TIMESTAMP(timezone=True),
+        existing_nullable=False,
+        postgresql_using=_LATEST_OCCURRENCE.format(column="created_at"),
+    )
+    op.alter_column(
+        "orders",
+        "received_at",
+        existing_type=postgresql.TIME(timezone=True),
+        type_=postgresql.TIMESTAMP(timezone=True),
+        existing_nullable=True,
+        postgresql_using=_LATEST_OCCURRENCE.format(column="received_at"),
+    )
+    # Receiving an order registered a sale at that moment, and sales do have dates: move every received order to
+    # the day of the sale (same store, user and payment method) whose time matches its received_at.
+    op.execute(
+        """
+        UPDATE orders o
+        SET created_at = o.created_at + m.shift, received_at = o.received_at + m.shift
+        FROM (
+            SELECT DISTINCT ON (o.id) o.id, make_interval(days => d.days) AS shift
+            FROM orders o
+            JOIN sales s
+                ON s.store_id = o.store_id
+                AND s.user_id = o.user_id
+                AND s.payment_method = o.payment_method
+            CROSS JOIN LATERAL (
+                SELECT extract(epoch FROM s."timestamp" - o.received_at) AS seconds
+            ) diff
+            CROSS JOIN LATERAL (SELECT round(diff.seconds / 86400)::int AS days) d
+            WHERE o.received_at IS NOT NULL
+                AND abs(diff.seconds - d.days * 86400) < 5
+            ORDER BY o.id, abs(diff.seconds - d.days * 86400)
+        ) m
+        WHERE o.id = m.id
+        """
+    )
+    op.execute(
+        """
+        UPDATE orders SET created_at = created_at - INTERVAL '1 day'
+        WHERE received_at IS NOT NULL AND created_at > received_at
+        """
+    )
+    op.create_index(
+        "ix_orders_store_id_status_created_at",
+        "orders",
+        ["store_id", "status", sa.text("created_at DESC")],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_orders_store_id_status_created_at", table_name="orders")
+    op.alter_column(
+        "orders",
+        "received_at",
+        existing_type=postgresql.TIMESTAMP(timezone=True),
+        type_=postgresql.TIME(timezone=True),
+        existing_nullable=True,
+        postgresql_using="received_at::timetz",
+    )
+    op.alter_column(
+        "orders",
+        "created_at",
+        existing_type=postgresql.TIMESTAMP(timezone=True),
+        type_=postgresql.TIME(timezone=True),
+        existing_nullable=False,
+        postgresql_using="created_at::timetz",
+    )
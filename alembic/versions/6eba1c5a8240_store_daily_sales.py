@@ -0,0 +1,62 @@
+"""store_daily_sales rollup
+
+Revision ID: 6eba1c5a8240
+Revises: 71c7d32bc3ba
+Create Date: 2026-10-17 11:03:48.205117
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "6eba1c5a8240"
+down_revision: Union[str, None] = "71c7d32bc3ba"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "store_daily_sales",
+        sa.Column("id", sa.BigInteger(), nullable=False),
+        sa.Column("store_id", sa.BigInteger(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("payment_method", sa.Integer(), nullable=False),
+        sa.Column("revenue", sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.Column("units", postgresql.DOUBLE_PRECISION(precision=53), nullable=False),
+        sa.Column("sale_count", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["store_id"],
+            ["stores.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint(
+            "store_id", "day", "payment_method", name="store_daily_sales_key"
+        ),
+    )
+    # backfill from the existing sales (same query as crud.store_daily_sales.rebuild)
+    op.execute(
+        """
+        INSERT INTO store_daily_sales (store_id, day, payment_method, revenue, units, sale_count)
+        SELECT s.store_id,
+               CAST(timezone(INTERVAL '-03:00', s."timestamp") AS DATE),
+               s.payment_method,
+               SUM(p.price * ps.quantity),
+               SUM(ps.quantity),
+               COUNT(DISTINCT s.id)
+        FROM sales s
+        JOIN products_sales ps ON ps.sale_id = s.id
+        JOIN products p ON p.id = ps.product_id
+        GROUP BY 1, 2, 3
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("store_daily_sales")
@@ -0,0 +1,51 @@
+"""make Sale.timestamp a timestamptz again and index it by store
+
+Revision ID: 71c7d32bc3ba
+Revises: c329a5a198c5
+Create Date: 2026-10-17 10:12:31.482913
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "71c7d32bc3ba"
+down_revision: Union[str, None] = "c329a5a198c5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # the existing ISO strings are backfilled by the USING cast
+    op.alter_column(
+        "sales",
+        "timestamp",
+        existing_type=sa.String(length=32),
+        type_=postgresql.TIMESTAMP(timezone=True),
+        existing_nullable=False,
+        postgresql_using='"timestamp"::timestamptz',
+    )
+    op.create_index(
+        "ix_sales_store_id_timestamp",
+        "sales",
+        ["store_id", "timestamp"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_sales_store_id_timestamp", table_name="sales")
+    op.alter_column(
+        "sales",
+        "timestamp",
+        existing_type=postgresql.TIMESTAMP(timezone=True),
+        type_=sa.String(length=32),
+        existing_nullable=False,
+        postgresql_using="""to_char("timestamp" AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS.US"+00:00"')""",
+    )
@@ -0,0 +1,30 @@
+"""discounts product_id index
+
+Revision ID: 801f7f8c14f5
+Revises: 2d7ac9e41561
+Create Date: 2026-10-17 22:48:19.264083
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "801f7f8c14f5"
+down_revision: Union[str, None] = "2d7ac9e41561"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        "ix_discounts_product_id", "discounts", ["product_id"], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_discounts_product_id", table_name="discounts")
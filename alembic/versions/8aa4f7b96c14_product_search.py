@@ -0,0 +1,62 @@
+"""product search
+
+Revision ID: 8aa4f7b96c14
+Revises: ec54aed37560
+Create Date: 2026-10-17 20:41:52.006318
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "8aa4f7b96c14"
+down_revision: Union[str, None] = "ec54aed37560"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_SEARCH_VECTOR = (
+    "setweight(to_tsvector('spanish', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(brand, '')), 'B') || "
+    "setweight(to_tsvector('spanish', coalesce(\"desc\", '')), 'C')"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.add_column(
+        "products",
+        sa.Column(
+            "search_vector",
+            postgresql.TSVECTOR(),
+            sa.Computed(_SEARCH_VECTOR, persisted=True),
+            nullable=True,
+        ),
+    )
+    op.create_index(
+        "ix_products_search_vector",
+        "products",
+        ["search_vector"],
+        unique=False,
+        postgresql_using="gin",
+    )
+    op.create_index(
+        "ix_products_name_brand_trgm",
+        "products",
+        ["name", "brand"],
+        unique=False,
+        postgresql_using="gin",
+        postgresql_ops={"name": "gin_trgm_ops", "brand": "gin_trgm_ops"},
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_products_name_brand_trgm", table_name="products")
+    op.drop_index("ix_products_search_vector", table_name="products")
+    op.drop_column("products", "search_vector")
+    # pg_trgm is left installed: other objects may have come to depend on it
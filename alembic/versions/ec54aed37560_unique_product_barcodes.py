@@ -0,0 +1,67 @@
+"""unique product barcodes
+
+Revision ID: ec54aed37560
+Revises: fc9a7ea57937
+Create Date: 2026-10-17 20:03:14.527390
+
+"""
+
+import logging
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+# revision identifiers, used by Alembic.
+revision: str = "ec54aed37560"
+down_revision: Union[str, None] = "fc9a7ea57937"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Barcodes weren't unique: the oldest product of each store keeps a repeated barcode, the others lose it
+    cleared = op.get_bind().execute(
+        sa.text(
+            """
+            UPDATE products p
+            SET barcode = NULL
+            FROM products repeated
+            WHERE repeated.id = p.id
+                AND p.barcode IS NOT NULL
+                AND EXISTS (
+                    SELECT 1 FROM products older
+                    WHERE older.store_id = p.store_id
+                        AND older.barcode = p.barcode
+                        AND older.id < p.id
+                )
+            RETURNING p.id, p.store_id, repeated.barcode
+            """
+        )
+    )
+    for product_id, store_id, barcode in cleared:
+        logger.warning(
+            "Cleared repeated barcode %s of product %s (store %s)",
+            barcode,
+            product_id,
+            store_id,
+        )
+    op.create_index(
+        "ix_products_store_id_barcode",
+        "products",
+        ["store_id", "barcode"],
+        unique=True,
+        postgresql_where=sa.text("barcode IS NOT NULL"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        "ix_products_store_id_barcode",
+        table_name="products",
+        postgresql_where=sa.text("barcode IS NOT NULL"),
+    )
@@ -0,0 +1,76 @@
+"""soft delete timestamps
+
+Revision ID: f357c9664c6d
+Revises: 8aa4f7b96c14
+Create Date: 2026-10-17 21:36:08.412957
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "f357c9664c6d"
+down_revision: Union[str, None] = "8aa4f7b96c14"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "products",
+        sa.Column("deleted_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.add_column(
+        "users", sa.Column("deleted_at", sa.DateTime(timezone=True), nullable=True)
+    )
+    # Until now, anonymized rows were only recognizable by the values they were anonymized with
+    op.execute("UPDATE products SET deleted_at = now() WHERE name = 'Deleted Product'")
+    op.execute(
+        "UPDATE users SET deleted_at = now() WHERE email = 'deleted@example.com'"
+    )
+    op.create_index(
+        "ix_products_store_id_live",
+        "products",
+        ["store_id", "id"],
+        unique=False,
+        postgresql_where=sa.text("deleted_at IS NULL"),
+    )
+    op.create_index(
+        "ix_users_store_id_live",
+        "users",
+        ["store_id"],
+        unique=False,
+        postgresql_where=sa.text("deleted_at IS NULL"),
+    )
+    op.create_index(
+        "ix_users_email_live",
+        "users",
+        ["email"],
+        unique=False,
+        postgresql_where=sa.text("deleted_at IS NULL"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        "ix_users_email_live",
+        table_name="users",
+        postgresql_where=sa.text("deleted_at IS NULL"),
+    )
+    op.drop_index(
+        "ix_users_store_id_live",
+        table_name="users",
+        postgresql_where=sa.text("deleted_at IS NULL"),
+    )
+    op.drop_index(
+        "ix_products_store_id_live",
+        table_name="products",
+        postgresql_where=sa.text("deleted_at IS NULL"),
+    )
+    op.drop_column("users", "deleted_at")
+    op.drop_column("products", "deleted_at")
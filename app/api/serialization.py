@@ -0,0 +1,111 @@
+"""
+Single-pass conversion of ORM objects into API responses.
+
+The `*_to_dict` functions read an object's columns once and return plain dicts shaped like its read schema
+(`OrderRead`, `SaleRead`, `DiscountRead`), without validating them again: the data comes from the database and was
+validated when it was written. List endpoints return `json_response(...)`, which serializes those dicts straight to
+JSON (in `pydantic-core`) and hands FastAPI a ready `Response`, so it doesn't validate every row again against the
+endpoint's `response_model` (which is still declared, for the docs). Single objects can still be returned as their
+schema, e.g. `OrderRead(**order_to_dict(order))`.
+"""
+
+from __future__ import annotations
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from ..models.discount import Discount
+    from ..models.order import Order
+    from ..models.sale import Sale
+
+from fastapi.responses import Response
+from pydantic_core import to_json
+
+
+def order_to_dict(order: Order) -> dict[str, Any]:
+    """
+    Args:
+        order (Order): The order. Its `orders_products` should already be loaded (e.g. with `selectinload`).
+    Returns:
+        dict[str, Any]: The order, shaped like an `OrderRead`.
+    """
+    received_at = order.received_at
+    return {
+        "id": order.id,
+        "user_id": order.user_id,
+        "store_id": order.store_id,
+        "created_at": order.created_at.isoformat(),
+        "status": order.status.value,
+        "received_at": received_at.isoformat() if received_at else None,
+        "payment_method": order.payment_method,
+        "products": order_products_to_dict(order),
+    }
+
+
+def order_products_to_dict(order: Order) -> list[dict[str, Any]]:
+    """
+    Args:
+        order (Order): The order. Its `orders_products` should already be loaded.
+    Returns:
+        list[dict[str, Any]]: The order's products, shaped like `ProductOrder`s.
+    """
+    return [
+        {"product_id": op.product_id, "quantity": op.quantity}
+        for op in order.orders_products
+    ]
+
+
+def sale_to_dict(sale: Sale) -> dict[str, Any]:
+    """
+    Args:
+        sale (Sale): The sale. Its `products_sales` should already be loaded (e.g. with `selectinload`).
+    Returns:
+        dict[str, Any]: The sale, shaped like a `SaleRead`.
+    """
+    return {
+        "id": sale.id,
+        "user_id": sale.user_id,
+        "store_id": sale.store_id,
+        "payment_method": sale.payment_method,
+        "timestamp": sale.timestamp.isoformat(),
+        "products": [
+            {"product_id": ps.product_id, "quantity": ps.quantity}
+            for ps in sale.products_sales
+        ],
+    }
+
+
+def discount_to_dict(discount: Discount) -> dict[str, Any]:
+    """
+    Args:
+        discount (Discount): The discount.
+    Returns:
+        dict[str, Any]: The discount, shaped like a `DiscountRead`.
+    """
+    return {
+        "id": discount.id,
+        "product_id": discount.product_id,
+        "pct_off": discount.pct_off,
+        "start_date": discount.start_date.isoformat(),
+        "end_date": discount.end_date.isoformat(),
+        "days_usable": discount.days_usable,
+        "min_amount": discount.min_amount,
+        "max_amount": discount.max_amount,
+    }
+
+
+def json_response(data: Any, message: str, status_code: int = 200) -> Response:
+    """
+    Builds a successful `APIResponse` and serializes it straight to JSON, skipping the `response_model` validation.
+
+    Args:
+        data (Any): The response's data, already in its response shape (e.g. a list of `order_to_dict`s).
+        message (str): The response's message.
+        status_code (int): The HTTP status code. Defaults to 200.
+    Returns:
+        Response: The `application/json` response.
+    """
+    return Response(
+        content=to_json({"successful": True, "data": data, "message": message}),
+        status_code=status_code,
+        media_type="application/json",
+    )
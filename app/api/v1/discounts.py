@@ -3,7 +3,6 @@ from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
     from ...models.user import User
-    from ...models.discount import Discount
 
 from fastapi import APIRouter, Depends, HTTPException
 
@@ -14,36 +13,20 @@ from ...schemas.general import APIResponse
 from ...schemas.discount import (
     GetAllDiscountsResponse,
     DiscountCreate,
-    DiscountRead,
     GetDiscountResponse,
 )
 from ...dependencies.db import get_db
 
-if TYPE_CHECKING:
-    from ...models.discount import Discount
-
 from datetime import date
 from .auth import get_current_user_require_admin, get_current_user_require_active
 from ..generic_tags import requires_admin, requires_active_user, requires_auth, public
 from ...utils import owns_specified_store_raise
+from ..serialization import discount_to_dict, json_response
 
 name = "discounts"
 router = APIRouter()
 
 
-def __discount_to_discountread(discount: Discount):
-    return DiscountRead(
-        id=discount.id,
-        product_id=discount.product_id,
-        pct_off=discount.pct_off,
-        start_date=str(discount.start_date),
-        end_date=str(discount.end_date),
-        days_usable=discount.days_usable,
-        min_amount=discount.min_amount,
-        max_amount=discount.max_amount,
-    )
-
-
 @router.get("/", response_model=GetAllDiscountsResponse, tags=public)
 def get_all_discounts(
     session: Session = Depends(get_db),
@@ -57,35 +40,27 @@ def get_all_discounts(
         GetAllDiscountsResponse: A response containing a list of all orders.
 
     """
-    result = [__discount_to_discountread(d) for d in crud.get_all(session)]
-    return GetAllDiscountsResponse(
-        successful=True, data=result, message="Successfully retrieved all discounts."
-    )
+    result = [discount_to_dict(d) for d in crud.get_all(session)]
+    return json_response(result, "Successfully retrieved all discounts.")
 
 
 @router.get("/store/{store_id}", response_model=GetAllDiscountsResponse, tags=public)
-def get_all_discounts_from_store(store_id: int, session=Depends(get_db)):
+def get_all_discounts_from_store(
+    store_id: int, active_only: bool = False, session=Depends(get_db)
+):
     """
     Retrieves all discount data from the database for products belonging to the specified store.
     Args:
         store_id (int): The ID of the store whose discounts to retrieve.
+        active_only (bool): If set to `True`, only the discounts usable today are returned. Default is `False`.
         session (Session): The SQLAlchemy session to use for the query.
     Returns:
         GetAllDiscountsResponse: A response containing a list of all discounts for the specified store
     """
-    import app.crud.product as products_crud
-
-    products = products_crud.get_all_by_store_id(store_id, session)
-    discounts = []
-    for product in products:
-        discount = crud.get_by_product_id(product.id, session, raise_404=False)
-        if discount:
-            discounts.append(__discount_to_discountread(discount))
-
-    return GetAllDiscountsResponse(
-        successful=True,
-        data=discounts,
-        message=f"Successfully retrieved all discounts for store {store_id}.",
+    discounts = crud.get_all_by_store_id(store_id, session, active_only=active_only)
+    return json_response(
+        [discount_to_dict(discount) for discount in discounts],
+        f"Successfully retrieved all discounts for store {store_id}.",
     )
 
 @router.get("/product/{product_id}/allownull", tags=public)
@@ -95,7 +70,7 @@ def get_discount_by_product_id_allow_null(
     discount = crud.get_by_product_id(product_id, session, False)
     return APIResponse(
         successful=True,
-        data=__discount_to_discountread(discount) if discount else None,
+        data=discount_to_dict(discount) if discount else None,
         message=f"Successfully retrieved the discount for product {product_id}",
     )
 
@@ -107,7 +82,7 @@ def get_discount_by_product_id(product_id: int, session=Depends(get_db)):
     discount = crud.get_by_product_id(product_id, session, True)
     return GetDiscountResponse(
         successful=True,
-        data=__discount_to_discountread(discount),
+        data=discount_to_dict(discount),
         message=f"Successfully retrieved the discount for product {product_id}",
     )
 
@@ -130,7 +105,7 @@ def get_discount_by_id(id: int, session=Depends(get_db)):
     discount = crud.get_by_id(id, session)
     return GetDiscountResponse(
         successful=True,
-        data=__discount_to_discountread(discount),
+        data=discount_to_dict(discount),
         message=f"Successfully retrieved the discount with id {discount.id}",
     )
 
@@ -4,7 +4,13 @@ from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     from ...models.user import User
 
-from fastapi import APIRouter, Depends
+import asyncio
+import json
+
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, Header, Query
+from fastapi.responses import StreamingResponse
 
 from sqlalchemy.orm import Session
 
@@ -13,12 +19,10 @@ from ...schemas.order import (
     GetAllOrdersResponse,
     GetOrderResponse,
     OrderCreate,
-    OrderRead,
     OrderUpdate,
-    ProductOrder,
     GetOrderProductsResponse,
 )
-from ...models.order import Order
+from ...models.order import StatusEnum
 from ...dependencies.db import get_db
 from ...crud import order as crud
 
@@ -26,24 +30,13 @@ from ..generic_tags import requires_admin, requires_active_user
 from .auth import get_current_user_require_admin, get_current_user_require_active
 from fastapi import HTTPException
 from ...utils import owns_a_store_raise
+from ...services import idempotency, order_events
+from ..serialization import json_response, order_products_to_dict, order_to_dict
 
 name = "orders"
 router = APIRouter()
 
-
-def __order_to_orderread(order: Order):
-    products_as_schemas: list[ProductOrder] = []
-    for op in order.orders_products:
-        products_as_schemas.append(ProductOrder(**op.__dict__))
-
-    order_as_dict = order.__dict__
-    order_as_dict["products"] = products_as_schemas
-    order_as_dict["status"] = str(order.status.value)
-    order_as_dict["created_at"] = order.created_at.isoformat()
-    order_as_dict["received_at"] = (
-        order.received_at.isoformat() if order.received_at else None
-    )
-    return OrderRead(**order_as_dict)
+KEEP_ALIVE_INTERVAL = 15  # seconds
 
 
 @router.get("/my", response_model=GetAllOrdersResponse, tags=requires_active_user)
@@ -61,10 +54,9 @@ def get_my_orders(
         GetAllOrdersResponse: A response containing a list of all orders for the current user.
     """
     result = crud.get_all_by_user_id(current_user.id, session)
-    return GetAllOrdersResponse(
-        successful=True,
-        data=[__order_to_orderread(o) for o in result],
-        message="Successfully retrieved all orders for the current user.",
+    return json_response(
+        [order_to_dict(o) for o in result],
+        "Successfully retrieved all orders for the current user.",
     )
 
 
@@ -82,10 +74,9 @@ def get_all_orders(
         GetAllOrdersResponse: A response containing a list of all orders.
     """
     result = crud.get_all(session)
-    return GetAllOrdersResponse(
-        successful=True,
-        data=[__order_to_orderread(o) for o in result],
-        message="Successfully retrieved all orders.",
+    return json_response(
+        [order_to_dict(o) for o in result],
+        "Successfully retrieved all orders.",
     )
 
 
@@ -113,34 +104,80 @@ def get_order_by_id(
     # order = crud.get_by_id(id, db)
     # if _.id not in [int(i) for i in [order.user_id, users_crud.get_by_id(order.store_id, db).id]]:
     #     raise HTTPException(status_code=403, detail="Not authorized to access this order.")
-    result = __order_to_orderread(crud.get_by_id(id, db))
+    result = order_to_dict(crud.get_by_id(id, db))
     return GetOrderResponse(
         successful=True,
         data=result,
-        message=f"Successfully retrieved the Order with id {result.id}.",
+        message=f"Successfully retrieved the Order with id {result['id']}.",
     )
 
 
 @router.get("/my/store", response_model=GetAllOrdersResponse, tags=requires_active_user)
 def get_my_store_orders(
+    status: list[StatusEnum] | None = Query(None),
+    since: datetime | None = None,
     session: Session = Depends(get_db),
     current_user: User = Depends(get_current_user_require_active),
 ):
     """
-    Retrieves all orders for the store owned/managed by the current authenticated user.
+    Retrieves the orders for the store owned/managed by the current authenticated user, newest first.
 
     Args:
+        status (list[StatusEnum] | None): If set (it can be repeated, e.g. `?status=pending&status=accepted`), only orders with one of these statuses are returned.
+        since (datetime | None): If set, only orders created at or after this moment (ISO 8601) are returned. If it has no timezone, UTC is assumed.
         session (Session): The SQLAlchemy session to use for the query.
         current_user (User): The current authenticated active user.
     Returns:
-        GetAllOrdersResponse: A response containing a list of all orders for the current user's store.
+        GetAllOrdersResponse: A response containing a list of the orders for the current user's store.
     """
     owns_a_store_raise(current_user, allow_cashiers=True)
-    result = crud.get_all_by_store_id(current_user.store_id, session)
-    return GetAllOrdersResponse(
-        successful=True,
-        data=[__order_to_orderread(o) for o in result],
-        message="Successfully retrieved all orders for the current user's store.",
+    result = crud.get_all_by_store_id(current_user.store_id, session, status, since)
+    return json_response(
+        [order_to_dict(o) for o in result],
+        "Successfully retrieved all orders for the current user's store.",
+    )
+
+
+@router.get("/my/store/events", tags=requires_active_user)
+async def stream_my_store_order_events(
+    current_user: User = Depends(get_current_user_require_active),
+):
+    """
+    Streams the order events of the store owned/managed by the current authenticated user as Server-Sent Events.
+
+    Each event's name is what happened to the order (`created`, `status_changed`, `products_updated` or `cancelled`)
+    and its data is a JSON object with the order's `order_id`, `store_id`, `type` and current `status`. A comment
+    line is sent every few seconds to keep the connection alive through proxies. Events that happen while the client
+    is disconnected are not replayed: reload `/orders/my/store` after (re)connecting.
+
+    Args:
+        current_user (User): The current authenticated active user.
+    Returns:
+        StreamingResponse: A `text/event-stream` response that stays open until the client disconnects.
+    """
+    owns_a_store_raise(current_user, allow_cashiers=True)
+    store_id = int(current_user.store_id)
+
+    async def events():
+        queue = order_events.broadcaster.subscribe(store_id)
+        try:
+            yield ": connected\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), timeout=KEEP_ALIVE_INTERVAL
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            order_events.broadcaster.unsubscribe(store_id, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
@@ -164,10 +201,9 @@ def get_orders_by_store_id(
         GetAllOrdersResponse: A response containing all orders for the specified store.
     """
     result = crud.get_all_by_store_id(store_id, db)
-    return GetAllOrdersResponse(
-        successful=True,
-        data=[__order_to_orderread(o) for o in result],
-        message=f"Successfully retrieved all Orders for store with id {store_id}.",
+    return json_response(
+        [order_to_dict(o) for o in result],
+        f"Successfully retrieved all Orders for store with id {store_id}.",
     )
 
 
@@ -189,10 +225,9 @@ def get_orders_by_user_id(
         GetAllOrdersResponse: A response containing all orders for the specified user.
     """
     result = crud.get_all_by_user_id(user_id, db)
-    return GetAllOrdersResponse(
-        successful=True,
-        data=[__order_to_orderread(o) for o in result],
-        message=f"Successfully retrieved all Orders for user with id {user_id}.",
+    return json_response(
+        [order_to_dict(o) for o in result],
+        f"Successfully retrieved all Orders for user with id {user_id}.",
     )
 
 
@@ -226,7 +261,7 @@ def get_order_products(
         # And must be owner or cashier of that store
         owns_a_store_raise(user, allow_cashiers=True)
     order = crud.get_by_id(id, db)
-    products = [ProductOrder(**op.__dict__) for op in order.orders_products]
+    products = order_products_to_dict(order)
     return GetOrderProductsResponse(
         successful=True,
         data=products,
@@ -239,6 +274,7 @@ def get_order_products(
 )
 def create_order(
     order: OrderCreate,
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key", max_length=255),
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user_require_active),
 ):
@@ -247,17 +283,25 @@ def create_order(
 
     Args:
         sale (OrderCreate): The order data.
+        idempotency_key (str | None): Sent as the `Idempotency-Key` header. If set, retrying the request with the same key (and body) returns the first response instead of creating another order.
         db (Session): The SQLAlchemy session to use for the query.
         user (User): The current authenticated active user.
     Returns:
         APIResponse: A response containing the ID of the created order.
+    Raises:
+        HTTPException(409): If a request with the same `Idempotency-Key` is still being processed.
+        HTTPException(422): If the `Idempotency-Key` was already used for a different request.
     """
-    order_id = crud.create(order, db, user)
-    return APIResponse(
-        successful=True,
-        data={"id": order_id},
-        message=f"Successfully created the Order, which received id {order_id}.",
-    )
+
+    def create(commit: bool):
+        order_id = crud.create(order, db, user, commit=commit)
+        return APIResponse(
+            successful=True,
+            data={"id": order_id},
+            message=f"Successfully created the Order, which received id {order_id}.",
+        )
+
+    return idempotency.run(idempotency_key, user.id, "POST /orders/", order, db, create)
 
 
 @router.patch("/{id}/status", response_model=APIResponse, tags=requires_active_user)
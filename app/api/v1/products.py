@@ -4,8 +4,17 @@ from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     from ...models.user import User
 
-from fastapi import APIRouter, Depends, HTTPException
+import csv
+import json
+import tempfile
+from typing import Literal
 
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
+from pydantic import ValidationError
+
+from sqlalchemy.exc import DataError, IntegrityError
 from sqlalchemy.orm import Session
 
 from app.dependencies.db import get_db
@@ -15,10 +24,21 @@ from app.schemas.product import (
     GetAllProductsResponse,
     GetProductResponse,
     ProductUpdate,
+    ProductRead,
+    TopProduct,
+    GetTopProductsResponse,
+    GetPricedProductsResponse,
+    ProductImportError,
+    ProductImportResult,
+    ImportProductsResponse,
+    StockTake,
+    StockTakeResult,
+    StockTakeResponse,
 )
 from app.schemas.general import APIResponse
 
 from app.crud import product as crud
+from app.crud import product_sales_stats as product_sales_stats_crud
 
 import app.api.generic_tags as tags
 
@@ -26,11 +46,19 @@ from ...models.user import StoreRoleEnum
 
 from .auth import get_current_user_require_active
 
-from ...utils import owns_a_store_raise
+from ...utils import owns_a_store, owns_a_store_raise
+from ...services import catalogue, pricing
 
 name = "products"
 router = APIRouter()
 
+IMPORT_CHUNK_SIZE = 1000  # products per INSERT ... ON CONFLICT (and per transaction)
+IMPORT_SPOOL_SIZE = (
+    1024 * 1024
+)  # bytes of an upload kept in memory before spilling it to disk
+MAX_REPORTED_ERRORS = 1000
+CSV_NULLABLE_COLUMNS = ("points_price", "barcode", "hidden")
+
 
 @router.get("/", response_model=GetAllProductsResponse, tags=tags.public)
 def get_all_products(
@@ -40,7 +68,7 @@ def get_all_products(
     Retrieves all products from the database.
     Args:
         session (Session): The SQLAlchemy session to use for the query.
-        include_anonymized (bool): If set to `False`, soft-deleted products marked as `"Deleted Product"` will not be included in the result list. Default is `False`.
+        include_anonymized (bool): If set to `False`, soft-deleted (anonymized) products will not be included in the result list. Default is `False`.
 
     Returns:
         GetAllProductsResponse: A response containing a list of all products.
@@ -51,17 +79,57 @@ def get_all_products(
     )
 
 
+@router.get("/search", response_model=GetAllProductsResponse, tags=tags.public)
+def search_products(
+    q: str = Query(min_length=1, max_length=200, pattern=r"\S"),
+    store_id: int | None = None,
+    type: int | None = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    session: Session = Depends(get_db),
+):
+    """
+    Searches the products (of every store, or of one) by name, brand and description. Hidden and deleted products are
+    never returned.
+
+    Args:
+        q (str): What to search for. Supports `"quoted phrases"`, `or` and `-excluded` words, and tolerates typos in names and brands.
+        store_id (int | None): If set, only this store's products are searched.
+        type (int | None): If set, only products of this type are searched.
+        limit (int): The maximum amount of products to return (1 to 100). Defaults to 20.
+        offset (int): How many of the best matches to skip, to get the next pages. Defaults to 0.
+        session (Session): The SQLAlchemy session to use for the query.
+
+    Returns:
+        GetAllProductsResponse: A response containing the matching products, best match first.
+    """
+    result = crud.search(q, session, store_id, type, limit, offset)
+    return GetAllProductsResponse(
+        successful=True,
+        data=result,
+        message=f"Successfully retrieved the Products matching '{q}'.",
+    )
+
+
 @router.get("/store/{id}", response_model=GetAllProductsResponse, tags=tags.public)
 def get_products_by_store_id(
-    id: int, session: Session = Depends(get_db), include_anonymized: bool = False
+    id: int,
+    session: Session = Depends(get_db),
+    include_anonymized: bool = False,
+    if_none_match: str | None = Header(None),
 ):
     """
     Retrieves a product by its store ID.
 
+    Unless `include_anonymized` is set, the response comes from a per-store cache (see `services.catalogue`) and
+    carries a strong `ETag`: clients that send it back in `If-None-Match` get a `304 Not Modified` (with no body)
+    while the catalogue hasn't changed.
+
     Args:
         id (int): The ID of the store to retrieve its products.
-        allow_anonymized (bool): If set to `False`, a 404 error will be raised if the product with the specified ID is marked as `"Deleted Product"`, just as if the product did not exist in the database. Default is `False`.
+        allow_anonymized (bool): If set to `False`, a 404 error will be raised if the product with the specified ID has been soft-deleted (anonymized), just as if the product did not exist in the database. Default is `False`.
         session (Session): The SQLAlchemy session to use for the query.
+        if_none_match (str | None): The `If-None-Match` header: the `ETag` of the catalogue the client already has.
 
     Returns:
         GetAllProductsResponse: A response containing a list of products with the specified store ID.
@@ -70,14 +138,125 @@ def get_products_by_store_id(
         HTTPException(400): If the provided ID is invalid (less than or equal to 0).
         HTTPException(404): If the store with the specified ID does not exist.
     """
+    if include_anonymized:
+        result = crud.get_all_by_store_id(id, session, include_anonymized=True)
+        return GetAllProductsResponse(
+            successful=True,
+            data=result,
+            message=f"Successfully retrieved all Products with store id {id}.",
+        )
+
+    entry = catalogue.get_or_load(id, session)  # only queries the database on a miss
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if catalogue.etag_matches(if_none_match, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+@router.get(
+    "/store/{id}/priced", response_model=GetPricedProductsResponse, tags=tags.public
+)
+def get_priced_products_by_store_id(
+    id: int,
+    session: Session = Depends(get_db),
+    if_none_match: str | None = Header(None),
+):
+    """
+    Retrieves a store's products with their effective price today: the discount that applies to each one (if any) is
+    evaluated on the server, so a shelf doesn't need to request each product's discount.
+
+    The response comes from a per-store, per-day cache (see `services.pricing`) and carries a strong `ETag`, like
+    `GET /products/store/{id}`.
+
+    Args:
+        id (int): The ID of the store.
+        session (Session): The SQLAlchemy session to use for the query.
+        if_none_match (str | None): The `If-None-Match` header: the `ETag` of the prices the client already has.
+
+    Returns:
+        GetPricedProductsResponse: A response containing each product with its effective price and its discount usable today.
+    """
+    entry = pricing.get_or_load(id, session)  # only queries the database on a miss
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if catalogue.etag_matches(if_none_match, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+@router.get(
+    "/store/{id}/top",
+    response_model=GetTopProductsResponse,
+    tags=tags.requires_active_user,
+)
+def get_top_products_by_store_id(
+    id: int,
+    window: Literal["7d", "30d", "all"] = "all",
+    limit: int = Query(10, ge=1, le=100),
+    session: Session = Depends(get_db),
+    user: User = Depends(get_current_user_require_active),
+):
+    """
+    Retrieves the best-selling products of a store, ranked by units sold.
+
+    It is answered from precomputed per-product counters, so it doesn't scan the store's sales history.
 
-    result = crud.get_all_by_store_id(
-        id, session, include_anonymized=include_anonymized
+    Args:
+        id (int): The ID of the store.
+        window (Literal["7d", "30d", "all"]): Whether to rank the sales of the last 7 days, the last 30 days (both including today) or all of them. Defaults to `"all"`.
+        limit (int): The maximum amount of products to return (1 to 100). Defaults to 10.
+        session (Session): The SQLAlchemy session to use for the query.
+        user (User): The current authenticated active user. They must be the owner or a cashier of the store.
+
+    Returns:
+        GetTopProductsResponse: A response containing the products with their units sold, revenue and last sale, best-selling first.
+
+    Raises:
+        HTTPException(403): If the user is not the owner or a cashier of the store.
+    """
+    if not owns_a_store(user, allow_cashiers=True) or user.store_id != id:
+        raise HTTPException(403, "You cannot see this store's sales.")
+
+    rows = product_sales_stats_crud.get_top(id, session, window, limit)
+    return GetTopProductsResponse(
+        successful=True,
+        data=[
+            TopProduct(
+                product=ProductRead.model_validate(product),
+                units=units,
+                revenue=float(revenue),
+                last_sold_at=last_sold_at.isoformat(),
+            )
+            for product, units, revenue, last_sold_at in rows
+        ],
+        message=f"Successfully retrieved the top products of store {id}.",
     )
-    return GetAllProductsResponse(
+
+
+@router.get(
+    "/store/{id}/barcode/{code:path}",
+    response_model=GetProductResponse,
+    tags=tags.public,
+)
+def get_product_by_barcode(id: int, code: str, session: Session = Depends(get_db)):
+    """
+    Retrieves a store's product by its barcode (e.g. when a POS scans it).
+
+    Args:
+        id (int): The ID of the store.
+        code (str): The scanned barcode. It may contain `/`.
+        session (Session): The SQLAlchemy session to use for the query.
+
+    Returns:
+        GetProductResponse: A response containing the store's product with that barcode.
+
+    Raises:
+        HTTPException(404): If the store has no product with that barcode.
+    """
+    result = crud.get_by_barcode(id, code, session)
+    return GetProductResponse(
         successful=True,
         data=result,
-        message=f"Successfully retrieved all Products with store id {id}.",
+        message=f"Successfully retrieved the Product with barcode {code}.",
     )
 
 
@@ -90,7 +269,7 @@ def get_product_by_id(
 
     Args:
         id (int): The ID of the product to retrieve.
-        allow_anonymized (bool): If set to `False`, a 404 error will be raised if the product with the specified ID is marked as `"Deleted Product"`, just as if the product did not exist in the database. Default is `False`.
+        allow_anonymized (bool): If set to `False`, a 404 error will be raised if the product with the specified ID has been soft-deleted (anonymized), just as if the product did not exist in the database. Default is `False`.
         session (Session): The SQLAlchemy session to use for the query.
 
     Returns:
@@ -138,6 +317,204 @@ def create_product(
     )
 
 
+def __read_import_records(upload, format: Literal["csv", "ndjson"]):
+    """
+    Yields `(row, record)` for every product of an upload, reading it line by line. `record` is the product's
+    fields as a dict, or a message saying why the row couldn't be read. If the upload stops being readable (it isn't
+    UTF-8, or isn't valid CSV), the row where it stopped is yielded with the error and nothing after it.
+    """
+    # decoded line by line, so that an invalid line doesn't take the ones before it with it
+    text = (
+        line.decode("utf-8-sig" if number == 0 else "utf-8")
+        for number, line in enumerate(upload)
+    )
+    row = 0
+    try:
+        if format == "csv":
+            for record in csv.DictReader(text):
+                row += 1
+                for column in CSV_NULLABLE_COLUMNS:
+                    if record.get(column) == "":
+                        record[column] = None
+                yield row, record
+            return
+
+        for line in text:
+            if line.strip() == "":
+                continue
+            row += 1
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield row, record if isinstance(record, dict) else "Invalid JSON object."
+    except (UnicodeDecodeError, csv.Error) as ex:
+        yield row + 1, f"Could not be read (nor the rows after it): {ex}"
+
+
+def __import_products(
+    upload, format: Literal["csv", "ndjson"], store_id: int, session: Session
+) -> ProductImportResult:
+    """
+    Validates an upload's products in chunks of `IMPORT_CHUNK_SIZE` and upserts each chunk with
+    `crud.upsert_many`, so only one chunk is in memory at a time.
+    """
+    result = ProductImportResult(created=0, updated=0, failed=0, errors=[])
+    barcode_rows: dict[str, int] = {}
+    chunk: list[tuple[int, ProductCreate]] = []
+
+    def fail(row: int, message: str):
+        result.failed += 1
+        if len(result.errors) < MAX_REPORTED_ERRORS:
+            result.errors.append(ProductImportError(row=row, message=message))
+
+    def flush():
+        try:
+            created, updated, skipped = crud.upsert_many(
+                [product for _, product in chunk], store_id, session
+            )
+        except (IntegrityError, DataError) as ex:
+            for row, _ in chunk:
+                fail(row, f"Could not be saved: {ex.orig}")
+        else:
+            result.created += created
+            result.updated += updated
+            for index in skipped:
+                fail(
+                    chunk[index][0],
+                    "The quantity is less than the units reserved by the product's pending orders.",
+                )
+        chunk.clear()
+
+    for row, record in __read_import_records(upload, format):
+        if isinstance(record, str):
+            fail(row, record)
+            continue
+        try:
+            product = ProductCreate.model_validate(record)
+        except ValidationError as ex:
+            error = ex.errors()[0]
+            field = ".".join(str(part) for part in error["loc"])
+            fail(row, f"Invalid product: {field}: {error['msg']}")
+            continue
+        if product.name == "Deleted Product":
+            fail(row, "Invalid product name.")
+            continue
+        if product.barcode is not None:
+            if product.barcode in barcode_rows:
+                fail(
+                    row, f"Barcode already used by row {barcode_rows[product.barcode]}."
+                )
+                continue
+            barcode_rows[product.barcode] = row
+
+        chunk.append((row, product))
+        if len(chunk) == IMPORT_CHUNK_SIZE:
+            flush()
+    if chunk:
+        flush()
+    return result
+
+
+@router.post(
+    "/import", response_model=ImportProductsResponse, tags=tags.requires_active_user
+)
+async def import_products(
+    request: Request,
+    session: Session = Depends(get_db),
+    store_owner: User = Depends(get_current_user_require_active),
+):
+    """
+    Creates (or updates) many products of the authenticated user's store at once, e.g. to load a store's catalogue.
+
+    The body is either a CSV file with a header row (`Content-Type: text/csv`) or one `ProductCreate` object per
+    line (`Content-Type: application/x-ndjson`), with the fields of `ProductCreate`. In CSVs, empty `points_price`,
+    `barcode` and `hidden` cells mean `null`. The upload is streamed to a temporary file and its rows are validated and
+    written in chunks, so its size doesn't affect memory usage. Products whose barcode the store already uses are
+    updated instead of created, unless the new quantity is less than the units reserved by their pending orders.
+    Every row is validated on its own: invalid rows are reported and skipped, and don't prevent the valid ones from
+    being imported. If the upload stops being readable (invalid UTF-8 or CSV), the rows before that point are imported
+    and the row where it stopped is reported.
+
+    Args:
+        request (Request): The raw request, whose body contains the products.
+        session (Session): The SQLAlchemy session to use for the query.
+        store_owner (User): The current authenticated active user, who must own a store.
+    Returns:
+        ImportProductsResponse: A response containing how many products were created and updated, and why each of the rows that weren't imported failed.
+    Raises:
+        HTTPException(403): If the user doesn't own a store.
+        HTTPException(400): If the body is not CSV or NDJSON.
+    """
+    owns_a_store_raise(store_owner)
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type:
+        format = "ndjson"
+    elif "csv" in content_type:
+        format = "csv"
+    else:
+        raise HTTPException(
+            400,
+            "Body must be CSV (text/csv) or NDJSON (application/x-ndjson).",
+        )
+
+    with tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_SIZE) as upload:
+        async for data in request.stream():
+            upload.write(data)
+        upload.seek(0)
+        result = await run_in_threadpool(
+            __import_products, upload, format, int(store_owner.store_id), session
+        )
+
+    imported = result.created + result.updated
+    return ImportProductsResponse(
+        successful=True,
+        data=result,
+        message=f"Successfully imported {imported} of {imported + result.failed} Products.",
+    )
+
+
+@router.post(
+    "/stock-take", response_model=StockTakeResponse, tags=tags.requires_active_user
+)
+def stock_take(
+    stock_take: StockTake,
+    session: Session = Depends(get_db),
+    store_owner: User = Depends(get_current_user_require_active),
+):
+    """
+    Sets the quantity of the authenticated user's store's products to the ones counted in a stock take, and returns
+    how much each one changed.
+
+    Each counted product is identified by either its ID or its barcode. The whole stock take is applied in a single
+    transaction: if any product isn't found, is counted twice, or is counted below the units reserved by pending
+    orders, no quantity is changed.
+
+    Args:
+        stock_take (StockTake): The counted quantity of each product.
+        session (Session): The SQLAlchemy session to use for the update.
+        store_owner (User): The current authenticated active user, who must own a store.
+    Returns:
+        StockTakeResponse: A response containing the variance (counted minus previous quantity) of each product.
+    Raises:
+        HTTPException(403): If the user doesn't own a store.
+        HTTPException(404): If some counted product isn't one of the store's products.
+        HTTPException(400): If a product is counted more than once, or below its reserved units.
+    """
+    owns_a_store_raise(store_owner)
+    variances = crud.apply_stock_take(
+        stock_take.counts, int(store_owner.store_id), session
+    )
+    adjusted = sum(1 for variance in variances if variance.variance != 0)
+    return StockTakeResponse(
+        successful=True,
+        data=StockTakeResult(
+            counted=len(variances), adjusted=adjusted, variances=variances
+        ),
+        message=f"Successfully counted {len(variances)} Products, {adjusted} of which were adjusted.",
+    )
+
+
 @router.put("/{id}", response_model=APIResponse, tags=tags.requires_active_user)
 def update_product(
     id: int,
@@ -4,65 +4,82 @@ from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     from ...models.user import User
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+from typing import Literal
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
 from app.dependencies.db import get_db
+from app.database.session import SessionLocal
 
 from app.schemas.general import APIResponse
 from app.schemas.sale import (
     SaleCreate,
+    BatchSaleCreate,
     GetAllSalesResponse,
     GetSaleResponse,
-    SaleRead,
-    ProductSale as ProductSaleSchema,
+    BatchSaleResult,
+    CreateSalesBatchResponse,
+    PaymentMethodSummary,
+    DailySalesSummary,
+    SalesSummary,
+    GetSalesSummaryResponse,
+    SalesAnalytics,
+    GetSalesAnalyticsResponse,
 )
 from ...crud import sale as crud
-from ...models.sale import Sale
-from ...models.products_sales import ProductsSales as ProductsSalesModel
+from ...crud import store_daily_sales as store_daily_sales_crud
+from ...services import analytics, idempotency
+from ..serialization import json_response, sale_to_dict
 
 import app.api.generic_tags as tags
 from .auth import get_current_user_require_admin, get_current_user_require_active
 from ...models.user import StoreRoleEnum
+from ...utils import owns_a_store_raise
 
 name = "sales"
 router = APIRouter()
 
-
-def __sale_to_saleread(sale: Sale, products: list[ProductsSalesModel]):
-    products_as_schemas: list[ProductSaleSchema] = []
-    for ps in products:
-        products_as_schemas.append(
-            ProductSaleSchema(product_id=ps.product_id, quantity=ps.quantity)
-        )
-
-    return SaleRead(
-        id=sale.id,
-        user_id=sale.user_id,
-        store_id=sale.store_id,
-        payment_method=sale.payment_method,
-        timestamp=sale.timestamp,
-        products=products_as_schemas,
-    )
+MAX_BATCH_SIZE = 10_000
+EXPORT_COLUMNS = [
+    "sale_id",
+    "timestamp",
+    "user_id",
+    "payment_method",
+    "product_id",
+    "quantity",
+]
+EXPORT_BUFFER_SIZE = 64 * 1024  # bytes per chunk sent to the client
 
 
 @router.get("/", response_model=GetAllSalesResponse, tags=tags.requires_admin)
 def get_all_sales(
-    db: Session = Depends(get_db), _: User = Depends(get_current_user_require_admin)
+    limit: int | None = Query(None, ge=1),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    _: User = Depends(get_current_user_require_admin),
 ):
     """
     Retrieves all sales from the database.
 
     Args:
+        limit (int | None): The maximum amount of sales to return. If not sent, all of them are returned.
+        offset (int): How many sales to skip (ordered by ID). Defaults to 0.
         db (Session): The SQLAlchemy session to use for the query.
         _ (User): The current active admin user. Unused, is only there to enforce admin requirement.
     Returns:
         GetAllSalesResponse: A response containing a list of all sales.
     """
-    sales = crud.get_all(db)
-    result = [__sale_to_saleread(s, crud.get_ps_by_sale(s, db)) for s in sales]
-    return GetAllSalesResponse(
-        successful=True, data=result, message="Successfully retrieved all Sales."
-    )
+    sales = crud.get_all(db, limit, offset)
+    result = [sale_to_dict(s) for s in sales]
+    return json_response(result, "Successfully retrieved all Sales.")
 
 
 @router.get("/{id}", response_model=GetSaleResponse, tags=tags.requires_admin)
@@ -81,11 +98,11 @@ def get_sale_by_id(id: int, db: Session = Depends(get_db)):
         HTTPException(404): If the sale with the specified ID does not exist.
     """
     sale = crud.get_by_id(id, db)
-    result = __sale_to_saleread(sale, crud.get_ps_by_sale(sale, db))
+    result = sale_to_dict(sale)
     return GetSaleResponse(
         successful=True,
         data=result,
-        message=f"Successfully retrieved the Sale with id {result.id}.",
+        message=f"Successfully retrieved the Sale with id {result['id']}.",
     )
 
 
@@ -93,24 +110,240 @@ def get_sale_by_id(id: int, db: Session = Depends(get_db)):
     "/store/my", response_model=GetAllSalesResponse, tags=tags.requires_active_user
 )
 def get_my_store_sales(
+    limit: int | None = Query(None, ge=1),
+    offset: int = Query(0, ge=0),
+    from_: datetime | None = Query(None, alias="from"),
+    to: datetime | None = Query(None),
     db: Session = Depends(get_db),
     store_owner: User = Depends(get_current_user_require_active),
 ):
     """
-    Retrieves all sales for the store owned by the current user.
+    Retrieves all sales for the store owned by the current user, optionally only the ones made in a time window.
 
     Args:
+        limit (int | None): The maximum amount of sales to return. If not sent, all of them are returned.
+        offset (int): How many sales to skip (ordered by ID). Defaults to 0.
+        from_ (datetime | None): Sent as `from`. If set, only sales made at or after this moment (ISO 8601) are returned. If it has no timezone, UTC is assumed.
+        to (datetime | None): If set, only sales made before this moment (ISO 8601) are returned. If it has no timezone, UTC is assumed.
         db (Session): The SQLAlchemy session to use for the query.
         store_owner (User): The current authenticated user.
     Returns:
         GetAllSalesResponse: A response containing a list of all sales for the admin's store.
+    Raises:
+        HTTPException(400): If `from` is not before `to`.
+    """
+    sales = crud.get_all_by_store_owner(store_owner, db, limit, offset, from_, to)
+    result = [sale_to_dict(s) for s in sales]
+    return json_response(result, "Successfully retrieved all Sales for your store.")
+
+
+def __export_chunks(
+    rows, session: Session, format: Literal["ndjson", "csv"], gzip: bool
+):
+    """
+    Turns the rows of `crud.stream_lines_by_store_id` into chunks of NDJSON or CSV bytes, optionally gzipped.
+
+    It owns `session` and closes it once the rows run out (or the client goes away).
+    """
+    compressor = zlib.compressobj(wbits=31) if gzip else None  # 31 = gzip container
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) if compressor else data
+
+    try:
+        if format == "csv":
+            writer.writerow(EXPORT_COLUMNS)
+        for row in rows:
+            values = list(row)
+            values[1] = values[1].isoformat()
+            if format == "csv":
+                writer.writerow(values)
+            else:
+                buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, values))))
+                buffer.write("\n")
+            if buffer.tell() >= EXPORT_BUFFER_SIZE:
+                chunk = flush()
+                if chunk:
+                    yield chunk
+        chunk = flush()
+        if compressor:
+            chunk += compressor.flush()
+        if chunk:
+            yield chunk
+    finally:
+        session.close()
+
+
+@router.get("/store/my/export", tags=tags.requires_active_user)
+def export_my_store_sales(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    from_: datetime | None = Query(None, alias="from"),
+    to: datetime | None = Query(None),
+    gzip: bool = False,
+    store_owner: User = Depends(get_current_user_require_active),
+):
+    """
+    Downloads the sales history of the current user's store, one line per product sold.
+
+    The file is streamed from a server-side cursor while it's being generated, so it can be as big as the history is
+    without the server holding it in memory. Each line has the columns `sale_id`, `timestamp`, `user_id`,
+    `payment_method`, `product_id` and `quantity`.
+
+    Args:
+        format (Literal["ndjson", "csv"]): The file format. Defaults to `"ndjson"`.
+        from_ (datetime | None): Sent as `from`. If set, only sales made at or after this moment (ISO 8601) are included. If it has no timezone, UTC is assumed.
+        to (datetime | None): If set, only sales made before this moment (ISO 8601) are included. If it has no timezone, UTC is assumed.
+        gzip (bool): Whether to gzip the file. Defaults to `False`.
+        store_owner (User): The current authenticated active user. They must own a store.
+    Returns:
+        StreamingResponse: The file, as an attachment.
+    Raises:
+        HTTPException(403): If the user does not own a store.
+        HTTPException(400): If `from` is not before `to`.
+    """
+    owns_a_store_raise(store_owner)
+
+    # la sesión no puede venir de get_db: esa se cierra antes de que se termine de mandar la respuesta
+    session = SessionLocal()
+    try:
+        rows = crud.stream_lines_by_store_id(store_owner.store_id, session, from_, to)
+    except Exception:
+        session.close()
+        raise
+
+    filename = f"sales-{store_owner.store_id}.{format}" + (".gz" if gzip else "")
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/csv"
+    return StreamingResponse(
+        __export_chunks(rows, session, format, gzip),
+        media_type="application/gzip" if gzip else media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get(
+    "/store/my/summary",
+    response_model=GetSalesSummaryResponse,
+    tags=tags.requires_active_user,
+)
+def get_my_store_sales_summary(
+    from_: date | None = Query(None, alias="from"),
+    to: date | None = Query(None),
+    db: Session = Depends(get_db),
+    store_owner: User = Depends(get_current_user_require_active),
+):
+    """
+    Retrieves the revenue, units sold and amount of sales of the current user's store, per day and payment method.
+
+    It is answered from the `store_daily_sales` rollup, so its cost depends on the amount of days and not on the amount of sales.
+
+    Args:
+        from_ (date | None): Sent as `from`. If set, only days on or after this date (ISO 8601, Argentina's timezone) are included.
+        to (date | None): If set, only days on or before this date are included.
+        db (Session): The SQLAlchemy session to use for the query.
+        store_owner (User): The current authenticated active user. They must own a store.
+    Returns:
+        GetSalesSummaryResponse: A response containing the totals for the whole range and for every day with sales.
+    Raises:
+        HTTPException(403): If the user does not own a store.
+        HTTPException(400): If `from` is after `to`.
     """
-    sales = crud.get_all_by_store_owner(store_owner, db)
-    result = [__sale_to_saleread(s, crud.get_ps_by_sale(s, db)) for s in sales]
-    return GetAllSalesResponse(
+    owns_a_store_raise(store_owner)
+    rows = store_daily_sales_crud.get_by_store_id(store_owner.store_id, db, from_, to)
+
+    days: list[DailySalesSummary] = []
+    for row in rows:
+        if len(days) == 0 or days[-1].day != row.day.isoformat():
+            days.append(
+                DailySalesSummary(
+                    day=row.day.isoformat(),
+                    revenue=0,
+                    units=0,
+                    sale_count=0,
+                    by_payment_method=[],
+                )
+            )
+        day = days[-1]
+        day.revenue += float(row.revenue)
+        day.units += row.units
+        day.sale_count += row.sale_count
+        day.by_payment_method.append(
+            PaymentMethodSummary(
+                payment_method=row.payment_method,
+                revenue=float(row.revenue),
+                units=row.units,
+                sale_count=row.sale_count,
+            )
+        )
+
+    return GetSalesSummaryResponse(
         successful=True,
-        data=result,
-        message="Successfully retrieved all Sales for your store.",
+        data=SalesSummary(
+            revenue=sum(d.revenue for d in days),
+            units=sum(d.units for d in days),
+            sale_count=sum(d.sale_count for d in days),
+            days=days,
+        ),
+        message="Successfully retrieved the sales summary for your store.",
+    )
+
+
+@router.get(
+    "/store/my/analytics",
+    response_model=GetSalesAnalyticsResponse,
+    tags=tags.requires_active_user,
+)
+def get_my_store_sales_analytics(
+    db: Session = Depends(get_db),
+    store_owner: User = Depends(get_current_user_require_active),
+):
+    """
+    Retrieves the revenue and units sold of the current user's store, grouped by hour of the day, weekday, product type and payment method.
+
+    The store's whole history is taken into account. It is computed in memory from a per-store cache that is refreshed whenever the store makes a sale.
+
+    Args:
+        db (Session): The SQLAlchemy session to use for the query.
+        store_owner (User): The current authenticated active user. They must own a store.
+    Returns:
+        GetSalesAnalyticsResponse: A response containing the revenue and units of every group.
+    Raises:
+        HTTPException(403): If the user does not own a store.
+    """
+    owns_a_store_raise(store_owner)
+    columns = analytics.get_columns(int(store_owner.store_id), db)
+    return GetSalesAnalyticsResponse(
+        successful=True,
+        data=SalesAnalytics(**analytics.summarize(columns)),
+        message="Successfully retrieved the sales analytics for your store.",
+    )
+
+
+@router.post("/summary/rebuild", response_model=APIResponse, tags=tags.requires_admin)
+def rebuild_sales_summary(
+    store_id: int | None = None,
+    db: Session = Depends(get_db),
+    _: User = Depends(get_current_user_require_admin),
+):
+    """
+    Regenerates the `store_daily_sales` rollup from the raw sales data.
+
+    Args:
+        store_id (int | None): If set, only that store's rollup is rebuilt. Otherwise every store's is.
+        db (Session): The SQLAlchemy session to use for the query.
+        _ (User): The current active admin user. Unused, is only there to enforce admin requirement.
+    Returns:
+        APIResponse: A response containing the amount of rollup rows written.
+    """
+    rows = store_daily_sales_crud.rebuild(db, store_id)
+    return APIResponse(
+        successful=True,
+        data={"rows": rows},
+        message="Successfully rebuilt the sales summary.",
     )
 
 
@@ -119,6 +352,7 @@ def get_my_store_sales(
 )
 def create_sale(
     sale: SaleCreate,
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key", max_length=255),
     db: Session = Depends(get_db),
     cashier: User = Depends(get_current_user_require_active),
 ):
@@ -127,6 +361,7 @@ def create_sale(
 
     Args:
         sale (SaleCreate): The sale data.
+        idempotency_key (str | None): Sent as the `Idempotency-Key` header. If set, retrying the request with the same key (and body) returns the first response instead of creating another sale.
         db (Session): The SQLAlchemy session to use for the query.
         cashier (User): The current authenticated user creating the sale. They must be a store cashier or owner in the store where the sale is being created.
     Raises:
@@ -135,6 +370,8 @@ def create_sale(
         HTTPException(400): If a product does not belong to the store.
         HTTPException(400): If there is insufficient stock for a product.
         HTTPException(400): If the sale has no products.
+        HTTPException(409): If a request with the same `Idempotency-Key` is still being processed.
+        HTTPException(422): If the `Idempotency-Key` was already used for a different request.
     Returns:
         APIResponse: A response containing the ID of the created sale.
     """
@@ -148,9 +385,115 @@ def create_sale(
 
     if len(sale.products) == 0:
         raise HTTPException(status_code=400, detail="Sale must have at least 1 product")
-    sale_id = crud.create(sale, db, using_points=False)
-    return APIResponse(
+
+    def create(commit: bool):
+        sale_id = crud.create(sale, db, using_points=False, commit=commit)
+        return APIResponse(
+            successful=True,
+            data={"id": sale_id},
+            message=f"Successfully created the Sale, which received id {sale_id}.",
+        )
+
+    return idempotency.run(
+        idempotency_key, cashier.id, "POST /sales/", sale, db, create
+    )
+
+
+@router.post(
+    "/batch",
+    response_model=CreateSalesBatchResponse,
+    status_code=201,
+    tags=tags.requires_active_user,
+)
+async def create_sales_batch(
+    request: Request,
+    db: Session = Depends(get_db),
+    cashier: User = Depends(get_current_user_require_active),
+):
+    """
+    Creates many sales at once. Meant for POS clients syncing the sales they rang up while offline.
+
+    The body can be either a JSON array of `BatchSaleCreate` objects (`Content-Type: application/json`) or one
+    `BatchSaleCreate` object per line (`Content-Type: application/x-ndjson`, read as it's streamed). Every record is
+    validated on its own: invalid records are reported in the response and don't prevent the valid ones from being
+    created. Each record may carry the `timestamp` it was rung up at, so offline sales are counted on the right day.
+
+    Args:
+        request (Request): The raw request, whose body contains the sales.
+        db (Session): The SQLAlchemy session to use for the query.
+        cashier (User): The current authenticated user creating the sales. They must be a store cashier or owner, and every sale must belong to their store.
+    Raises:
+        HTTPException(403): If the user is not a cashier or owner of a store.
+        HTTPException(400): If the body is not a JSON array or NDJSON, or has more than `MAX_BATCH_SIZE` records.
+    Returns:
+        CreateSalesBatchResponse: A response containing one result per record, in the order they were sent.
+    """
+    if cashier.store_id is None or cashier.store_role not in [
+        StoreRoleEnum.OWNER,
+        StoreRoleEnum.CASHIER,
+    ]:
+        raise HTTPException(
+            status_code=403,
+            detail="You do not have permission to create sales for this store",
+        )
+
+    records: list = []
+    if "ndjson" in request.headers.get("content-type", ""):
+
+        def add(line: bytes):
+            if line.strip() == b"":
+                return
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                records.append(None)  # se reporta como inválido abajo
+            if len(records) > MAX_BATCH_SIZE:
+                raise HTTPException(
+                    400, f"A batch cannot have more than {MAX_BATCH_SIZE} sales."
+                )
+
+        # parsed line by line as it arrives, instead of buffering the whole body
+        pending = b""
+        async for chunk in request.stream():
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                add(line)
+        add(pending)
+    else:
+        try:
+            records = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(400, "Body must be a JSON array or NDJSON.")
+        if not isinstance(records, list):
+            raise HTTPException(400, "Body must be a JSON array or NDJSON.")
+        if len(records) > MAX_BATCH_SIZE:
+            raise HTTPException(
+                400, f"A batch cannot have more than {MAX_BATCH_SIZE} sales."
+            )
+
+    results: list[BatchSaleResult | None] = [None] * len(records)
+    valid: list[tuple[int, BatchSaleCreate]] = []
+    for index, record in enumerate(records):
+        try:
+            valid.append((index, BatchSaleCreate.model_validate(record)))
+        except ValidationError as ex:
+            results[index] = BatchSaleResult(
+                index=index,
+                successful=False,
+                id=None,
+                message=f"Invalid sale: {ex.errors()[0]['msg']}",
+            )
+
+    created = await run_in_threadpool(
+        crud.create_batch, [s for _, s in valid], int(cashier.store_id), db
+    )
+    for (index, _), result in zip(valid, created):
+        results[index] = result.model_copy(update={"index": index})
+
+    created_count = sum(1 for r in results if r.successful)
+    return CreateSalesBatchResponse(
         successful=True,
-        data={"id": sale_id},
-        message=f"Successfully created the Sale, which received id {sale_id}.",
+        data=results,
+        message=f"Successfully created {created_count} of {len(results)} Sales.",
     )
@@ -1,7 +1,16 @@
-from fastapi import APIRouter
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ...models.user import User
+
+from fastapi import APIRouter, Depends
 from app.schemas.general import APIResponse
+from app.schemas.status import GetJobStatsResponse, JobStatsRead
 
-from ..generic_tags import public
+from ..generic_tags import public, requires_admin
+from .auth import get_current_user_require_admin
+from ...services import scheduler
 
 name = "status"
 router = APIRouter()
@@ -22,3 +31,34 @@ def get_status():
         data={"status": "ok"},
         message="Successfully performed a status check.",
     )
+
+
+@router.get("/jobs", response_model=GetJobStatsResponse, tags=requires_admin)
+def get_job_stats(_: User = Depends(get_current_user_require_admin)):
+    """
+    Retrieves the metrics of the periodic jobs (rows touched, duration, failures) run by the worker handling the request.
+
+    Args:
+        _ (User): The current active admin user. Unused, is only there to enforce admin requirement.
+    Returns:
+        GetJobStatsResponse: A response containing the metrics of every job.
+    """
+    return GetJobStatsResponse(
+        successful=True,
+        data=[
+            JobStatsRead(
+                name=name,
+                runs=stats.runs,
+                failures=stats.failures,
+                rows_total=stats.rows_total,
+                last_rows=stats.last_rows,
+                last_duration=stats.last_duration,
+                last_run_at=(
+                    stats.last_run_at.isoformat() if stats.last_run_at else None
+                ),
+                last_error=stats.last_error,
+            )
+            for name, stats in scheduler.get_stats().items()
+        ],
+        message="Successfully retrieved the jobs' metrics.",
+    )
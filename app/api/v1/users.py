@@ -47,7 +47,7 @@ def get_all_users(
     Retrieves all users from the database.
 
     Args:
-        include_anonymized (bool): Whether to include users anonymized as "Deleted User".
+        include_anonymized (bool): Whether to include anonymized (deleted) users.
         session (Session): The SQLAlchemy session to use for the query.
         _ (User): The current active admin user. Unused, is only there to enforce admin requirement.
     Returns:
@@ -94,7 +94,7 @@ def get_user_by_id(
 
     Args:
         id (int): The ID of the user to retrieve.
-        allow_anonymized (bool): Whether to include users anonymized as "Deleted User".
+        allow_anonymized (bool): Whether to include anonymized (deleted) users.
         session (Session): The SQLAlchemy session to use for the query.
         _ (User): The current active admin user. Unused, is only there to enforce admin requirement.
 
@@ -125,7 +125,7 @@ def get_users_by_store_id(
 
     Args:
         id (int): The ID of the store.
-        allow_anonymized (bool): Whether to include users anonymized as "Deleted User".
+        allow_anonymized (bool): Whether to include anonymized (deleted) users.
         session (Session): The SQLAlchemy session to use for the query.
         _ (User): The current active admin user. Unused, is only there to enforce admin requirement.
 
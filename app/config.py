@@ -23,7 +23,15 @@ class Settings(BaseSettings):
     cloudinary_api_key: str = getenv("CLOUDINARY_API_KEY")
     cloudinary_api_secret: str = getenv("CLOUDINARY_API_SECRET")
 
+    # "pessimistic" (SELECT ... FOR UPDATE for the whole checkout) or "optimistic" (conditional UPDATE at the end)
+    stock_locking: str = getenv("STOCK_LOCKING", "pessimistic")
+    # how long a pending order holds its products' stock
+    reservation_ttl_minutes: int = int(getenv("RESERVATION_TTL_MINUTES", "30"))
+    # how long the responses of requests sent with an Idempotency-Key are kept
+    idempotency_ttl_hours: int = int(getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+
 
 settings = Settings()
 
 assert settings.jwt_expiry > 1
+assert settings.stock_locking in ("pessimistic", "optimistic")
@@ -2,6 +2,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy.orm.exc import ObjectDeletedError
 
 from ..models.discount import Discount
+from ..models.product import Product
 from ..schemas.discount import DiscountCreate
 
 from datetime import date
@@ -10,6 +11,9 @@ from fastapi import HTTPException
 
 from typing import overload, Literal
 
+from ..services import catalogue
+from ..utils import store_today
+
 
 def get_all(session: Session):
     """
@@ -41,6 +45,33 @@ def get_by_id(id: int, session: Session):
     return discount
 
 
+def get_all_by_store_id(id: int, session: Session, active_only: bool = False):
+    """
+    Retrieves the discounts of a store's (non-deleted) products with a single query that joins them to the products.
+    Args:
+        id (int): The ID of the store.
+        session (Session): The SQLAlchemy session to use for the query.
+        active_only (bool): If set to `True`, only the discounts usable today (between their start and end dates, and
+            on one of their usable days) are returned. Default is `False`.
+    Returns:
+        list[Discount]: The store's discounts, by product ID.
+    """
+    query = (
+        session.query(Discount)
+        .join(Product, Product.id == Discount.product_id)
+        .filter(Product.store_id == id, Product.deleted_at.is_(None))
+    )
+    if active_only:
+        today = store_today()
+        query = query.filter(
+            Discount.start_date <= today,
+            Discount.end_date >= today,
+            # days_usable[0] is Monday; Postgres arrays start at 1
+            Discount.days_usable[today.weekday() + 1].is_(True),
+        )
+    return query.order_by(Discount.product_id, Discount.id).all()
+
+
 @overload
 def get_by_product_id(
     product_id: int, session: Session, raise_404: Literal[True]
@@ -78,6 +109,10 @@ def create(discount_data: DiscountCreate, session: Session):
         session.commit()
     discount = Discount(**discount_data.model_dump())
     session.add(discount)
+    # the store's effective prices (see services.pricing) are derived from its catalogue
+    product = session.get(Product, discount_data.product_id)
+    if product is not None:
+        catalogue.invalidate(session, int(product.store_id))
     session.commit()
 
     session.refresh(discount)
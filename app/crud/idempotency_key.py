@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.idempotency_key import IdempotencyKey
+
+# a claim still unanswered after this long belongs to a request that died mid-way (e.g. the worker was killed)
+PROCESSING_TIMEOUT = timedelta(minutes=5)
+
+
+def claim(
+    user_id: int, key: str, endpoint: str, request_hash: str, session: Session
+) -> tuple[int | None, IdempotencyKey | None]:
+    """
+    Claims an idempotency key for a request, committing immediately so concurrent duplicates see the claim.
+
+    The claim is a single `INSERT ... ON CONFLICT DO NOTHING`: of two concurrent requests with the same key, exactly
+    one inserts the row, and the other one waits for it to commit and then finds it.
+    Args:
+        user_id (int): The ID of the user sending the request.
+        key (str): The `Idempotency-Key` header.
+        endpoint (str): The endpoint the request was sent to, e.g. `"POST /orders/"`.
+        request_hash (str): A hash of the request's body.
+        session (Session): The SQLAlchemy session to use for the insert.
+    Returns:
+        tuple[int | None, IdempotencyKey | None]: `(id, None)` if the key was claimed (the request must be processed
+            and then `complete`d or `release`d), or `(None, record)` with the stored response of a previous request.
+    Raises:
+        HTTPException(422): If the key was already used for a different endpoint or request body.
+        HTTPException(409): If a request with the same key is still being processed.
+    """
+    now = datetime.now(timezone.utc)
+    values = {
+        "user_id": user_id,
+        "key": key,
+        "endpoint": endpoint,
+        "request_hash": request_hash,
+        "created_at": now,
+        "expires_at": now + timedelta(hours=settings.idempotency_ttl_hours),
+    }
+    try:
+        claimed_id = session.scalar(
+            pg_insert(IdempotencyKey)
+            .values(**values)
+            .on_conflict_do_nothing(constraint="idempotency_keys_key")
+            .returning(IdempotencyKey.id)
+        )
+        if claimed_id is None:
+            # an expired key that hasn't been purged yet, or an abandoned claim, can be reused as if it were new
+            claimed_id = session.scalar(
+                update(IdempotencyKey)
+                .where(
+                    IdempotencyKey.user_id == user_id,
+                    IdempotencyKey.key == key,
+                    or_(
+                        IdempotencyKey.expires_at <= func.now(),
+                        and_(
+                            IdempotencyKey.status_code.is_(None),
+                            IdempotencyKey.created_at
+                            <= func.now() - PROCESSING_TIMEOUT,
+                        ),
+                    ),
+                )
+                .values(**values, status_code=None, response=None)
+                .returning(IdempotencyKey.id)
+            )
+        if claimed_id is not None:
+            session.commit()
+            return claimed_id, None
+
+        record = session.scalars(
+            select(IdempotencyKey).where(
+                IdempotencyKey.user_id == user_id, IdempotencyKey.key == key
+            )
+        ).one()
+        session.expunge(record)  # keep its values after the commit
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+    if record.endpoint != endpoint or record.request_hash != request_hash:
+        raise HTTPException(
+            422, "This Idempotency-Key was already used for a different request."
+        )
+    if record.status_code is None:
+        raise HTTPException(
+            409, "A request with this Idempotency-Key is still being processed."
+        )
+    return None, record
+
+
+def complete(id: int, status_code: int, response: dict, session: Session):
+    """
+    Stores the response of a claimed key's request and commits, along with whatever the request wrote.
+    Args:
+        id (int): The ID returned by `claim`.
+        status_code (int): The response's status code.
+        response (dict): The response's body (JSON-serializable).
+        session (Session): The SQLAlchemy session to use for the update.
+    """
+    session.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.id == id)
+        .values(status_code=status_code, response=response)
+    )
+    session.commit()
+
+
+def release(id: int, session: Session):
+    """
+    Deletes a claimed key whose request failed unexpectedly, so it can be retried, and commits.
+    Args:
+        id (int): The ID returned by `claim`.
+        session (Session): The SQLAlchemy session to use for the delete.
+    """
+    session.rollback()
+    session.execute(delete(IdempotencyKey).where(IdempotencyKey.id == id))
+    session.commit()
+
+
+def purge_expired(session: Session) -> int:
+    """
+    Deletes every expired key and commits.
+    Args:
+        session (Session): The SQLAlchemy session to use for the delete.
+    Returns:
+        int: How many keys were deleted.
+    """
+    deleted = session.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.expires_at <= func.now())
+    ).rowcount
+    session.commit()
+    return deleted
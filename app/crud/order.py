@@ -3,20 +3,25 @@ from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
     from ..models.user import User
-from sqlalchemy import select
-from sqlalchemy.orm import Session
-from sqlalchemy.exc import NoResultFound
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.exc import NoResultFound, OperationalError
 
 from ..models.order import Order, StatusEnum
 from ..models.orders_products import OrdersProducts
 from ..models.product import Product
+from ..models.store import Store
 
 from fastapi import HTTPException
 
 from ..schemas.order import *
 from datetime import datetime, timezone
 from . import store as stores_crud, product as products_crud, sale as sales_crud
+from . import stock_reservation as reservations_crud
 from ..schemas.sale import SaleCreate, ProductSale
+from ..services import catalogue, order_events
+from ..config import settings
+from ..utils import as_utc
 
 
 def get_all(session: Session):
@@ -27,43 +32,66 @@ def get_all(session: Session):
     Returns:
         list[Order]: A list of all orders.
     """
-    query = session.query(Order)
+    query = session.query(Order).options(selectinload(Order.orders_products))
     orders = query.all()
     return orders
 
 
-def get_by_id(id: int, session: Session):
+def get_by_id(id: int, session: Session, lock: bool = False):
     """
     Retrieves an order by their ID.
 
     Args:
         id (int): The ID of the order to retrieve.
         session (Session): The SQLAlchemy session to use for the query.
+        lock (bool): Whether to re-read and lock (`SELECT ... FOR UPDATE`) the order's row until the transaction ends.
+            Anything that changes an order must lock it before touching its products, so that it can't deadlock with
+            (or be overwritten by) `cancel_stale`. Defaults to False.
     Returns:
         Order: The order with the specified ID.
     Raises:
         HTTPException(404): If the order with the specified ID does not exist.
     """
-    order = session.get(Order, id)
+    order = (
+        session.get(Order, id, with_for_update=True, populate_existing=True)
+        if lock
+        else session.get(Order, id)
+    )
     if order is None:
         raise HTTPException(404, detail="Order not found")
 
     return order
 
 
-def get_all_by_store_id(id: int, session: Session):
+def get_all_by_store_id(
+    id: int,
+    session: Session,
+    statuses: list[StatusEnum] | None = None,
+    since: datetime | None = None,
+):
     """
-    Retrieves all orders from the database by their store ID.
+    Retrieves all orders from the database by their store ID, newest first, with their products already loaded.
+
+    The filters are served by the `(store_id, status, created_at DESC)` index.
     Args:
         id (int): The ID of the store.
         session (Session): The SQLAlchemy session to use for the query.
+        statuses (list[StatusEnum] | None): If set, only orders with one of these statuses are returned.
+        since (datetime | None): If set, only orders created at or after this moment are returned. If it has no
+            timezone, UTC is assumed.
     Returns:
         list[Order]: A list for the orders with the store ID.
-    Raises:
-        HTTPException(404): If the store with the specified ID does not exist.
     """
-    orders = session.query(Order).filter(Order.store_id == id).all()
-    return orders
+    query = session.query(Order).filter(Order.store_id == id)
+    if statuses:
+        query = query.filter(Order.status.in_(statuses))
+    if since is not None:
+        query = query.filter(Order.created_at >= as_utc(since))
+    return (
+        query.options(selectinload(Order.orders_products))
+        .order_by(Order.created_at.desc(), Order.id.desc())
+        .all()
+    )
 
 
 def get_all_by_user_id(id: int, session: Session):
@@ -77,7 +105,12 @@ def get_all_by_user_id(id: int, session: Session):
     Raises:
         HTTPException(404): If the user with the specified ID does not exist.
     """
-    orders = session.query(Order).filter(Order.user_id == id).all()
+    orders = (
+        session.query(Order)
+        .options(selectinload(Order.orders_products))
+        .filter(Order.user_id == id)
+        .all()
+    )
     return orders
 
 
@@ -96,85 +129,212 @@ def get_order_products(id: int, session: Session):
     return order.orders_products
 
 
-def create(order_data: OrderCreate, session: Session, user: User) -> int:
+STOCK_RETRIES = 3
+_RETRYABLE_SQLSTATES = {"40001", "40P01"}  # serialization_failure, deadlock_detected
+
+
+def _lock_products(product_ids: set[int], session: Session) -> dict[int, Product]:
     """
-    Creates a new order in the database.
+    Loads and row-locks (`SELECT ... FOR UPDATE`) the given products in a single query, in ascending id order so
+    that concurrent transactions can't deadlock. The rows are re-read even if they are already in the session.
+    """
+    stmt = (
+        select(Product)
+        .where(Product.id.in_(product_ids))
+        .order_by(Product.id)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    )
+    return {int(p.id): p for p in session.execute(stmt).scalars()}
+
+
+def _validate_order_products(
+    store_id: int, lines: list, product_map: dict[int, Product]
+) -> dict[int, float]:
+    """
+    Validates an order's products against already loaded products.
     Args:
-        order_data (OrderCreate): The order data to create.
-        session (Session): The SQLAlchemy session to use for the insert.
+        store_id (int): The ID of the order's store.
+        lines (list): The order's lines (anything with `product_id` and `quantity`, e.g. `ProductOrder` or
+            `OrdersProducts`).
+        product_map (dict[int, Product]): The products involved in the order, keyed by ID.
     Returns:
-        int: The ID of the newly created order.
+        dict[int, float]: The total requested quantity for each product (a product may appear in more than one line).
+    Raises:
+        HTTPException(404): If a product does not exist.
+        HTTPException(400): If a product does not belong to the order's store.
+        HTTPException(400): If there is insufficient available stock for a product.
     """
-    if not order_data.products:
-        raise HTTPException(400, "Order must have at least 1 product")
+    missing = {int(line.product_id) for line in lines} - product_map.keys()
+    if missing:
+        raise HTTPException(
+            404, f"Products not found: {', '.join(map(str, sorted(missing)))}"
+        )
 
-    # Ensure store exists (will 404 internally)
-    stores_crud.get_by_id(order_data.store_id, session)
+    requested: dict[int, float] = {}
+    for line in lines:
+        product = product_map[int(line.product_id)]
+        if product.store_id != store_id:
+            raise HTTPException(
+                400, f"Product {product.id} does not belong to this store"
+            )
+        requested[int(line.product_id)] = (
+            requested.get(int(line.product_id), 0) + line.quantity
+        )
 
-    product_ids = [p.product_id for p in order_data.products]
+    for product_id, quantity in requested.items():
+        product = product_map[product_id]
+        if product.quantity - product.reserved_quantity < quantity:
+            raise HTTPException(400, f"Not enough {product.name} in stock")
 
-    try:
-        # Lock all involved products in a single query
-        stmt = select(Product).where(Product.id.in_(product_ids)).with_for_update()
-        db_products = session.execute(stmt).scalars().all()
+    return requested
 
-        # Build dictionary for fast access
-        product_map = {p.id: p for p in db_products}
 
-        # Validate: all products exist
-        missing = set(product_ids) - set(product_map.keys())
-        if missing:
-            raise HTTPException(
-                404, f"Products not found: {', '.join(map(str, missing))}"
+def _reserve_locked(store_id: int, lines: list, session: Session) -> dict[int, float]:
+    """
+    Locks the products of an order's lines, validates them and adds the requested quantities to their
+    `reserved_quantity`. The reservation rows themselves must be added by the caller.
+    Returns:
+        dict[int, float]: The total requested quantity for each product.
+    """
+    product_map = _lock_products({int(line.product_id) for line in lines}, session)
+    requested = _validate_order_products(store_id, lines, product_map)
+    for product_id, quantity in requested.items():
+        product_map[product_id].reserved_quantity += quantity
+    return requested
+
+
+def _add_order(order_data: OrderCreate, session: Session, user: User) -> Order:
+    """
+    Adds (and flushes) the order and its `OrdersProducts` rows.
+    """
+    order = Order(
+        store_id=order_data.store_id,
+        user_id=user.id,
+        payment_method=order_data.payment_method,
+        created_at=datetime.now(timezone.utc),
+        status=StatusEnum.PENDING,
+    )
+    session.add(order)
+    session.flush()  # order.id now available
+
+    for item in order_data.products:
+        session.add(
+            OrdersProducts(
+                order_id=order.id,
+                product_id=item.product_id,
+                quantity=item.quantity,
             )
+        )
+    return order
 
-        # Validate each product BEFORE creating the order
-        for item in order_data.products:
-            product = product_map[item.product_id]
 
-            if product.store_id != order_data.store_id:
-                raise HTTPException(
-                    400, f"Product {product.id} does not belong to this store"
-                )
+def _create_pessimistic(
+    order_data: OrderCreate, session: Session, user: User, expires_at: datetime
+) -> Order:
+    requested = _reserve_locked(order_data.store_id, order_data.products, session)
+    order = _add_order(order_data, session, user)
+    reservations_crud.add(order.id, requested, session, expires_at)
+    return order
 
-            if product.quantity < item.quantity:
-                raise HTTPException(400, f"Not enough {product.name} in stock")
 
-        # Create order first
-        order = Order(
-            store_id=order_data.store_id,
-            user_id=user.id,
-            payment_method=order_data.payment_method,
-            created_at=datetime.now(timezone.utc),
-            status=StatusEnum.PENDING,
-        )
-        session.add(order)
-        session.flush()  # order.id now available
-
-        # Create order-product rows
-        for item in order_data.products:
-            session.add(
-                OrdersProducts(
-                    order_id=order.id,
-                    product_id=item.product_id,
-                    quantity=item.quantity,
-                )
-            )
+def _create_optimistic(
+    order_data: OrderCreate, session: Session, user: User, expires_at: datetime
+) -> Order:
+    # Plain read: the stock check here only fails fast, the conditional UPDATE below is the one that counts
+    stmt = select(Product).where(
+        Product.id.in_({p.product_id for p in order_data.products})
+    )
+    product_map = {int(p.id): p for p in session.execute(stmt).scalars()}
+    requested = _validate_order_products(
+        order_data.store_id, order_data.products, product_map
+    )
+
+    order = _add_order(order_data, session, user)
+    reservations_crud.add(order.id, requested, session, expires_at)
+    session.flush()
+    short = products_crud.reserve_stock(requested, session)
+    if short:
+        raise HTTPException(400, f"Not enough {product_map[min(short)].name} in stock")
+    return order
 
-            # Deduct stock
-            product_map[item.product_id].quantity -= item.quantity
 
-        session.commit()
-        return int(order.id)
+def create(
+    order_data: OrderCreate, session: Session, user: User, commit: bool = True
+) -> int:
+    """
+    Creates a new order in the database, reserving its products' stock.
 
-    except Exception:
-        session.rollback()
-        raise
+    The stock isn't taken out of `Product.quantity` until the order is received: it's added to the products'
+    `reserved_quantity` and recorded in `stock_reservations`, with an expiry (the store's `pending_order_timeout`, or
+    `settings.reservation_ttl_minutes` if it has none) after which `cancel_stale` releases it if the store hasn't
+    accepted the order.
+
+    How the stock is protected depends on `settings.stock_locking`:
+    - `"pessimistic"` (default): the products are locked with `SELECT ... FOR UPDATE` before anything else, so
+      concurrent checkouts of the same product wait for each other during the whole transaction.
+    - `"optimistic"`: the products are read without locking and the stock is reserved with a single conditional
+      `UPDATE` (`quantity - reserved_quantity >= requested`) right before committing, so rows are only locked for
+      the tail of the transaction.
+
+    Transactions aborted by a deadlock or a serialization failure are retried up to `STOCK_RETRIES` times.
+    Args:
+        order_data (OrderCreate): The order data to create.
+        session (Session): The SQLAlchemy session to use for the insert.
+        user (User): The user placing the order.
+        commit (bool): Whether to commit the transaction. Callers that need to write more things in the same transaction (e.g. `idempotency.run`) should set it to `False` and commit themselves. Defaults to `True`.
+    Returns:
+        int: The ID of the newly created order.
+    Raises:
+        HTTPException(400): If the order has no products.
+        HTTPException(404): If the store or a product does not exist.
+        HTTPException(400): If a product does not belong to the store.
+        HTTPException(400): If there is insufficient available stock for a product.
+    """
+    if not order_data.products:
+        raise HTTPException(400, "Order must have at least 1 product")
+
+    # Ensure store exists (will 404 internally)
+    store = stores_crud.get_by_id(order_data.store_id, session)
+
+    create_order = (
+        _create_optimistic
+        if settings.stock_locking == "optimistic"
+        else _create_pessimistic
+    )
+    for attempt in range(1, STOCK_RETRIES + 1):
+        try:
+            order = create_order(
+                order_data,
+                session,
+                user,
+                reservations_crud.pending_expiry(store.pending_order_timeout),
+            )
+            order_events.publish(session, order, "created")
+            catalogue.invalidate(session, order.store_id)
+            if commit:
+                session.commit()
+            else:
+                session.flush()
+            return int(order.id)
+        except OperationalError as e:
+            session.rollback()
+            if (
+                getattr(e.orig, "sqlstate", None) not in _RETRYABLE_SQLSTATES
+                or attempt == STOCK_RETRIES
+            ):
+                raise
+        except Exception:
+            session.rollback()
+            raise
 
 
 def update_status(id: int, session: Session):
     """
     Updates a the status of an order by its ID.
+
+    Accepting an order makes its stock reservation permanent (re-reserving the stock if the reservation had already
+    expired). Receiving it releases the reservation and registers the sale, which takes the products out of the stock.
     Args:
         id (int): The ID of the order to update.
         session (Session): The SQLAlchemy session to use for the update.
@@ -183,10 +343,11 @@ def update_status(id: int, session: Session):
     Raises:
         HTTPException(404): If the order with the specified ID does not exist.
         HTTPException(400): If the order is already marked "received".
+        HTTPException(400): If the order's reservation expired and there's no longer enough stock to accept it.
         HTTPException(500): If an order in the database somehow has a status that isn't "pending", "accepted" or "received"
     """
     statuses = [StatusEnum.PENDING, StatusEnum.ACCEPTED, StatusEnum.RECEIVED]
-    order = get_by_id(id, session)
+    order = get_by_id(id, session, lock=True)
     current_status = order.status
 
     try:
@@ -197,105 +358,237 @@ def update_status(id: int, session: Session):
 
         new_status_index = statuses.index(current_status) + 1
         new_status = statuses[new_status_index]
+    except ValueError:
+        if (
+            current_status == StatusEnum.CANCELLED
+        ):  # para el que mire el coverage: Que esto esté amarillo ESTÁ BIEN, si no hay algo muy pero muy mal
+            raise HTTPException(400, "Cancelled orders cannot be updated.")
+        else:
+            raise HTTPException(  # para el que mire el coverage: Que esto esté rojo ESTÁ BIEN, si no hay algo muy pero muy mal
+                500, f"An order in the database has invalid status {current_status}."
+            )
+
+    try:
+        if new_status == StatusEnum.ACCEPTED:
+            if reservations_crud.hold(order.id, session) == 0:
+                requested = _reserve_locked(
+                    order.store_id, order.orders_products, session
+                )
+                reservations_crud.add(order.id, requested, session, expires_at=None)
+                catalogue.invalidate(session, order.store_id)
 
         if new_status == StatusEnum.RECEIVED:  # puede quedar amarillo
+            reservations_crud.release(order.id, session)
             sales_crud.create(
                 SaleCreate(
                     store_id=order.store_id,
                     products=[
-                        ProductSale(**ps.__dict__) for ps in order.orders_products
+                        ProductSale(product_id=ps.product_id, quantity=ps.quantity)
+                        for ps in order.orders_products
                     ],
                     payment_method=order.payment_method,
                     user_id=order.user_id,
                 ),
                 session,
+                commit=False,
             )
             order.received_at = datetime.now(timezone.utc)
 
         order.status = new_status
+        order_events.publish(session, order, "status_changed")
         session.commit()
         return new_status.value
-    except ValueError:
-        if (
-            current_status == StatusEnum.CANCELLED
-        ):  # para el que mire el coverage: Que esto esté amarillo ESTÁ BIEN, si no hay algo muy pero muy mal
-            raise HTTPException(400, "Cancelled orders cannot be updated.")
-        else:
-            raise HTTPException(  # para el que mire el coverage: Que esto esté rojo ESTÁ BIEN, si no hay algo muy pero muy mal
-                500, f"An order in the database has invalid status {current_status}."
-            )
+    except Exception:
+        session.rollback()
+        raise
 
 
 def update_products(id: int, updates: OrderUpdate, session: Session):
     """
-    Updates the products associated with an order.
+    Replaces the products associated with an order.
+
+    Every product involved (the ones currently reserved for the order and the new ones) is locked with a single
+    `SELECT ... FOR UPDATE`, always in ascending id order so that concurrent updates can't deadlock. Only the
+    difference between the reserved and the new quantities is reserved (or given back), the order's reservation is
+    renewed, and the order's `OrdersProducts` rows are updated, deleted or inserted as needed, all in a single
+    transaction.
     Args:
         id (int): The ID of the order to update.
-        updates (OrderUpdate): An object containing the list of products to update.
+        updates (OrderUpdate): An object containing the new list of products.
         session (Session): The SQLAlchemy session used for database operations.
 
     Raises:
         HTTPException(404): If the order with the specified ID does not exist.
         HTTPException(400): If the order has no products.
         HTTPException(400): If the order is not pending.
+        HTTPException(404): If a product does not exist.
         HTTPException(400): If a product does not belong to the store.
-        HTTPException(400): If there is insufficient stock for a product.
+        HTTPException(400): If there is insufficient available stock for a product.
     """
-    order = get_by_id(id, session)
-    if order.status != StatusEnum.PENDING:
-        raise HTTPException(400, "Only pending orders can be updated.")
     if len(updates.products) == 0:
         raise HTTPException(
             status_code=400, detail="Order must have at least 1 product"
         )
+    order = get_by_id(id, session, lock=True)
     try:
-        for old_op in order.orders_products:  # este for puede quedar amarillo
-            session.delete(old_op)
-
+        if order.status != StatusEnum.PENDING:
+            raise HTTPException(400, "Only pending orders can be updated.")
+        old_rows: dict[int, list[OrdersProducts]] = {}
+        for op in order.orders_products:
+            old_rows.setdefault(int(op.product_id), []).append(op)
+        # what is actually reserved, which may be nothing if the reservation expired
+        reserved = reservations_crud.get_by_order_id(order.id, session)
+
+        new_quantities: dict[int, float] = {}
         for product_data in updates.products:
-            stmt = (
-                select(Product)
-                .where(Product.id == product_data.product_id)
-                .with_for_update()
+            new_quantities[product_data.product_id] = (
+                new_quantities.get(product_data.product_id, 0) + product_data.quantity
             )
-            product = session.execute(stmt).scalars().first()
-            if product is None:
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"Product {product_data.product_id} not found",
-                )
 
-            if product.store_id != order.store_id:
+        product_map = _lock_products(reserved.keys() | new_quantities.keys(), session)
+
+        missing = new_quantities.keys() - product_map.keys()
+        if missing:
+            raise HTTPException(
+                404, f"Products not found: {', '.join(map(str, sorted(missing)))}"
+            )
+
+        deltas: dict[int, float] = {}
+        for product_id in reserved.keys() | new_quantities.keys():
+            product = product_map[product_id]
+            if product_id in new_quantities and product.store_id != order.store_id:
                 raise HTTPException(
                     status_code=400,
-                    detail=f"Product with id {product_data.product_id} does not belong to this store",
+                    detail=f"Product with id {product_id} does not belong to this store",
                 )
-
-            if product.quantity < product_data.quantity:
+            delta = new_quantities.get(product_id, 0) - reserved.get(product_id, 0)
+            if delta > 0 and product.quantity - product.reserved_quantity < delta:
                 raise HTTPException(
                     status_code=400, detail=f"Not enough {product.name} in stock"
                 )
+            deltas[product_id] = delta
+
+        for product_id, delta in deltas.items():
+            product_map[product_id].reserved_quantity += delta
+        reservations_crud.replace(
+            order.id,
+            new_quantities,
+            session,
+            reservations_crud.pending_expiry(order.store.pending_order_timeout),
+        )
 
-            old_op = OrdersProducts(
-                order_id=order.id,
-                product_id=product_data.product_id,
-                quantity=product_data.quantity,
-            )
-            session.add(old_op)
+        for product_id, rows in old_rows.items():
+            if product_id in new_quantities:
+                rows[0].quantity = new_quantities[product_id]
+                rows = rows[1:]
+            for op in rows:
+                session.delete(op)
+
+        for product_id, quantity in new_quantities.items():
+            if product_id not in old_rows:
+                session.add(
+                    OrdersProducts(
+                        order_id=order.id, product_id=product_id, quantity=quantity
+                    )
+                )
 
-            session.commit()
-            return
-    except Exception as ex:  # Esto está bien que esté rojo
+        order_events.publish(session, order, "products_updated")
+        catalogue.invalidate(session, order.store_id)
+        session.commit()
+    except Exception:
         session.rollback()
-        raise ex
+        raise
 
 
 def cancel(id: int, session: Session):
-    order = get_by_id(id, session)
-    if order.status == StatusEnum.RECEIVED:
-        raise HTTPException(400, "Received orders cannot be cancelled.")
+    """
+    Cancels an order, releasing the stock reserved for it.
+    Args:
+        id (int): The ID of the order to cancel.
+        session (Session): The SQLAlchemy session to use for the update.
+    Raises:
+        HTTPException(404): If the order with the specified ID does not exist.
+        HTTPException(400): If the order was already received.
+    """
+    order = get_by_id(id, session, lock=True)
+    try:
+        if order.status == StatusEnum.RECEIVED:
+            raise HTTPException(400, "Received orders cannot be cancelled.")
 
-    order.status = StatusEnum.CANCELLED
-    session.commit()
+        if reservations_crud.release(order.id, session):
+            catalogue.invalidate(session, order.store_id)
+        order.status = StatusEnum.CANCELLED
+        order_events.publish(session, order, "cancelled")
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
 
     # todo: notificar al usuario por mail
+
+
+def cancel_stale(session: Session) -> tuple[set[int], list[int]]:
+    """
+    Cancels, in bulk, the pending orders older than their store's `pending_order_timeout` (stores without one never
+    cancel orders automatically), releases their stock reservations and the expired reservations of every other
+    order, and commits.
+
+    Orders being changed by someone else at the moment are skipped (`FOR UPDATE SKIP LOCKED`) and picked up by the
+    next run, so concurrent runs (one per worker) don't wait for each other. The cancellation itself is a single
+    `UPDATE orders ... RETURNING`, and each cancelled order is published to its store's subscribers.
+    Args:
+        session (Session): The SQLAlchemy session to use for the update.
+    Returns:
+        tuple[set[int], list[int]]: The IDs of the orders whose reservations were released and the IDs of the orders
+            that were cancelled.
+    """
+    stale = and_(
+        Order.status == StatusEnum.PENDING,
+        Order.store_id == Store.id,
+        Store.pending_order_timeout.is_not(None),
+        Order.created_at
+        < func.now() - func.make_interval(0, 0, 0, 0, 0, Store.pending_order_timeout),
+    )
+    try:
+        store_ids = dict(
+            session.execute(
+                select(Order.id, Order.store_id)
+                .where(
+                    or_(
+                        Order.id.in_(select(Order.id).where(stale)),
+                        Order.id.in_(reservations_crud.expired_order_ids()),
+                    )
+                )
+                .order_by(Order.id)
+                .with_for_update(skip_locked=True)
+            ).all()
+        )
+        order_ids = set(store_ids)
+        if not order_ids:
+            session.rollback()
+            return set(), []
+
+        cancelled = session.execute(
+            update(Order)
+            .where(Order.id.in_(order_ids), stale)
+            .values(status=StatusEnum.CANCELLED)
+            .returning(Order.id, Order.store_id)
+            .execution_options(synchronize_session=False)
+        ).all()
+        cancelled_ids = {int(order_id) for order_id, _ in cancelled}
+
+        released = reservations_crud.release_many(
+            cancelled_ids, session
+        ) | reservations_crud.release_expired(order_ids - cancelled_ids, session)
+        order_events.publish_many(
+            session, cancelled, StatusEnum.CANCELLED.value, "cancelled"
+        )
+        catalogue.invalidate_many(
+            session, {store_ids[order_id] for order_id in released}
+        )
+
+        session.commit()
+        return released, sorted(cancelled_ids)
+    except Exception:
+        session.rollback()
+        raise
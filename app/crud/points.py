@@ -117,6 +117,7 @@ def buy_with_points(user_id: int, product: Product, session: Session):
         ),
         session=session,
         using_points=True,
+        commit=False,
     )
     points_entry.amount -= product.points_price
     session.commit()
@@ -126,6 +127,8 @@ def gain_points_from_purchase(user_id: int, products: list[Product], session: Se
     """
     Adds points to a user's account based on the products they have purchased.
 
+    It does NOT commit: it is part of the sale's transaction, which `sale.create` commits.
+
     Args:
         user_id (int): The ID of the user making the purchase.
         products (list[Product]): The list of products being purchased.
@@ -148,8 +151,6 @@ def gain_points_from_purchase(user_id: int, products: list[Product], session: Se
     if user_points is None:
         user_points = Points(user_id=user_id, store_id=store_id, amount=0)
         session.add(user_points)
-        session.commit()
-        session.refresh(user_points)
     val = int(get_store_by_id(store_id, session).ps_value)
     points_to_add = 0
     for product in products:
@@ -159,10 +160,43 @@ def gain_points_from_purchase(user_id: int, products: list[Product], session: Se
             )
         points_to_add += int(product.price / val)
     user_points.amount += points_to_add
-    session.commit()
     return
 
 
+def gain_points_from_purchases(
+    store_id: int, purchases: dict[int, list[Product]], session: Session
+):
+    """
+    Bulk version of `gain_points_from_purchase`, used when many sales are created at once.
+
+    Loads the points entries of every user involved with a single query. It does NOT commit.
+
+    Args:
+        store_id (int): The ID of the store where the purchases were made.
+        purchases (dict[int, list[Product]]): The products bought by each user, keyed by user ID.
+        session (Session): The SQLAlchemy session to use for the query.
+    Returns:
+        None
+    """
+    # ESTA FUNCIÓN TAMPOCO DEBE TENER ENDPOINT, LA LLAMA sale.create_batch
+    if len(purchases) == 0 or not points_enabled(store_id, session):
+        return
+    val = int(get_store_by_id(store_id, session).ps_value)
+    entries = {
+        int(p.user_id): p
+        for p in session.query(Points).filter(
+            Points.store_id == store_id, Points.user_id.in_(purchases.keys())
+        )
+    }
+    for user_id, products in purchases.items():
+        user_points = entries.get(user_id)
+        if user_points is None:
+            user_points = Points(user_id=user_id, store_id=store_id, amount=0)
+            session.add(user_points)
+            entries[user_id] = user_points
+        user_points.amount += sum(int(product.price / val) for product in products)
+
+
 def get_all_by_store_id(id: int, session: Session):
     """
     Retrieves all points from the database by their store ID.
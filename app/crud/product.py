@@ -1,14 +1,38 @@
+from datetime import datetime, timezone
+
 from fastapi import HTTPException
 
+from sqlalchemy import (
+    BigInteger,
+    Integer,
+    String,
+    Text,
+    cast,
+    column,
+    delete as sql_delete,
+    exists,
+    func,
+    literal_column,
+    or_,
+    select,
+    update as sql_update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION, insert as pg_insert
 from sqlalchemy.orm import Session
 
-from app.models.product import Product
+from app.models.discount import Discount
+from app.models.order import Order, StatusEnum
+from app.models.product import Product, SEARCH_LANGUAGE
 from app.models.products_sales import ProductsSales
 from app.models.orders_products import OrdersProducts
 
-from app.schemas.product import ProductCreate, ProductUpdate
+from app.schemas.product import ProductCreate, ProductUpdate, StockCount, StockVariance
+
+from . import store as stores_crud
+from ..services import analytics, barcodes, catalogue
 
-from . import store as stores_crud, order as orders_crud, discount as discounts_crud
+STOCK_TAKE_CHUNK_SIZE = 1000  # counts per UPDATE ... FROM (VALUES ...)
 
 
 def get_all(session: Session, include_anonymized: bool = False):
@@ -16,14 +40,14 @@ def get_all(session: Session, include_anonymized: bool = False):
     Retrieves all products from the database.
     Args:
         session (Session): The SQLAlchemy session to use for the query.
-        include_anonymized (bool): If set to `False`, soft-deleted products marked as `"Deleted Product"` will not be included in the result list. Default is `False`.
+        include_anonymized (bool): If set to `False`, soft-deleted (anonymized) products will not be included in the result list. Default is `False`.
     Returns:
         list[Product]: A list of all products.
     """
     query = session.query(Product)
 
     if not include_anonymized:
-        query = query.filter(Product.name != "Deleted Product")
+        query = query.filter(Product.deleted_at.is_(None))
 
     return query.all()
 
@@ -34,14 +58,14 @@ def get_by_id(id: int, session: Session, allow_anonymized: bool = False):
     Args:
         id (int): The ID of the product to retrieve.
         session (Session): The SQLAlchemy session to use for the query.
-        allow_anonymized (bool): If set to `False`, a 404 error will be raised if the product with the specified ID is marked as`"Deleted Product"`, just as if the product did not exist in the database. Default is `False`.
+        allow_anonymized (bool): If set to `False`, a 404 error will be raised if the product with the specified ID has been soft-deleted (anonymized), just as if the product did not exist in the database. Default is `False`.
     Returns:
         Product: The product with the specified ID.
     Raises:
-        HTTPException(404): If the product with the specified ID does not exist, or is a `"Deleted Product"` and `allow_anonymized` is set to `False`.
+        HTTPException(404): If the product with the specified ID does not exist, or has been soft-deleted and `allow_anonymized` is set to `False`.
     """
     product = session.get(Product, id)
-    if product is None or (product.name == "Deleted Product" and not allow_anonymized):
+    if product is None or (product.deleted_at is not None and not allow_anonymized):
         raise HTTPException(status_code=404, detail="Product not found")
     return product
 
@@ -60,11 +84,147 @@ def get_all_by_store_id(id: int, session: Session, include_anonymized: bool = Fa
     products = session.query(Product).filter(Product.store_id == id)
 
     if not include_anonymized:
-        products = products.filter(Product.name != "Deleted Product")
+        products = products.filter(Product.deleted_at.is_(None))
 
     return products.all()
 
 
+def search(
+    text: str,
+    session: Session,
+    store_id: int | None = None,
+    type: int | None = None,
+    limit: int = 20,
+    offset: int = 0,
+):
+    """
+    Searches the visible products by name, brand and description, best matches first.
+
+    A product matches if its full-text document (`Product.search_vector`) matches `text` (as a web search query:
+    `"quoted phrases"`, `or`, `-excluded`), or if its name or brand contains a word similar to `text` (pg_trgm's
+    word similarity, which tolerates typos). Both conditions are answered by GIN indexes. Matches are ranked by
+    their full-text rank plus their name's word similarity.
+    Args:
+        text (str): What to search for.
+        session (Session): The SQLAlchemy session to use for the query.
+        store_id (int | None): If set, only this store's products are searched.
+        type (int | None): If set, only products of this type are searched.
+        limit (int): The maximum amount of products to return. Defaults to 20.
+        offset (int): How many of the best matches to skip. Defaults to 0.
+    Returns:
+        list[Product]: The matching products, best match first.
+    """
+    query = func.websearch_to_tsquery(SEARCH_LANGUAGE, text)
+    rank = func.ts_rank_cd(Product.search_vector, query) + func.word_similarity(
+        text, Product.name
+    )
+    products = session.query(Product).filter(
+        or_(
+            Product.search_vector.op("@@")(query),
+            Product.name.op("%>")(text),
+            Product.brand.op("%>")(text),
+        ),
+        Product.hidden.is_(False),
+        Product.deleted_at.is_(None),
+    )
+    if store_id is not None:
+        products = products.filter(Product.store_id == store_id)
+    if type is not None:
+        products = products.filter(Product.type == type)
+
+    return products.order_by(rank.desc(), Product.id).offset(offset).limit(limit).all()
+
+
+def get_by_barcode(store_id: int, barcode: str, session: Session):
+    """
+    Retrieves a store's product by its barcode, resolved through the store's cached barcode map (see
+    `services.barcodes`) and then loaded by primary key, so its price and stock are always current.
+    Args:
+        store_id (int): The ID of the store.
+        barcode (str): The barcode.
+        session (Session): The SQLAlchemy session to use for the query.
+    Returns:
+        Product: The store's product with that barcode.
+    Raises:
+        HTTPException(404): If the store has no product with that barcode.
+    """
+    product_id = barcodes.get_map(store_id, session).get(barcode)
+    if product_id is not None:
+        product = session.get(Product, product_id)
+        if (
+            product is not None
+            and product.store_id == store_id
+            and product.barcode == barcode
+        ):
+            return product
+
+    # the map was stale (another worker changed the store's products) or the barcode doesn't exist
+    product = (
+        session.query(Product)
+        .filter(Product.store_id == store_id, Product.barcode == barcode)
+        .one_or_none()
+    )
+    if product_id is not None or product is not None:
+        barcodes.invalidate(store_id)
+    if product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return product
+
+
+def _check_barcode_is_free(
+    store_id: int, barcode: str | None, session: Session, product_id: int | None = None
+):
+    """
+    Raises:
+        HTTPException(400): If another product of the store already has that barcode.
+    """
+    if barcode is None:
+        return
+    query = session.query(Product.id).filter(
+        Product.store_id == store_id, Product.barcode == barcode
+    )
+    if product_id is not None:
+        query = query.filter(Product.id != product_id)
+    if query.first() is not None:
+        raise HTTPException(
+            400, detail="Another product of this store already has that barcode."
+        )
+
+
+def reserve_stock(quantities: dict[int, float], session: Session) -> set[int]:
+    """
+    Adds the given quantities to the products' `reserved_quantity` with a single conditional
+    `UPDATE products ... FROM (VALUES ...) WHERE quantity - reserved_quantity >= requested`, without reading (or
+    locking) the rows first.
+
+    The rows are only locked from this statement until the transaction ends, so callers should run it as late as
+    possible (right before committing). Nothing is rolled back here: if some product didn't have enough available
+    stock the caller must roll back the transaction.
+    Args:
+        quantities (dict[int, float]): The quantity to reserve of each product, keyed by product ID.
+        session (Session): The SQLAlchemy session to use for the update.
+    Returns:
+        set[int]: The IDs of the products that did NOT have enough available stock (empty if every reservation succeeded).
+    """
+    if not quantities:
+        return set()
+    requested = values(
+        column("id", BigInteger), column("quantity", DOUBLE_PRECISION), name="requested"
+    ).data(sorted(quantities.items()))
+    products = Product.__table__
+    stmt = (
+        sql_update(products)
+        .where(
+            products.c.id == requested.c.id,
+            products.c.quantity - products.c.reserved_quantity >= requested.c.quantity,
+        )
+        .values(reserved_quantity=products.c.reserved_quantity + requested.c.quantity)
+        .returning(products.c.id)
+    )
+    updated = {int(row.id) for row in session.execute(stmt)}
+    return set(quantities) - updated
+
+
 def create(product_data: ProductCreate, session: Session, store_id: int):
     """
     Creates a new product in the database.
@@ -74,6 +234,8 @@ def create(product_data: ProductCreate, session: Session, store_id: int):
         store_id (int): The ID of the store to which the product belongs.
     Returns:
         int: The ID of the newly created product.
+    Raises:
+        HTTPException(400): If another product of the store already has the same barcode.
     """
     if product_data.hidden == None:
         product_data.hidden = False
@@ -83,6 +245,7 @@ def create(product_data: ProductCreate, session: Session, store_id: int):
     stores_crud.get_by_id(
         store_id, session
     )  # Checks that the store exists. Extracting the id from the product_data is temporary and will only stay there until we do login
+    _check_barcode_is_free(store_id, product_data.barcode, session)
 
     product = Product(
         **product_data.model_dump(),
@@ -90,11 +253,243 @@ def create(product_data: ProductCreate, session: Session, store_id: int):
     )
 
     session.add(product)
+    catalogue.invalidate(session, store_id)
     session.commit()
     session.refresh(product)
+    if product.barcode is not None:
+        barcodes.invalidate(store_id)
     return int(product.id)
 
 
+def _upsert_statement(
+    products_data: list[ProductCreate], store_id: int, keep_hidden: bool
+):
+    """
+    Builds the `INSERT ... ON CONFLICT DO UPDATE` of `upsert_many` for some of its records.
+
+    Args:
+        products_data (list[ProductCreate]): The products.
+        store_id (int): The ID of the store they belong to.
+        keep_hidden (bool): Whether the products that already exist keep their `hidden`.
+    """
+    stmt = pg_insert(Product).values(
+        [
+            {
+                **product_data.model_dump(),
+                "hidden": bool(product_data.hidden),
+                "store_id": store_id,
+                "reserved_quantity": 0,
+            }
+            for product_data in products_data
+        ]
+    )
+    updated_columns = [
+        "name",
+        "brand",
+        "price",
+        "points_price",
+        "type",
+        "quantity",
+        "desc",
+    ]
+    if not keep_hidden:
+        updated_columns.append("hidden")
+    # xmax is 0 for the rows this statement inserted, and the updating transaction's ID for the ones it updated
+    was_inserted = literal_column("xmax").cast(Text) == "0"
+    return stmt.on_conflict_do_update(
+        index_elements=[Product.store_id, Product.barcode],
+        index_where=Product.barcode.is_not(None),
+        set_={column: stmt.excluded[column] for column in updated_columns},
+        # the units reserved by pending orders must stay in stock: such rows are left as they are
+        where=stmt.excluded.quantity >= Product.reserved_quantity,
+    ).returning(Product.barcode, was_inserted)
+
+
+def upsert_many(
+    products_data: list[ProductCreate], store_id: int, session: Session
+) -> tuple[int, int, list[int]]:
+    """
+    Creates many products of a store at once, or updates the ones whose barcode the store already uses, with
+    `INSERT ... ON CONFLICT (store_id, barcode) DO UPDATE`, and commits.
+
+    Products without a barcode are always created. The records must not repeat a barcode (Postgres can't update the
+    same row twice in one statement) nor be named `"Deleted Product"`. A product is not updated if its new `quantity`
+    is less than its `reserved_quantity`, and keeps its `hidden` if the record omits it (or leaves it `null`).
+    Args:
+        products_data (list[ProductCreate]): The products.
+        store_id (int): The ID of the store they belong to.
+        session (Session): The SQLAlchemy session to use for the insert.
+    Returns:
+        tuple[int, int, list[int]]: How many products were created and how many were updated, and the indexes (in
+            `products_data`) of the records that weren't saved because their quantity is less than the units reserved
+            of the product.
+    """
+    if not products_data:
+        return 0, 0, []
+    keeps_hidden = [
+        product_data.hidden is None or "hidden" not in product_data.model_fields_set
+        for product_data in products_data
+    ]
+    rows = []
+    try:
+        for keep_hidden in (False, True):
+            records = [
+                product_data
+                for product_data, keeps in zip(products_data, keeps_hidden)
+                if keeps == keep_hidden
+            ]
+            if records:
+                stmt = _upsert_statement(records, store_id, keep_hidden)
+                rows += session.execute(stmt).all()
+        created = sum(1 for _, row_inserted in rows if row_inserted)
+        catalogue.invalidate(session, store_id)
+        if created < len(rows):
+            analytics.invalidate(session, store_id)  # prices or types may have changed
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+    saved_barcodes = {barcode for barcode, _ in rows if barcode is not None}
+    skipped = [
+        index
+        for index, product_data in enumerate(products_data)
+        if product_data.barcode is not None
+        and product_data.barcode not in saved_barcodes
+    ]
+    if any(product_data.barcode is not None for product_data in products_data):
+        barcodes.invalidate(store_id)
+    return created, len(rows) - created, skipped
+
+
+def _apply_stock_counts(
+    chunk: list[tuple[int, StockCount]], store_id: int, session: Session
+):
+    """
+    Sets the quantity of a chunk of counted products with a single statement: the counts are sent as a `VALUES`
+    list, resolved to the store's products (by ID, or by barcode through the `(store_id, barcode)` index), locked in ID
+    order and updated, and each resolved count is returned with the quantity its product had before.
+    Returns:
+        list[Row]: `(ordinal, id, barcode, previous, reserved, counted)` (`ordinal` is the index of the count) of every count that matched a product of the store.
+    """
+    counts = values(
+        column("ordinal", Integer),
+        column("id", BigInteger),
+        column("barcode", String),
+        column("counted", DOUBLE_PRECISION),
+        name="counts",
+    ).data(
+        [
+            (index, count.product_id, count.barcode, count.counted_quantity)
+            for index, count in chunk
+        ]
+    )
+    products = Product.__table__
+    barcoded = products.alias("barcoded")
+    by_barcode = (
+        select(barcoded.c.id)
+        .where(barcoded.c.store_id == store_id, barcoded.c.barcode == counts.c.barcode)
+        .correlate(counts)
+        .scalar_subquery()
+    )
+    locked = (
+        select(
+            counts.c.ordinal,
+            products.c.id,
+            products.c.barcode,
+            products.c.quantity.label("previous"),
+            products.c.reserved_quantity.label("reserved"),
+            counts.c.counted,
+        )
+        .join_from(
+            counts,
+            products,
+            # a column of only NULLs would be typed as text
+            products.c.id == func.coalesce(cast(counts.c.id, BigInteger), by_barcode),
+        )
+        .where(products.c.store_id == store_id, products.c.deleted_at.is_(None))
+        .order_by(products.c.id)
+        .with_for_update(of=products)
+        .cte("locked")
+    )
+    updated = (
+        sql_update(products)
+        .where(products.c.id == locked.c.id)
+        .values(quantity=locked.c.counted)
+        .returning(products.c.id)
+        .cte("updated")
+    )
+    # Postgres always runs data-modifying CTEs, even if the main query doesn't read them
+    stmt = select(locked).order_by(locked.c.ordinal).add_cte(updated)
+    return session.execute(stmt).all()
+
+
+def apply_stock_take(
+    counts: list[StockCount], store_id: int, session: Session
+) -> list[StockVariance]:
+    """
+    Sets the quantity of a store's products to the counted quantities of a stock take, in a single transaction with one
+    `UPDATE ... FROM (VALUES ...)` per `STOCK_TAKE_CHUNK_SIZE` counts, and commits.
+
+    If any count doesn't match a product of the store, two counts are of the same product, or a count is less than the
+    units of its product reserved by pending orders, nothing is changed.
+    Args:
+        counts (list[StockCount]): The counted products, by ID or barcode.
+        store_id (int): The ID of the store.
+        session (Session): The SQLAlchemy session to use for the update.
+    Returns:
+        list[StockVariance]: The variance of each counted product, in the order of `counts`.
+    Raises:
+        HTTPException(404): If some count doesn't match any (non-deleted) product of the store.
+        HTTPException(400): If two counts are of the same product, or a count is less than its product's reserved units.
+    """
+    variances: list[StockVariance] = []
+    counted_at: dict[int, int] = {}  # the index of the count of each product
+    try:
+        for start in range(0, len(counts), STOCK_TAKE_CHUNK_SIZE):
+            chunk = list(
+                enumerate(counts[start : start + STOCK_TAKE_CHUNK_SIZE], start)
+            )
+            rows = _apply_stock_counts(chunk, store_id, session)
+            if len(rows) < len(chunk):
+                found = {row.ordinal for row in rows}
+                missing = [index for index, _ in chunk if index not in found]
+                raise HTTPException(
+                    404,
+                    "Products not found: "
+                    + ", ".join(f"counts[{index}]" for index in missing[:20])
+                    + ("..." if len(missing) > 20 else "")
+                    + ".",
+                )
+            for row in rows:
+                if row.id in counted_at:
+                    raise HTTPException(
+                        400,
+                        f"counts[{counted_at[row.id]}] and counts[{row.ordinal}] are the same product.",
+                    )
+                counted_at[row.id] = row.ordinal
+                if row.counted < row.reserved:
+                    raise HTTPException(
+                        400,
+                        f"counts[{row.ordinal}] is less than the {row.reserved:g} units of the product reserved by pending orders.",
+                    )
+                variances.append(
+                    StockVariance(
+                        product_id=row.id,
+                        barcode=row.barcode,
+                        previous_quantity=row.previous,
+                        counted_quantity=row.counted,
+                        variance=row.counted - row.previous,
+                    )
+                )
+        catalogue.invalidate(session, store_id)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return variances
+
+
 def update(id: int, product_data: ProductUpdate, session: Session):
     """
     Updates a product by its ID.
@@ -106,6 +501,7 @@ def update(id: int, product_data: ProductUpdate, session: Session):
         None
     Raises:
         HTTPException(404): If the product with the specified ID does not exist.
+        HTTPException(400): If another product of the store already has the new barcode.
     """
     product = get_by_id(id, session)
 
@@ -113,24 +509,37 @@ def update(id: int, product_data: ProductUpdate, session: Session):
         product_data.hidden = product.hidden
 
     updates = product_data.model_dump(exclude_unset=True)
+    barcode_changed = "barcode" in updates and updates["barcode"] != product.barcode
+    if barcode_changed:
+        _check_barcode_is_free(product.store_id, updates["barcode"], session, id)
 
     for field, value in updates.items():
         setattr(product, field, value)
 
+    catalogue.invalidate(session, product.store_id)
+    if "price" in updates or "type" in updates:
+        analytics.invalidate(session, product.store_id)
     session.commit()
+    if barcode_changed:
+        barcodes.invalidate(int(product.store_id))
 
 
 def delete(id: int, session: Session):
     """
     Deletes a product by its ID. This will also delete any associated discounts.
 
-    If the product is not in any sale or non-RECEIVED order it will be erased from the database.
+    If the product is not in any sale or order it will be erased from the database.
 
-    If any sale contains any amount of the product, it will be anonymized instead, meaning:
+    If any sale or (received or cancelled) order contains any amount of the product, it will be anonymized instead,
+    meaning:
+        * Its `deleted_at` will be set, which hides it from every listing and lookup.
         * Its name, brand and description will be set to `"Deleted Product"`.
         * Its barcode data will be set to None.
         * Its quantity will permanently become 0.
 
+    Whether it's in an open order or in any sale is checked with `EXISTS` subqueries (answered by the `product_id`
+    indexes of `orders_products` and `products_sales`), so the cost doesn't depend on the product's sales history.
+
     Args:
         id (int): The ID of the product to delete.
         session (Session): The SQLAlchemy session to use for the delete.
@@ -138,33 +547,43 @@ def delete(id: int, session: Session):
         None
     Raises:
         HTTPException(404): If the product with the specified ID does not exist.
-        HTTPException(400): If the product is part of any pending or accepted (but not received) order.
+        HTTPException(400): If the product is part of any pending or accepted order.
     """
     product = get_by_id(id, session)
-    orders = session.query(OrdersProducts).filter(OrdersProducts.product_id == id).all()
-    sales = session.query(ProductsSales).filter(ProductsSales.product_id == id).all()
-    discount = discounts_crud.get_by_product_id(id, session, raise_404=False)
-
-    if discount:
-        session.delete(discount)
-
-    # Checks if the product is part of any pending or accepted order, and blocks deletion if so
-    for op in orders:
-        order = orders_crud.get_by_id(op.order_id, session)
-        if order.status != orders_crud.StatusEnum.RECEIVED:
-            raise HTTPException(
-                400,
-                "Cannot delete product that is part of a pending or accepted order. Please fulfill or cancel the order first.",
-            )
-
-    # If the product is part of any sale, anonymize it instead of deleting it
-    if len(sales) > 0:
+    store_id = int(product.store_id)
+
+    in_open_order, in_any_order, in_any_sale = session.execute(
+        select(
+            exists().where(
+                OrdersProducts.product_id == id,
+                OrdersProducts.order_id == Order.id,
+                Order.status.in_((StatusEnum.PENDING, StatusEnum.ACCEPTED)),
+            ),
+            exists().where(OrdersProducts.product_id == id),
+            exists().where(ProductsSales.product_id == id),
+        )
+    ).one()
+
+    # Blocks the deletion if the product is part of any pending or accepted order
+    if in_open_order:
+        raise HTTPException(
+            400,
+            "Cannot delete product that is part of a pending or accepted order. Please fulfill or cancel the order first.",
+        )
+
+    session.execute(sql_delete(Discount).where(Discount.product_id == id))
+
+    # If any sale or order references the product, anonymize it instead of deleting it
+    if in_any_sale or in_any_order:
         product.name = "Deleted Product"
         product.brand = "Deleted Product"
         product.desc = "Deleted Product"
         product.barcode = None
         product.quantity = 0
+        product.deleted_at = datetime.now(timezone.utc)
     else:
         session.delete(product)
 
+    catalogue.invalidate(session, store_id)
     session.commit()
+    barcodes.invalidate(store_id)
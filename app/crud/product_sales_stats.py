@@ -0,0 +1,178 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Literal
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from ..models.product import Product
+from ..models.product_sales_stats import ProductSalesTotal, ProductDailySales
+from ..models.products_sales import ProductsSales
+from ..models.sale import Sale
+from ..utils import STORE_TIMEZONE, store_today
+from .store_daily_sales import SaleTotals
+
+WINDOWS = {"7d": 7, "30d": 30, "all": None}
+
+
+def record_sales(sales: list[SaleTotals], session: Session):
+    """
+    Adds the lines of freshly written sales to the products' counters, with one upsert per table. It does NOT
+    commit: it is meant to run in the same transaction as the sales (see `crud.sale.create`).
+
+    Args:
+        sales (list[SaleTotals]): The sales to add.
+        session (Session): The SQLAlchemy session to use for the query.
+    Returns:
+        None
+    """
+    totals: dict[int, list] = {}
+    daily: dict[tuple[int, date], list] = {}
+    for _, timestamp, _, lines in sales:
+        day = timestamp.astimezone(STORE_TIMEZONE).date()
+        for product, quantity in lines:
+            revenue = Decimal(product.price) * Decimal(str(quantity))
+            total = totals.setdefault(
+                int(product.id), [int(product.store_id), 0.0, Decimal(0), timestamp]
+            )
+            total[1] += quantity
+            total[2] += revenue
+            total[3] = max(total[3], timestamp)
+            day_total = daily.setdefault(
+                (int(product.id), day), [int(product.store_id), 0.0, Decimal(0)]
+            )
+            day_total[1] += quantity
+            day_total[2] += revenue
+
+    if not totals:
+        return
+
+    stmt = pg_insert(ProductSalesTotal).values(
+        [
+            {
+                "product_id": product_id,
+                "store_id": store_id,
+                "units": units,
+                "revenue": revenue,
+                "last_sold_at": last_sold_at,
+            }
+            for product_id, (store_id, units, revenue, last_sold_at) in totals.items()
+        ]
+    )
+    session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[ProductSalesTotal.product_id],
+            set_={
+                "units": ProductSalesTotal.units + stmt.excluded.units,
+                "revenue": ProductSalesTotal.revenue + stmt.excluded.revenue,
+                "last_sold_at": func.greatest(
+                    ProductSalesTotal.last_sold_at, stmt.excluded.last_sold_at
+                ),
+            },
+        )
+    )
+
+    stmt = pg_insert(ProductDailySales).values(
+        [
+            {
+                "product_id": product_id,
+                "store_id": store_id,
+                "day": day,
+                "units": units,
+                "revenue": revenue,
+            }
+            for (product_id, day), (store_id, units, revenue) in daily.items()
+        ]
+    )
+    session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[ProductDailySales.product_id, ProductDailySales.day],
+            set_={
+                "units": ProductDailySales.units + stmt.excluded.units,
+                "revenue": ProductDailySales.revenue + stmt.excluded.revenue,
+            },
+        )
+    )
+
+
+def get_top(
+    store_id: int,
+    session: Session,
+    window: Literal["7d", "30d", "all"] = "all",
+    limit: int = 10,
+):
+    """
+    Retrieves the best-selling products of a store, ranked by units sold.
+
+    Args:
+        store_id (int): The ID of the store.
+        session (Session): The SQLAlchemy session to use for the query.
+        window (Literal["7d", "30d", "all"]): Whether to rank the sales of the last 7 days, the last 30 days (both including today) or all of them. Defaults to `"all"`.
+        limit (int): The maximum amount of products to return. Defaults to 10.
+    Returns:
+        list[tuple[Product, float, Decimal, datetime]]: `(product, units, revenue, last_sold_at)` for each product, best-selling first.
+    """
+    days = WINDOWS[window]
+    if days is None:
+        query = (
+            session.query(
+                Product,
+                ProductSalesTotal.units,
+                ProductSalesTotal.revenue,
+                ProductSalesTotal.last_sold_at,
+            )
+            .join(Product, Product.id == ProductSalesTotal.product_id)
+            .filter(ProductSalesTotal.store_id == store_id)
+            .order_by(ProductSalesTotal.units.desc(), Product.id)
+        )
+    else:
+        units = func.sum(ProductDailySales.units)
+        query = (
+            session.query(
+                Product,
+                units,
+                func.sum(ProductDailySales.revenue),
+                ProductSalesTotal.last_sold_at,
+            )
+            .join(Product, Product.id == ProductDailySales.product_id)
+            .join(
+                ProductSalesTotal,
+                ProductSalesTotal.product_id == ProductDailySales.product_id,
+            )
+            .filter(
+                ProductDailySales.store_id == store_id,
+                ProductDailySales.day > store_today() - timedelta(days=days),
+            )
+            .group_by(Product.id, ProductSalesTotal.last_sold_at)
+            .order_by(units.desc(), Product.id)
+        )
+    query = query.filter(Product.deleted_at.is_(None))
+    return [tuple(row) for row in query.limit(limit).all()]
+
+
+def recount(store_id: int, session: Session) -> dict[int, tuple[float, datetime]]:
+    """
+    Recomputes the all-time units sold and last sale of every product of a store straight from `products_sales`.
+
+    This scans the whole sales history; it exists to check the counters against it.
+
+    Args:
+        store_id (int): The ID of the store.
+        session (Session): The SQLAlchemy session to use for the query.
+    Returns:
+        dict[int, tuple[float, datetime]]: `(units, last_sold_at)` keyed by product ID.
+    """
+    rows = (
+        session.query(
+            ProductsSales.product_id,
+            func.sum(ProductsSales.quantity),
+            func.max(Sale.timestamp),
+        )
+        .join(Sale, Sale.id == ProductsSales.sale_id)
+        .join(Product, Product.id == ProductsSales.product_id)
+        .filter(Product.store_id == store_id)
+        .group_by(ProductsSales.product_id)
+        .all()
+    )
+    return {int(product_id): (units, last) for product_id, units, last in rows}
@@ -3,34 +3,55 @@ from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
     from app.models.user import User
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select, insert
+from sqlalchemy.orm import Session, selectinload
 from app.models.product import Product
 from app.models.products_sales import ProductsSales
 
 from app.models.sale import Sale
 from app.models.store import Store
-from app.schemas.sale import SaleCreate
+from app.schemas.sale import SaleCreate, BatchSaleCreate, BatchSaleResult
 
-from . import product as products_crud
+from . import store_daily_sales as store_daily_sales_crud
+from . import product_sales_stats as product_sales_stats_crud
+from ..services import analytics, catalogue
+from ..utils import as_utc
 
 # from . import store as stores_crud
 
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+"""
+How far in the future a batch sale's timestamp may be (POS clocks aren't exact) before it's rejected.
+"""
 
-def get_all(session: Session):
+
+def _paginate(query, limit: int | None, offset: int):
+    """
+    Eager-loads the products of every sale in `query` (one extra `IN` query per page instead of one per sale) and applies the pagination.
+    """
+    query = (
+        query.options(selectinload(Sale.products_sales))
+        .order_by(Sale.id)
+        .offset(offset)
+    )
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
+def get_all(session: Session, limit: int | None = None, offset: int = 0):
     """
-    Retrieves all sales from the database.
+    Retrieves all sales from the database, with their products already loaded.
     Args:
         session (Session): The SQLAlchemy session to use for the query.
+        limit (int | None): The maximum amount of sales to return. `None` (default) returns all of them.
+        offset (int): How many sales to skip (ordered by ID). Defaults to 0.
     Returns:
         list[Sale]: A list of all sales.
     """
-    return session.query(Sale).all()
-
-
-def get_ps_by_sale(sale: Sale, session: Session):
-    return session.query(ProductsSales).filter(ProductsSales.sale_id == sale.id).all()
+    return _paginate(session.query(Sale), limit, offset)
 
 
 def get_by_id(id: int, session: Session):
@@ -54,91 +75,372 @@ def get_sales_by_user_id(user_id: int, session: Session):
     return session.query(Sale).filter(Sale.user_id == user_id).all()
 
 
-def create(sale_data: SaleCreate, session: Session, using_points: bool = False) -> int:
+def _lock_products(product_ids: set[int], session: Session) -> dict[int, Product]:
+    """
+    Loads and row-locks (`SELECT ... FOR UPDATE`) every product in `product_ids` with a single query.
+
+    Rows are locked in ascending id order so that two concurrent baskets sharing products can't deadlock, and are
+    re-read even if they are already in the session (e.g. after an order's reservation was released).
+    Args:
+        product_ids (set[int]): The IDs of the products to lock.
+        session (Session): The SQLAlchemy session to use for the query.
+    Returns:
+        dict[int, Product]: The locked products, keyed by ID. Missing IDs are simply absent.
+    """
+    stmt = (
+        select(Product)
+        .where(Product.id.in_(product_ids))
+        .order_by(Product.id)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    )
+    return {int(p.id): p for p in session.execute(stmt).scalars()}
+
+
+def _validate_basket(
+    sale_data: SaleCreate, product_map: dict[int, Product]
+) -> dict[int, float]:
+    """
+    Validates a whole basket against already loaded products, before anything is written.
+    Args:
+        sale_data (SaleCreate): The sale data to validate.
+        product_map (dict[int, Product]): The products involved in the sale, keyed by ID.
+    Returns:
+        dict[int, float]: The total requested quantity for each product (a product may appear in more than one line).
+    Raises:
+        HTTPException(400): If the sale has no products.
+        HTTPException(404): If a product does not exist (or has been deleted).
+        HTTPException(400): If a product does not belong to the sale's store.
+        HTTPException(400): If there is insufficient available stock for a product (stock reserved by orders
+            doesn't count).
+    """
+    if len(sale_data.products) == 0:
+        raise HTTPException(status_code=400, detail="Sale must have at least 1 product")
+
+    requested: dict[int, float] = {}
+    for product_data in sale_data.products:
+        product = product_map.get(product_data.product_id)
+        if product is None or product.deleted_at is not None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        if product.store_id != sale_data.store_id:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Product with id {product_data.product_id} does not belong to this store",
+            )
+        requested[product_data.product_id] = (
+            requested.get(product_data.product_id, 0) + product_data.quantity
+        )
+
+    for product_id, quantity in requested.items():
+        product = product_map[product_id]
+        if (product.quantity - product.reserved_quantity - quantity) < 0:
+            raise HTTPException(
+                status_code=400, detail=f"Not enough {product.name} in stock"
+            )
+
+    return requested
+
+
+def create(
+    sale_data: SaleCreate,
+    session: Session,
+    using_points: bool = False,
+    commit: bool = True,
+) -> int:
     """
     Creates a new sale in the database.
+
+    Every product in the sale is loaded and locked with one `SELECT ... FOR UPDATE`, the whole basket is
+    validated before anything is written and all the `ProductsSales` rows are inserted with a single
+    multi-row insert. The sale, the stock deduction, the points earned and the updates to the
+    `store_daily_sales` rollup and the products' sales counters land in the same transaction.
     Args:
         sale_data (SaleCreate): The sale data to create.
         session (Session): The SQLAlchemy session to use for the insert.
         using_points (bool): Whether the user is using points to pay for ALL of the products in this sale. Defaults to `False`.
+        commit (bool): Whether to commit the transaction. Callers that need to write more things in the same transaction (e.g. `points.buy_with_points`) should set it to `False` and commit themselves. Defaults to `True`.
     Returns:
         int: The ID of the newly created sale.
+    Raises:
+        HTTPException(400): If an anonymous user tries to pay with points.
+        HTTPException(404): If the user or a product does not exist.
+        HTTPException(400): If the basket is invalid (see `_validate_basket`).
     """
     if using_points and sale_data.user_id is None:
         raise HTTPException(
             status_code=400, detail="Anonymous users cannot use points to pay for sales"
         )
     import app.crud.user as users_crud
+    from .points import gain_points_from_purchase, points_enabled
 
-    if sale_data.user_id != None:
-        users_crud.get_by_id(sale_data.user_id, session)  # raises 404 if not found
-    sale = Sale(
-        store_id=sale_data.store_id,  # me di cuenta de que no hace falta pero es mucho quilombo sacarlo :)
-        user_id=sale_data.user_id,  # (can be None)
-        payment_method=sale_data.payment_method,
-        timestamp=datetime.now(timezone.utc),
-    )
-    session.add(sale)
-    session.commit()
+    try:
+        if sale_data.user_id != None:
+            users_crud.get_by_id(sale_data.user_id, session)  # raises 404 if not found
 
-    products_model_instances: list[Product] = []  # ver if not using_points...
-    for product_data in sale_data.products:
-        product = products_crud.get_by_id(product_data.product_id, session)
-        if product.store_id != sale_data.store_id:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Product with id {product_data.product_id} does not belong to this store",
+        product_map = _lock_products(
+            {p.product_id for p in sale_data.products}, session
+        )
+        requested = _validate_basket(sale_data, product_map)
+
+        sale = Sale(
+            store_id=sale_data.store_id,  # me di cuenta de que no hace falta pero es mucho quilombo sacarlo :)
+            user_id=sale_data.user_id,  # (can be None)
+            payment_method=sale_data.payment_method,
+            timestamp=datetime.now(timezone.utc),
+        )
+        session.add(sale)
+        session.flush()  # sale.id now available
+
+        session.execute(
+            insert(ProductsSales),
+            [
+                {
+                    "sale_id": sale.id,
+                    "product_id": product_data.product_id,
+                    "quantity": product_data.quantity,
+                }
+                for product_data in sale_data.products
+            ],
+        )
+
+        for product_id, quantity in requested.items():
+            product_map[product_id].quantity -= quantity
+
+        totals = [
+            (
+                sale_data.store_id,
+                sale.timestamp,
+                sale_data.payment_method,
+                [(product_map[p.product_id], p.quantity) for p in sale_data.products],
             )
+        ]
+        store_daily_sales_crud.record_sales(totals, session)
+        product_sales_stats_crud.record_sales(totals, session)
 
-        if (product.quantity - product_data.quantity) < 0:
-            raise HTTPException(
-                status_code=400, detail=f"Not enough {product.name} in stock"
+        if (
+            not using_points
+            and sale_data.user_id is not None
+            and points_enabled(sale.store_id, session)
+        ):
+            gain_points_from_purchase(
+                sale_data.user_id,
+                [product_map[p.product_id] for p in sale_data.products],
+                session,
             )
+
+        catalogue.invalidate(session, sale_data.store_id)
+        analytics.invalidate(session, sale_data.store_id)
+        if commit:
+            session.commit()
         else:
-            product.quantity -= product_data.quantity
+            session.flush()
+        return int(sale.id)
+    except Exception:
+        session.rollback()
+        raise
+
 
-        ps = ProductsSales(
-            sale_id=sale.id,
-            product_id=product_data.product_id,
-            quantity=product_data.quantity,
+def create_batch(
+    sales_data: list[BatchSaleCreate], store_id: int, session: Session
+) -> list[BatchSaleResult]:
+    """
+    Creates many sales of the same store at once (e.g. the sales a POS rang up while offline).
+
+    Every product involved is locked with a single `SELECT ... FOR UPDATE` and the records are validated one
+    by one, in order, against that snapshot (stock taken by a record is no longer available to the next one).
+    Invalid records are reported and skipped; the valid ones are written with one multi-row insert into `sales`
+    and one into `products_sales`, all in a single transaction. Each sale keeps the timestamp it was rung up at
+    (stored in UTC), so it's counted on the right day; sales without one are timestamped now.
+    Args:
+        sales_data (list[BatchSaleCreate]): The sales to create.
+        store_id (int): The ID of the store the sales belong to. Records for any other store are rejected.
+        session (Session): The SQLAlchemy session to use for the inserts.
+    Returns:
+        list[BatchSaleResult]: One result per record, in the same order as `sales_data`.
+    """
+    from app.models.user import User
+    from .points import gain_points_from_purchases
+
+    try:
+        product_map = _lock_products(
+            {p.product_id for s in sales_data for p in s.products}, session
+        )
+        user_ids = {s.user_id for s in sales_data if s.user_id is not None}
+        existing_user_ids = (
+            set(
+                session.scalars(
+                    select(User.id).where(
+                        User.id.in_(user_ids), User.deleted_at.is_(None)
+                    )
+                )
+            )
+            if user_ids
+            else set()
         )
-        session.add(ps)
-        products_model_instances.append(product)
-    session.refresh(sale)
-    from .points import gain_points_from_purchase, points_enabled
 
-    if (
-        not using_points
-        and sale_data.user_id is not None
-        and points_enabled(sale.store_id, session)
-    ):
-        gain_points_from_purchase(sale_data.user_id, products_model_instances, session)
+        now = datetime.now(timezone.utc)
+        results: list[BatchSaleResult | None] = []
+        accepted: list[tuple[int, BatchSaleCreate, datetime]] = []
+        for index, sale_data in enumerate(sales_data):
+            try:
+                timestamp = (
+                    now
+                    if sale_data.timestamp is None
+                    else as_utc(sale_data.timestamp).astimezone(timezone.utc)
+                )
+                if timestamp > now + MAX_CLOCK_SKEW:
+                    raise HTTPException(
+                        status_code=400, detail="The sale's timestamp is in the future"
+                    )
+                if sale_data.store_id != store_id:
+                    raise HTTPException(
+                        status_code=403,
+                        detail="You do not have permission to create sales for this store",
+                    )
+                if (
+                    sale_data.user_id is not None
+                    and sale_data.user_id not in existing_user_ids
+                ):
+                    raise HTTPException(status_code=404, detail="User not found")
+                requested = _validate_basket(sale_data, product_map)
+            except HTTPException as ex:
+                results.append(
+                    BatchSaleResult(
+                        index=index, successful=False, id=None, message=str(ex.detail)
+                    )
+                )
+                continue
 
-    session.commit()
-    return int(sale.id)
+            for product_id, quantity in requested.items():
+                product_map[product_id].quantity -= quantity
+            accepted.append((index, sale_data, timestamp))
+            results.append(None)  # filled in once the sale has an id
 
+        if accepted:
+            sale_ids = session.scalars(
+                insert(Sale).returning(Sale.id, sort_by_parameter_order=True),
+                [
+                    {
+                        "store_id": sale_data.store_id,
+                        "user_id": sale_data.user_id,
+                        "payment_method": sale_data.payment_method,
+                        "timestamp": timestamp,
+                    }
+                    for _, sale_data, timestamp in accepted
+                ],
+            ).all()
+            session.execute(
+                insert(ProductsSales),
+                [
+                    {
+                        "sale_id": sale_id,
+                        "product_id": product_data.product_id,
+                        "quantity": product_data.quantity,
+                    }
+                    for sale_id, (_, sale_data, _) in zip(sale_ids, accepted)
+                    for product_data in sale_data.products
+                ],
+            )
 
-def get_by_store_id(store_id: int, session: Session):
+            purchases: dict[int, list[Product]] = {}
+            for _, sale_data, _ in accepted:
+                if sale_data.user_id is not None:
+                    purchases.setdefault(sale_data.user_id, []).extend(
+                        product_map[p.product_id] for p in sale_data.products
+                    )
+            gain_points_from_purchases(store_id, purchases, session)
+
+            totals = [
+                (
+                    store_id,
+                    timestamp,
+                    sale_data.payment_method,
+                    [
+                        (product_map[p.product_id], p.quantity)
+                        for p in sale_data.products
+                    ],
+                )
+                for _, sale_data, timestamp in accepted
+            ]
+            store_daily_sales_crud.record_sales(totals, session)
+            product_sales_stats_crud.record_sales(totals, session)
+
+            for sale_id, (index, _, _) in zip(sale_ids, accepted):
+                results[index] = BatchSaleResult(
+                    index=index,
+                    successful=True,
+                    id=sale_id,
+                    message=f"Successfully created the Sale, which received id {sale_id}.",
+                )
+
+        if accepted:
+            catalogue.invalidate(session, store_id)
+            analytics.invalidate(session, store_id)
+        session.commit()
+        return results
+    except Exception:
+        session.rollback()
+        raise
+
+
+def _filter_by_time(query, start: datetime | None, end: datetime | None):
     """
-    Retrieves all sales from the database by their store ID.
+    Keeps only the sales of `query` made in `[start, end)`. Either bound can be `None`.
+    Raises:
+        HTTPException(400): If `start` is not before `end`.
+    """
+    if start is not None and end is not None and as_utc(start) >= as_utc(end):
+        raise HTTPException(400, "'from' must be before 'to'.")
+    if start is not None:
+        query = query.filter(Sale.timestamp >= as_utc(start))
+    if end is not None:
+        query = query.filter(Sale.timestamp < as_utc(end))
+    return query
+
+
+def get_by_store_id(
+    store_id: int,
+    session: Session,
+    limit: int | None = None,
+    offset: int = 0,
+    start: datetime | None = None,
+    end: datetime | None = None,
+):
+    """
+    Retrieves all sales from the database by their store ID, with their products already loaded.
     Args:
         store_id (int): The ID of the store.
         session (Session): The SQLAlchemy session to use for the query.
+        limit (int | None): The maximum amount of sales to return. `None` (default) returns all of them.
+        offset (int): How many sales to skip (ordered by ID). Defaults to 0.
+        start (datetime | None): If set, only sales made at or after this moment are returned. Naive datetimes are assumed to be in UTC.
+        end (datetime | None): If set, only sales made before this moment are returned. Naive datetimes are assumed to be in UTC.
     Returns:
         list[Sale]: A list for the sales with the store ID.
     Raises:
-        HTTPException(404): If the store with the specified ID does not exist.
+        HTTPException(400): If `start` is not before `end`.
     """
     sales = session.query(Sale).filter(Sale.store_id == store_id)
-    return sales.all()
+    return _paginate(_filter_by_time(sales, start, end), limit, offset)
 
 
-def get_all_by_store_owner(store_owner: User, session: Session):
+def get_all_by_store_owner(
+    store_owner: User,
+    session: Session,
+    limit: int | None = None,
+    offset: int = 0,
+    start: datetime | None = None,
+    end: datetime | None = None,
+):
     """
     Retrieves all sales for the store owned by the specified user.
     Args:
         store_owner (User): The user who owns the store.
         session (Session): The SQLAlchemy session to use for the query.
+        limit (int | None): The maximum amount of sales to return. `None` (default) returns all of them.
+        offset (int): How many sales to skip (ordered by ID). Defaults to 0.
+        start (datetime | None): If set, only sales made at or after this moment are returned.
+        end (datetime | None): If set, only sales made before this moment are returned.
     Returns:
         list[Sale]: A list of all sales for the store owned by the user.
     Raises:
@@ -147,4 +449,43 @@ def get_all_by_store_owner(store_owner: User, session: Session):
     import app.crud.store as stores_crud
 
     store_id = stores_crud.get_by_id(store_owner.store_id, session).id
-    return get_by_store_id(store_id, session)
+    return get_by_store_id(store_id, session, limit, offset, start, end)
+
+
+def stream_lines_by_store_id(
+    store_id: int,
+    session: Session,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    chunk_size: int = 1000,
+):
+    """
+    Streams every line (`ProductsSales` row joined with its `Sale`) of a store's sales, ordered by sale ID.
+
+    Rows are fetched from a server-side cursor `chunk_size` at a time, so memory use doesn't depend on the size
+    of the history. The returned result is only valid while `session` stays open.
+    Args:
+        store_id (int): The ID of the store.
+        session (Session): The SQLAlchemy session to use for the query.
+        start (datetime | None): If set, only sales made at or after this moment are included. Naive datetimes are assumed to be in UTC.
+        end (datetime | None): If set, only sales made before this moment are included. Naive datetimes are assumed to be in UTC.
+        chunk_size (int): How many rows to fetch per round trip. Defaults to 1000.
+    Returns:
+        Result: An iterable of `(sale_id, timestamp, user_id, payment_method, product_id, quantity)` rows.
+    Raises:
+        HTTPException(400): If `start` is not before `end`.
+    """
+    query = (
+        session.query(
+            Sale.id,
+            Sale.timestamp,
+            Sale.user_id,
+            Sale.payment_method,
+            ProductsSales.product_id,
+            ProductsSales.quantity,
+        )
+        .join(ProductsSales, ProductsSales.sale_id == Sale.id)
+        .filter(Sale.store_id == store_id)
+    )
+    query = _filter_by_time(query, start, end).order_by(Sale.id, ProductsSales.id)
+    return session.execute(query.statement.execution_options(yield_per=chunk_size))
@@ -0,0 +1,208 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.product import Product
+from app.models.stock_reservation import StockReservation
+
+
+def pending_expiry(timeout: int | None = None) -> datetime:
+    """
+    Args:
+        timeout (int | None): The store's `pending_order_timeout`, in minutes. If it's `None`,
+            `settings.reservation_ttl_minutes` is used.
+    Returns:
+        datetime: When a pending order's reservation made right now expires.
+    """
+    return datetime.now(timezone.utc) + timedelta(
+        minutes=timeout if timeout is not None else settings.reservation_ttl_minutes
+    )
+
+
+def get_by_order_id(order_id: int, session: Session) -> dict[int, float]:
+    """
+    Retrieves the stock currently reserved for an order.
+    Args:
+        order_id (int): The ID of the order.
+        session (Session): The SQLAlchemy session to use for the query.
+    Returns:
+        dict[int, float]: The reserved quantity of each product, keyed by product ID. Empty if the order has no
+            reservations (it was never placed, was cancelled/received, or its reservation expired).
+    """
+    rows = session.execute(
+        select(StockReservation.product_id, StockReservation.quantity).where(
+            StockReservation.order_id == order_id
+        )
+    )
+    return {int(product_id): quantity for product_id, quantity in rows}
+
+
+def add(
+    order_id: int,
+    quantities: dict[int, float],
+    session: Session,
+    expires_at: datetime | None,
+):
+    """
+    Inserts an order's reservation rows with a single multi-row insert.
+
+    This only records the reservations: the caller must have already added the quantities to the products'
+    `reserved_quantity` (after checking they were available), in the same transaction.
+    Args:
+        order_id (int): The ID of the order.
+        quantities (dict[int, float]): The quantity reserved of each product, keyed by product ID.
+        session (Session): The SQLAlchemy session to use for the insert.
+        expires_at (datetime | None): When the reservation expires. `None` keeps it until it's released.
+    """
+    now = datetime.now(timezone.utc)
+    session.execute(
+        insert(StockReservation),
+        [
+            {
+                "order_id": order_id,
+                "product_id": product_id,
+                "quantity": quantity,
+                "expires_at": expires_at,
+                "created_at": now,
+            }
+            for product_id, quantity in quantities.items()
+        ],
+    )
+
+
+def replace(
+    order_id: int,
+    quantities: dict[int, float],
+    session: Session,
+    expires_at: datetime | None,
+):
+    """
+    Replaces an order's reservation rows. Like `add`, the products' `reserved_quantity` must be adjusted by the caller.
+    Args:
+        order_id (int): The ID of the order.
+        quantities (dict[int, float]): The new quantity reserved of each product, keyed by product ID.
+        session (Session): The SQLAlchemy session to use for the update.
+        expires_at (datetime | None): When the reservation expires. `None` keeps it until it's released.
+    """
+    session.execute(
+        delete(StockReservation).where(StockReservation.order_id == order_id)
+    )
+    add(order_id, quantities, session, expires_at)
+
+
+def hold(order_id: int, session: Session) -> int:
+    """
+    Makes an order's reservation permanent (until it's released), e.g. once the store accepts the order.
+    Args:
+        order_id (int): The ID of the order.
+        session (Session): The SQLAlchemy session to use for the update.
+    Returns:
+        int: How many reservation rows the order had. 0 means there was nothing left to hold (e.g. it expired).
+    """
+    return session.execute(
+        update(StockReservation)
+        .where(StockReservation.order_id == order_id)
+        .values(expires_at=None)
+    ).rowcount
+
+
+def _release(condition, session: Session) -> set[int]:
+    products = Product.__table__
+    reservations = StockReservation.__table__
+
+    # lock the products involved in a stable order first, so releases can't deadlock with checkouts
+    session.execute(
+        select(products.c.id)
+        .where(products.c.id.in_(select(reservations.c.product_id).where(condition)))
+        .order_by(products.c.id)
+        .with_for_update()
+    )
+
+    released = (
+        delete(reservations)
+        .where(condition)
+        .returning(
+            reservations.c.order_id, reservations.c.product_id, reservations.c.quantity
+        )
+        .cte("released")
+    )
+    totals = (
+        select(released.c.product_id, func.sum(released.c.quantity).label("quantity"))
+        .group_by(released.c.product_id)
+        .cte("totals")
+    )
+    updated = (
+        update(products)
+        .where(products.c.id == totals.c.product_id)
+        .values(
+            reserved_quantity=func.greatest(
+                products.c.reserved_quantity - totals.c.quantity, 0
+            )
+        )
+        .returning(products.c.id)
+        .cte("updated")
+    )
+    # Postgres always runs data-modifying CTEs, even if the main query doesn't read them
+    stmt = select(released.c.order_id).distinct().add_cte(updated)
+    return set(session.scalars(stmt))
+
+
+def release(order_id: int, session: Session) -> bool:
+    """
+    Releases an order's reservation (it was cancelled or received), giving the stock back to the available stock.
+    Does not commit.
+    Args:
+        order_id (int): The ID of the order.
+        session (Session): The SQLAlchemy session to use for the update.
+    Returns:
+        bool: Whether the order had a reservation to release.
+    """
+    return bool(_release(StockReservation.__table__.c.order_id == order_id, session))
+
+
+def release_many(order_ids: set[int], session: Session) -> set[int]:
+    """
+    Releases the reservations of many orders at once (e.g. after cancelling them in bulk). Does not commit.
+    Args:
+        order_ids (set[int]): The IDs of the orders, which the caller should have locked.
+        session (Session): The SQLAlchemy session to use for the update.
+    Returns:
+        set[int]: The IDs of the orders that had a reservation to release.
+    """
+    if not order_ids:
+        return set()
+    return _release(StockReservation.__table__.c.order_id.in_(order_ids), session)
+
+
+def expired_order_ids():
+    """
+    Returns:
+        Select: A subquery of the IDs of the orders with an expired reservation, for use in `IN (...)`.
+    """
+    return select(StockReservation.order_id).where(
+        StockReservation.expires_at <= func.now()
+    )
+
+
+def release_expired(order_ids: set[int], session: Session) -> set[int]:
+    """
+    Releases the expired reservations of the given orders in bulk (one `DELETE ... RETURNING` feeding one
+    `UPDATE products`). Does not commit.
+    Args:
+        order_ids (set[int]): The IDs of the orders to release, which the caller should have locked.
+        session (Session): The SQLAlchemy session to use for the update.
+    Returns:
+        set[int]: The IDs of the orders whose reservations were released.
+    """
+    if not order_ids:
+        return set()
+    reservations = StockReservation.__table__
+    return _release(
+        and_(
+            reservations.c.order_id.in_(order_ids),
+            reservations.c.expires_at <= func.now(),
+        ),
+        session,
+    )
@@ -0,0 +1,158 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+from fastapi import HTTPException
+from sqlalchemy import Date, cast, delete, func, insert, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from ..models.product import Product
+from ..models.products_sales import ProductsSales
+from ..models.sale import Sale
+from ..models.store_daily_sales import StoreDailySales
+from ..utils import STORE_TIMEZONE
+
+SaleTotals = tuple[int, datetime, int, list[tuple[Product, float]]]
+"""
+`(store_id, timestamp, payment_method, [(product, quantity), ...])` for a sale that was just written.
+"""
+
+# timezone(INTERVAL '-03:00', ts) is ts in STORE_TIMEZONE
+_STORE_DAY = cast(func.timezone(text("INTERVAL '-03:00'"), Sale.timestamp), Date)
+
+
+def record_sales(sales: list[SaleTotals], session: Session):
+    """
+    Adds freshly written sales to the rollup with a single upsert. It does NOT commit: it is meant to run in the
+    same transaction as the sales (see `crud.sale.create`).
+
+    Args:
+        sales (list[SaleTotals]): The sales to add.
+        session (Session): The SQLAlchemy session to use for the query.
+    Returns:
+        None
+    """
+    totals: dict[tuple[int, date, int], list] = {}
+    for store_id, timestamp, payment_method, lines in sales:
+        key = (store_id, timestamp.astimezone(STORE_TIMEZONE).date(), payment_method)
+        row = totals.setdefault(key, [Decimal(0), 0.0, 0])
+        for product, quantity in lines:
+            row[0] += Decimal(product.price) * Decimal(str(quantity))
+            row[1] += quantity
+        row[2] += 1
+
+    if not totals:
+        return
+
+    stmt = pg_insert(StoreDailySales).values(
+        [
+            {
+                "store_id": store_id,
+                "day": day,
+                "payment_method": payment_method,
+                "revenue": revenue,
+                "units": units,
+                "sale_count": sale_count,
+            }
+            for (store_id, day, payment_method), (
+                revenue,
+                units,
+                sale_count,
+            ) in totals.items()
+        ]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[
+            StoreDailySales.store_id,
+            StoreDailySales.day,
+            StoreDailySales.payment_method,
+        ],
+        set_={
+            "revenue": StoreDailySales.revenue + stmt.excluded.revenue,
+            "units": StoreDailySales.units + stmt.excluded.units,
+            "sale_count": StoreDailySales.sale_count + stmt.excluded.sale_count,
+        },
+    )
+    session.execute(stmt)
+
+
+def get_by_store_id(
+    store_id: int,
+    session: Session,
+    start: date | None = None,
+    end: date | None = None,
+) -> list[StoreDailySales]:
+    """
+    Retrieves the rollup rows of a store, ordered by day.
+
+    Args:
+        store_id (int): The ID of the store.
+        session (Session): The SQLAlchemy session to use for the query.
+        start (date | None): If set, only days on or after this date are returned.
+        end (date | None): If set, only days on or before this date are returned.
+    Returns:
+        list[StoreDailySales]: The rollup rows (one per day and payment method).
+    Raises:
+        HTTPException(400): If `start` is after `end`.
+    """
+    if start is not None and end is not None and start > end:
+        raise HTTPException(400, "'from' cannot be after 'to'.")
+
+    query = session.query(StoreDailySales).filter(StoreDailySales.store_id == store_id)
+    if start is not None:
+        query = query.filter(StoreDailySales.day >= start)
+    if end is not None:
+        query = query.filter(StoreDailySales.day <= end)
+    return query.order_by(StoreDailySales.day, StoreDailySales.payment_method).all()
+
+
+def rebuild(session: Session, store_id: int | None = None) -> int:
+    """
+    Regenerates the rollup from the raw `sales` and `products_sales` data.
+
+    `products_sales` doesn't store the unit price, so the revenue is recomputed with the products' current prices.
+
+    Args:
+        session (Session): The SQLAlchemy session to use for the query.
+        store_id (int | None): If set, only that store's rows are rebuilt. Otherwise every store's are.
+    Returns:
+        int: The amount of rollup rows written.
+    """
+    try:
+        purge = delete(StoreDailySales)
+        source = (
+            select(
+                Sale.store_id,
+                _STORE_DAY,
+                Sale.payment_method,
+                func.sum(Product.price * ProductsSales.quantity),
+                func.sum(ProductsSales.quantity),
+                func.count(Sale.id.distinct()),
+            )
+            .join(ProductsSales, ProductsSales.sale_id == Sale.id)
+            .join(Product, Product.id == ProductsSales.product_id)
+            .group_by(Sale.store_id, _STORE_DAY, Sale.payment_method)
+        )
+        if store_id is not None:
+            purge = purge.where(StoreDailySales.store_id == store_id)
+            source = source.where(Sale.store_id == store_id)
+
+        session.execute(purge)
+        result = session.execute(
+            insert(StoreDailySales).from_select(
+                [
+                    StoreDailySales.store_id,
+                    StoreDailySales.day,
+                    StoreDailySales.payment_method,
+                    StoreDailySales.revenue,
+                    StoreDailySales.units,
+                    StoreDailySales.sale_count,
+                ],
+                source,
+            )
+        )
+        session.commit()
+        return result.rowcount
+    except Exception:
+        session.rollback()
+        raise
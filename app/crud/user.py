@@ -5,7 +5,7 @@ from ..models.user import User
 from fastapi import HTTPException
 
 from ..schemas.user import *
-from datetime import date
+from datetime import date, datetime, timezone
 from .sale import get_sales_by_user_id
 from typing import overload, Literal
 
@@ -14,7 +14,7 @@ from ..mailing import send_verification_code
 
 
 def is_anonymized(user: User):
-    return bool(user.email == "deleted@example.com")
+    return user.deleted_at is not None
 
 
 def get_all(session: Session, include_anonymized: bool = False):
@@ -22,13 +22,13 @@ def get_all(session: Session, include_anonymized: bool = False):
     Retrieves all users from the database.
     Args:
         session (Session): The SQLAlchemy session to use for the query.
-        include_anonymized (bool): Whether to include users anonymized as "Deleted User".
+        include_anonymized (bool): Whether to include anonymized (deleted) users.
     Returns:
         list[User]: A list of all users.
     """
     query = session.query(User)
     if not include_anonymized:
-        query = query.filter(User.first_names != "Deleted User")
+        query = query.filter(User.deleted_at.is_(None))
     users = query.all()
     return users
 
@@ -40,11 +40,11 @@ def get_by_id(id: int, session: Session, allow_anonymized: bool = False) -> User
     Args:
         id (int): The ID of the user to retrieve.
         session (Session): The SQLAlchemy session to use for the query.
-        allow_anonymized (bool): If set to `False`, a 404 error will be raised if the User with the specified ID is marked as `"Deleted User"`, just as if the user did not exist in the database. Default is `False`.
+        allow_anonymized (bool): If set to `False`, a 404 error will be raised if the User with the specified ID has been anonymized (its `deleted_at` is set), just as if the user did not exist in the database. Default is `False`.
     Returns:
         User: The user with the specified ID.
     Raises:
-        HTTPException(404): If the user with the specified ID does not exist, or is a `"Deleted User"` and `allow_anonymized` is set to `False`.
+        HTTPException(404): If the user with the specified ID does not exist, or has been anonymized and `allow_anonymized` is set to `False`.
     """
     user = session.get(User, id)
     if user is None or (is_anonymized(user) and not allow_anonymized):
@@ -60,7 +60,7 @@ def get_by_store_id(id: int, session: Session, allow_anonymized: bool = False):
     Args:
         id (int): The ID of the store.
         session (Session): The SQLAlchemy session to use for the query.
-        allow_anonymized (bool): If set to `False`, a 404 error will be raised if the User with the specified store ID is marked as `"Deleted User"`, just as if the user did not exist in the database. Default is `False`.
+        allow_anonymized (bool): If set to `False`, anonymized users (whose `deleted_at` is set) are left out. Default is `False`.
     Returns:
         list[User]: The users with the specified store ID.
     Raises:
@@ -69,8 +69,10 @@ def get_by_store_id(id: int, session: Session, allow_anonymized: bool = False):
     from . import store as stores_crud
 
     stores_crud.get_by_id(id, session)  # Ensure store exists
-    users = session.query(User).filter(User.store_id == id).all()
-    return users
+    users = session.query(User).filter(User.store_id == id)
+    if not allow_anonymized:
+        users = users.filter(User.deleted_at.is_(None))
+    return users.all()
 
 
 @overload
@@ -98,7 +100,11 @@ def get_by_email(email: str, session: Session, raise_404: bool = True) -> User |
     Raises:
         HTTPException: If the email is invalid (400) or if no user is found and raise_404 is True (404).
     """
-    user = session.query(User).filter(User.email == email).first()
+    user = (
+        session.query(User)
+        .filter(User.email == email, User.deleted_at.is_(None))
+        .first()
+    )
     if user is None and raise_404:
         raise HTTPException(404, f"No user found with the {email} email address.")
     return user
@@ -115,13 +121,9 @@ def get_all_by_store_id(id: int, session: Session):
     Raises:
         HTTPException(404): If the store with the specified ID does not exist.
     """
-    users = session.query(User).filter(User.store_id == id).all()
-    result: list[User] = []
-    for u in users:
-        if u.email != "deleted@example.com":
-            result.append(u)
-
-    return result
+    return (
+        session.query(User).filter(User.store_id == id, User.deleted_at.is_(None)).all()
+    )
 
 
 def create(user_data: UserCreate, session: Session):
@@ -216,6 +218,7 @@ def delete(id: int, session: Session):
         user.res_area = "Deleted User"
         user.store_id = None
         user.store_role = None
+        user.deleted_at = datetime.now(timezone.utc)
     else:
         session.delete(user)
 
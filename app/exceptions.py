@@ -12,6 +12,7 @@ def http_exception_handler(_: Request, ex: HTTPException):
         content=APIResponse(
             successful=False, data=str(ex), message=ex.detail
         ).model_dump(),
+        headers=ex.headers,
     )
 
 
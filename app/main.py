@@ -1,3 +1,5 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
@@ -21,6 +23,12 @@ from fastapi.responses import JSONResponse
 import cloudinary
 
 from app.models.product import Product
+from app.services import (
+    notifications,
+    order_events,
+    catalogue,
+)  # noqa: F401 (register their handlers)
+from app.services import scheduler, jobs  # noqa: F401 (registers the jobs)
 
 warnings.simplefilter("always", DeprecationWarning)
 cloudinary.config(
@@ -46,12 +54,22 @@ openapi_tags = [
 ]
 
 
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    notifications.start()
+    scheduler.start()
+    yield
+    scheduler.stop()
+    notifications.stop()
+
+
 app = FastAPI(
     title="Statill API",
     version="1.5.0",
     docs_url="/api/v1/docs",
     redoc_url="/api/v1/redoc",
     openapi_tags=openapi_tags,
+    lifespan=lifespan,
     swagger_ui_parameters={
         # "docExpansion": "none",
         "supportedSubmitMethods": [],
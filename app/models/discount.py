@@ -6,6 +6,7 @@ from sqlalchemy import (
     Date,
     CheckConstraint,
     ForeignKey,
+    Index,
 )
 from sqlalchemy.dialects.postgresql import ARRAY, BOOLEAN
 from sqlalchemy.orm import relationship
@@ -31,4 +32,6 @@ class Discount(Base):
     __table_args__ = (
         CheckConstraint("pct_off > 0 AND pct_off <= 100", name="pct_off_check"),
         CheckConstraint("array_length(days_usable, 1) = 7", name="days_usable_check"),
+        # a store's discounts are joined to its products by product_id (see crud.discount.get_all_by_store_id)
+        Index("ix_discounts_product_id", "product_id"),
     )
@@ -0,0 +1,38 @@
+from app.database.base import Base
+from sqlalchemy import (
+    Column,
+    BigInteger,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    UniqueConstraint,
+)
+from sqlalchemy.dialects.postgresql import JSONB
+
+
+class IdempotencyKey(Base):
+    """
+    An `Idempotency-Key` sent by a user to a create endpoint, and the response it got.
+
+    The row is inserted (and committed) before the request is processed, so a concurrent duplicate finds it and
+    doesn't process the request again; `status_code`/`response` stay NULL until the first request finishes.
+    """
+
+    __tablename__ = "idempotency_keys"
+    id = Column(BigInteger, primary_key=True)
+    user_id = Column(BigInteger, ForeignKey("users.id"), nullable=False)
+    key = Column(String(255), nullable=False)
+    endpoint = Column(String(100), nullable=False)  # ej. "POST /orders/"
+    request_hash = Column(String(64), nullable=False)  # sha256 del body
+    status_code = Column(Integer, nullable=True)
+    response = Column(JSONB, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+    # Constraints
+    __table_args__ = (
+        UniqueConstraint("user_id", "key", name="idempotency_keys_key"),
+        Index("ix_idempotency_keys_expires_at", "expires_at"),
+    )
@@ -1,6 +1,14 @@
 from app.database.base import Base
-from sqlalchemy import Column, Integer, BigInteger, CheckConstraint, ForeignKey, Enum
-from sqlalchemy.dialects.postgresql import TIME
+from sqlalchemy import (
+    Column,
+    Integer,
+    BigInteger,
+    CheckConstraint,
+    DateTime,
+    ForeignKey,
+    Enum,
+    Index,
+)
 from sqlalchemy.orm import relationship
 import enum
 
@@ -17,9 +25,9 @@ class Order(Base):
     id = Column(BigInteger, primary_key=True)
     user_id = Column(BigInteger, ForeignKey("users.id"), nullable=False)
     store_id = Column(BigInteger, ForeignKey("stores.id"), nullable=False)
-    created_at = Column(TIME(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)
     status = Column(Enum(StatusEnum, name="status_enum"), nullable=False)
-    received_at = Column(TIME(timezone=True), nullable=True)
+    received_at = Column(DateTime(timezone=True), nullable=True)
     payment_method = Column(Integer, nullable=False)
 
     # Relationships
@@ -30,4 +38,10 @@ class Order(Base):
     # Constraints
     __table_args__ = (
         CheckConstraint("payement_method IN (0,1,2,3)", name="payement_method_check"),
+        Index(
+            "ix_orders_store_id_status_created_at",
+            "store_id",
+            "status",
+            created_at.desc(),
+        ),
     )
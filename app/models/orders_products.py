@@ -1,5 +1,5 @@
 from app.database.base import Base
-from sqlalchemy import Column, Integer, BigInteger, ForeignKey
+from sqlalchemy import Column, Index, Integer, BigInteger, ForeignKey
 from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION
 from sqlalchemy.orm import relationship
 
@@ -14,3 +14,9 @@ class OrdersProducts(Base):
     # Relationships
     order = relationship("Order", back_populates="orders_products")
     product = relationship("Product", back_populates="orders_products")
+
+    # Constraints
+    __table_args__ = (
+        # crud.product.delete checks whether a product is referenced with EXISTS
+        Index("ix_orders_products_product_id", "product_id"),
+    )
@@ -1,11 +1,33 @@
 from app.database.base import Base
-from sqlalchemy import Column, String, Integer, BigInteger, Numeric, ForeignKey, Boolean
-from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION
-from sqlalchemy.orm import relationship
+from sqlalchemy import (
+    Column,
+    String,
+    Integer,
+    BigInteger,
+    Numeric,
+    ForeignKey,
+    Boolean,
+    Computed,
+    DateTime,
+    Index,
+)
+from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION, TSVECTOR
+from sqlalchemy.orm import deferred, relationship
 from app.models.store import Store
 from .products_sales import ProductsSales
 from .discount import Discount
 
+SEARCH_LANGUAGE = "spanish"
+SEARCH_VECTOR_EXPRESSION = (
+    f"setweight(to_tsvector('{SEARCH_LANGUAGE}', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(brand, '')), 'B') || "
+    f"setweight(to_tsvector('{SEARCH_LANGUAGE}', coalesce(\"desc\", '')), 'C')"
+)
+"""
+The products' full-text search document: the name weighs the most, then the brand (not stemmed) and then the
+description.
+"""
+
 
 class Product(Base):
     __tablename__ = "products"
@@ -17,12 +39,48 @@ class Product(Base):
     points_price = Column(Integer, nullable=True)
     type = Column(Integer, nullable=False)
     quantity = Column(DOUBLE_PRECISION, nullable=False)
+    # stock held by orders that haven't been received yet (see StockReservation)
+    reserved_quantity = Column(DOUBLE_PRECISION, nullable=False, default=0)
     desc = Column(String, nullable=False)
     hidden = Column(Boolean, nullable=False)
     barcode = Column(String)
+    # set when the product is deleted but kept (anonymized) because sales reference it; see crud.product.delete
+    deleted_at = Column(DateTime(timezone=True), nullable=True)
+    # maintained by Postgres; used by crud.product.search. Deferred so that it isn't loaded with the product
+    search_vector = deferred(
+        Column(TSVECTOR, Computed(SEARCH_VECTOR_EXPRESSION, persisted=True))
+    )
 
     # Relationships
     store = relationship("Store", back_populates="product")
     products_sales = relationship("ProductsSales", back_populates="product")
     discount = relationship("Discount", back_populates="product")
     orders_products = relationship("OrdersProducts", back_populates="product")
+
+    # Constraints
+    __table_args__ = (
+        # a barcode identifies a single product of its store (see crud.product.get_by_barcode)
+        Index(
+            "ix_products_store_id_barcode",
+            "store_id",
+            "barcode",
+            unique=True,
+            postgresql_where=barcode.is_not(None),
+        ),
+        # listing the live products (of a store, or all of them) is a scan of this index
+        Index(
+            "ix_products_store_id_live",
+            "store_id",
+            "id",
+            postgresql_where=deleted_at.is_(None),
+        ),
+        Index("ix_products_search_vector", search_vector, postgresql_using="gin"),
+        # typo-tolerant matching (pg_trgm's `%>`) of names and brands
+        Index(
+            "ix_products_name_brand_trgm",
+            "name",
+            "brand",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops", "brand": "gin_trgm_ops"},
+        ),
+    )
@@ -0,0 +1,53 @@
+from app.database.base import Base
+from sqlalchemy import (
+    Column,
+    BigInteger,
+    Date,
+    DateTime,
+    Numeric,
+    ForeignKey,
+    Index,
+    UniqueConstraint,
+)
+from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION
+
+
+class ProductSalesTotal(Base):
+    """
+    Running all-time sales counters of a product. Kept up to date by `crud.sale` whenever `ProductsSales` rows are written.
+    """
+
+    __tablename__ = "product_sales_totals"
+    id = Column(BigInteger, primary_key=True)
+    product_id = Column(
+        BigInteger, ForeignKey("products.id"), nullable=False, unique=True
+    )
+    store_id = Column(BigInteger, ForeignKey("stores.id"), nullable=False)
+    units = Column(DOUBLE_PRECISION, nullable=False, default=0)
+    revenue = Column(Numeric(14, 2), nullable=False, default=0)
+    last_sold_at = Column(DateTime(timezone=True), nullable=False)
+
+    # Constraints
+    __table_args__ = (
+        Index("ix_product_sales_totals_store_id_units", "store_id", "units"),
+    )
+
+
+class ProductDailySales(Base):
+    """
+    Sales counters of a product for a single day (in `utils.STORE_TIMEZONE`). Used for the 7 and 30 day rankings.
+    """
+
+    __tablename__ = "product_daily_sales"
+    id = Column(BigInteger, primary_key=True)
+    product_id = Column(BigInteger, ForeignKey("products.id"), nullable=False)
+    store_id = Column(BigInteger, ForeignKey("stores.id"), nullable=False)
+    day = Column(Date, nullable=False)
+    units = Column(DOUBLE_PRECISION, nullable=False, default=0)
+    revenue = Column(Numeric(14, 2), nullable=False, default=0)
+
+    # Constraints
+    __table_args__ = (
+        UniqueConstraint("product_id", "day", name="product_daily_sales_key"),
+        Index("ix_product_daily_sales_store_id_day", "store_id", "day"),
+    )
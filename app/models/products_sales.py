@@ -1,5 +1,5 @@
 from app.database.base import Base
-from sqlalchemy import Column, BigInteger, ForeignKey
+from sqlalchemy import Column, Index, BigInteger, ForeignKey
 from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION
 from sqlalchemy.orm import relationship
 
@@ -14,3 +14,9 @@ class ProductsSales(Base):
     # Relationships
     sale = relationship("Sale", back_populates="products_sales")
     product = relationship("Product", back_populates="products_sales")
+
+    # Constraints
+    __table_args__ = (
+        # crud.product.delete checks whether a product is referenced with EXISTS
+        Index("ix_products_sales_product_id", "product_id"),
+    )
@@ -1,5 +1,13 @@
 from app.database.base import Base
-from sqlalchemy import Column, Integer, BigInteger, CheckConstraint, ForeignKey, String
+from sqlalchemy import (
+    Column,
+    Integer,
+    BigInteger,
+    CheckConstraint,
+    ForeignKey,
+    DateTime,
+    Index,
+)
 from datetime import datetime, timezone
 from sqlalchemy.orm import relationship
 from .products_sales import ProductsSales
@@ -13,8 +21,8 @@ class Sale(Base):
     user_id = Column(BigInteger, ForeignKey("users.id"), nullable=True)
     payment_method = Column(Integer, nullable=False)
     timestamp = Column(
-        String(32),
-        default=lambda: datetime.now(timezone.utc).isoformat(),
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
         nullable=False,
     )
     # Relationships
@@ -25,4 +33,5 @@ class Sale(Base):
     # Constraints
     __table_args__ = (
         CheckConstraint("payment_method IN (0, 1, 2, 3)", name="payment_method_check"),
+        Index("ix_sales_store_id_timestamp", "store_id", "timestamp"),
     )
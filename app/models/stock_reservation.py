@@ -0,0 +1,39 @@
+from app.database.base import Base
+from sqlalchemy import (
+    Column,
+    BigInteger,
+    DateTime,
+    ForeignKey,
+    Index,
+    UniqueConstraint,
+)
+from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION
+from datetime import datetime, timezone
+
+
+class StockReservation(Base):
+    """
+    Stock held for an order that hasn't been received yet: one row per order and product.
+
+    `Product.reserved_quantity` is the sum of a product's reservations, maintained by `crud.stock_reservation` in
+    the same transactions, so a product's available stock (`quantity - reserved_quantity`) is read from its own row.
+    Reservations of pending orders expire (`expires_at`); those of accepted orders don't (`expires_at` is NULL).
+    """
+
+    __tablename__ = "stock_reservations"
+    id = Column(BigInteger, primary_key=True)
+    order_id = Column(BigInteger, ForeignKey("orders.id"), nullable=False)
+    product_id = Column(BigInteger, ForeignKey("products.id"), nullable=False)
+    quantity = Column(DOUBLE_PRECISION, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(
+        DateTime(timezone=True),
+        nullable=False,
+        default=lambda: datetime.now(timezone.utc),
+    )
+
+    # Constraints
+    __table_args__ = (
+        UniqueConstraint("order_id", "product_id", name="stock_reservations_key"),
+        Index("ix_stock_reservations_expires_at", "expires_at"),
+    )
@@ -26,6 +26,8 @@ class Store(Base):
     opening_times = Column(ARRAY(TIME(timezone=True)), nullable=False)
     closing_times = Column(ARRAY(TIME(timezone=True)), nullable=False)
     payment_methods = Column(ARRAY(BOOLEAN), nullable=False)
+    # minutos tras los que se cancela un pedido pendiente; NULL = nunca (solo vence la reserva de stock)
+    pending_order_timeout = Column(Integer, nullable=True)
 
     # Relationships
     order = relationship("Order", back_populates="store")
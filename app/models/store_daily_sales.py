@@ -0,0 +1,38 @@
+from app.database.base import Base
+from sqlalchemy import (
+    Column,
+    Integer,
+    BigInteger,
+    Date,
+    Numeric,
+    ForeignKey,
+    UniqueConstraint,
+)
+from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION
+
+
+class StoreDailySales(Base):
+    """
+    Rollup of a store's sales: one row per store, day and payment method.
+
+    It is kept up to date by `crud.sale` in the same transaction as the sales themselves, and can be regenerated
+    from the raw data with `crud.store_daily_sales.rebuild`.
+    """
+
+    __tablename__ = "store_daily_sales"
+    id = Column(BigInteger, primary_key=True)
+    store_id = Column(BigInteger, ForeignKey("stores.id"), nullable=False)
+    day = Column(
+        Date, nullable=False
+    )  # en la hora de Argentina, ver utils.STORE_TIMEZONE
+    payment_method = Column(Integer, nullable=False)
+    revenue = Column(Numeric(14, 2), nullable=False, default=0)
+    units = Column(DOUBLE_PRECISION, nullable=False, default=0)
+    sale_count = Column(Integer, nullable=False, default=0)
+
+    # Constraints
+    __table_args__ = (
+        UniqueConstraint(
+            "store_id", "day", "payment_method", name="store_daily_sales_key"
+        ),
+    )
@@ -1,5 +1,14 @@
 from app.database.base import Base
-from sqlalchemy import Column, String, BigInteger, Date, Enum, Boolean
+from sqlalchemy import (
+    Column,
+    String,
+    BigInteger,
+    Date,
+    DateTime,
+    Enum,
+    Boolean,
+    Index,
+)
 import enum
 from sqlalchemy.orm import relationship
 from .sale import Sale
@@ -38,6 +47,8 @@ class User(Base):
     email_verified = Column(
         Boolean, nullable=False, default=False
     )  # email verification
+    # set when the user is deleted but kept (anonymized) because sales reference them; see crud.user.delete
+    deleted_at = Column(DateTime(timezone=True), nullable=True)
 
     # Relationships
     order = relationship("Order", back_populates="user")
@@ -47,3 +58,12 @@ class User(Base):
     verification_codes = relationship(
         "VerificationCode", back_populates="user", cascade="all, delete-orphan"
     )
+
+    # Constraints
+    __table_args__ = (
+        # listing the live users (of a store) and logging in only scan live rows
+        Index(
+            "ix_users_store_id_live", "store_id", postgresql_where=deleted_at.is_(None)
+        ),
+        Index("ix_users_email_live", "email", postgresql_where=deleted_at.is_(None)),
+    )
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
 from app.schemas.general import APIResponse
 from typing import Annotated
 from .custom_types import PositiveInt, NonEmptyStr
@@ -18,6 +18,13 @@ class DiscountRead(BaseModel):
         INTEGER_MAX_VALUE  # estos dos después se chequean para ver que max no sea < min
     )
 
+    @field_validator("start_date", "end_date", mode="before")
+    @classmethod
+    def convert_date_to_str(cls, v):
+        if isinstance(v, date):
+            return v.isoformat()
+        return v
+
     class Config:
         from_attributes = True
 
@@ -1,6 +1,7 @@
 from typing import Literal, Optional
-from pydantic import BaseModel, field_validator, Field
+from pydantic import BaseModel, field_validator, model_validator, Field
 from app.schemas.general import APIResponse
+from app.schemas.discount import DiscountRead
 from .custom_types import (
     PositiveInt,
     NonEmptyStr,
@@ -21,6 +22,7 @@ class ProductRead(BaseModel):
     points_price: Optional[PositiveInt]
     type: UnsignedInt
     quantity: NonNegativeFloat
+    reserved_quantity: NonNegativeFloat = 0
     desc: NonEmptyStr
     hidden: bool | None
     barcode: NonEmptyStr | None
@@ -74,3 +76,127 @@ class GetAllProductsResponse(APIResponse):
 class GetProductResponse(APIResponse):
     successful: Literal[True]
     data: ProductRead
+
+
+class PricedProduct(BaseModel):
+    """
+    A product with its price today.
+    Attributes:
+        product (ProductRead): The product.
+        effective_price (float): The price of a unit when `discount` applies, or the product's price if it's `None`.
+        discount (DiscountRead | None): The product's best discount usable today (it may require buying between its `min_amount` and `max_amount` units), if any.
+    """
+
+    product: ProductRead
+    effective_price: NonNegativeFloat
+    discount: DiscountRead | None
+
+
+class GetPricedProductsResponse(APIResponse):
+    successful: Literal[True]
+    data: list[PricedProduct]
+
+
+class TopProduct(BaseModel):
+    product: ProductRead
+    units: NonNegativeFloat
+    revenue: float
+    last_sold_at: NonEmptyStr
+
+
+class GetTopProductsResponse(APIResponse):
+    successful: Literal[True]
+    data: list[TopProduct]
+
+
+class ProductImportError(BaseModel):
+    """
+    A row of a `POST /products/import` upload that wasn't imported.
+    Attributes:
+        row (int): The number of the row in the upload (1 is the first product, not counting a CSV header).
+        message (str): Why it wasn't imported.
+    """
+
+    row: PositiveInt
+    message: NonEmptyStr
+
+
+class ProductImportResult(BaseModel):
+    """
+    The result of a `POST /products/import` upload.
+    Attributes:
+        created (int): How many products were created.
+        updated (int): How many existing products (matched by barcode) were updated.
+        failed (int): How many rows weren't imported.
+        errors (list[ProductImportError]): Why each row wasn't imported, for up to the first `MAX_REPORTED_ERRORS` of them.
+    """
+
+    created: UnsignedInt
+    updated: UnsignedInt
+    failed: UnsignedInt
+    errors: list[ProductImportError]
+
+
+class ImportProductsResponse(APIResponse):
+    data: ProductImportResult
+
+
+class StockCount(BaseModel):
+    """
+    The counted quantity of one product in a stock take. The product is identified by either its ID or its barcode.
+    Attributes:
+        product_id (int | None): The ID of the product.
+        barcode (str | None): The barcode of the product, if `product_id` isn't set.
+        counted_quantity (float): How much of the product was counted.
+    """
+
+    product_id: PositiveInt | None = None
+    barcode: NonEmptyStr | None = None
+    counted_quantity: NonNegativeFloat
+
+    @model_validator(mode="after")
+    def check_product_is_identified(self):
+        if (self.product_id is None) == (self.barcode is None):
+            raise ValueError("Exactly one of product_id and barcode must be set.")
+        return self
+
+
+class StockTake(BaseModel):
+    counts: Annotated[list[StockCount], Field(min_length=1, max_length=100_000)]
+
+
+class StockVariance(BaseModel):
+    """
+    How a product's stock changed in a stock take.
+    Attributes:
+        product_id (int): The ID of the product.
+        barcode (str | None): The barcode of the product.
+        previous_quantity (float): The quantity the product had before the stock take.
+        counted_quantity (float): The counted quantity, which is its quantity now.
+        variance (float): `counted_quantity - previous_quantity` (negative if stock was missing).
+    """
+
+    product_id: PositiveInt
+    barcode: NonEmptyStr | None
+    previous_quantity: NonNegativeFloat
+    counted_quantity: NonNegativeFloat
+    variance: float
+
+
+class StockTakeResult(BaseModel):
+    """
+    The result of a stock take.
+    Attributes:
+        counted (int): How many products were counted.
+        adjusted (int): How many of them had a different quantity than the counted one.
+        variances (list[StockVariance]): The variance of each counted product, in the order they were sent.
+    """
+
+    counted: UnsignedInt
+    adjusted: UnsignedInt
+    variances: list[StockVariance]
+
+
+class StockTakeResponse(APIResponse):
+    successful: Literal[True]
+    data: StockTakeResult
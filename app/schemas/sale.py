@@ -1,7 +1,15 @@
+from datetime import datetime
+
 from pydantic import BaseModel, Field
 from app.schemas.general import APIResponse
 from typing import Annotated
-from .custom_types import PositiveInt, NonEmptyStr, NonNegativeFloat, Gt0Float
+from .custom_types import (
+    PositiveInt,
+    NonEmptyStr,
+    NonNegativeFloat,
+    Gt0Float,
+    UnsignedInt,
+)
 
 
 class ProductSale(BaseModel):
@@ -31,9 +39,83 @@ class SaleCreate(BaseModel):
         from_attributes = True
 
 
+class BatchSaleCreate(SaleCreate):
+    """
+    A sale of a `POST /sales/batch` request.
+    Attributes:
+        timestamp (datetime | None): When the sale was rung up (e.g. while the POS was offline). Timestamps without a
+            timezone are taken as UTC. If it isn't set, the sale is timestamped when it's received.
+    """
+
+    timestamp: datetime | None = None
+
+
 class GetAllSalesResponse(APIResponse):
     data: list[SaleRead]
 
 
 class GetSaleResponse(APIResponse):
     data: SaleRead
+
+
+class BatchSaleResult(BaseModel):
+    """
+    The result of a single record of a `POST /sales/batch` request.
+    Attributes:
+        index (int): The position of the record in the request.
+        successful (bool): Whether the sale was created.
+        id (int | None): The ID of the created sale, or `None` if it was rejected.
+        message (str): A message explaining the result.
+    """
+
+    index: UnsignedInt
+    successful: bool
+    id: PositiveInt | None
+    message: NonEmptyStr
+
+
+class CreateSalesBatchResponse(APIResponse):
+    data: list[BatchSaleResult]
+
+
+class PaymentMethodSummary(BaseModel):
+    payment_method: Annotated[int, Field(ge=0, le=3)]
+    revenue: float
+    units: NonNegativeFloat
+    sale_count: UnsignedInt
+
+
+class DailySalesSummary(BaseModel):
+    day: NonEmptyStr  # ISO date, in Argentina's timezone
+    revenue: float
+    units: NonNegativeFloat
+    sale_count: UnsignedInt
+    by_payment_method: list[PaymentMethodSummary]
+
+
+class SalesSummary(BaseModel):
+    revenue: float
+    units: NonNegativeFloat
+    sale_count: UnsignedInt
+    days: list[DailySalesSummary]
+
+
+class GetSalesSummaryResponse(APIResponse):
+    data: SalesSummary
+
+
+class AnalyticsBucket(BaseModel):
+    key: int
+    revenue: float
+    units: NonNegativeFloat
+
+
+class SalesAnalytics(BaseModel):
+    by_hour: list[AnalyticsBucket]  # 0 a 23, en la hora de Argentina
+    by_weekday: list[AnalyticsBucket]  # 0 (lunes) a 6 (domingo)
+    by_type: list[AnalyticsBucket]  # key = Product.type
+    by_payment_method: list[AnalyticsBucket]
+
+
+class GetSalesAnalyticsResponse(APIResponse):
+    data: SalesAnalytics
@@ -0,0 +1,19 @@
+from typing import Literal, Optional
+from pydantic import BaseModel
+from app.schemas.general import APIResponse
+
+
+class JobStatsRead(BaseModel):
+    name: str
+    runs: int
+    failures: int
+    rows_total: int
+    last_rows: Optional[int]
+    last_duration: Optional[float]  # segundos
+    last_run_at: Optional[str]
+    last_error: Optional[str]
+
+
+class GetJobStatsResponse(APIResponse):
+    successful: Literal[True]
+    data: list[JobStatsRead]
@@ -19,6 +19,9 @@ class StoreRead(BaseModel):
     opening_times: Annotated[list[time | None], Field(min_length=7, max_length=7)]
     closing_times: Annotated[list[time | None], Field(min_length=7, max_length=7)]
     payment_methods: Annotated[list[bool], Field(min_length=4, max_length=4)]
+    pending_order_timeout: Optional[PositiveInt] = (
+        None  # Minutos tras los que se cancelan los pedidos pendientes (None = nunca)
+    )
     # user_id: PositiveInt
 
     class Config:
@@ -36,6 +39,9 @@ class StoreCreate(BaseModel):
     opening_times: Annotated[list[time | None], Field(min_length=7, max_length=7)]
     closing_times: Annotated[list[time | None], Field(min_length=7, max_length=7)]
     payment_methods: Annotated[list[bool], Field(min_length=4, max_length=4)]
+    pending_order_timeout: Optional[PositiveInt] = (
+        None  # Minutos tras los que se cancelan los pedidos pendientes (None = nunca)
+    )
 
     class Config:
         from_attributes = True
@@ -52,6 +58,9 @@ class StoreUpdate(BaseModel):
     opening_times: Annotated[list[time | None], Field(min_length=7, max_length=7)]
     closing_times: Annotated[list[time | None], Field(min_length=7, max_length=7)]
     payment_methods: Annotated[list[bool], Field(min_length=4, max_length=4)]
+    pending_order_timeout: Optional[PositiveInt] = (
+        None  # Minutos tras los que se cancelan los pedidos pendientes (None = nunca)
+    )
 
     class Config:
         from_attributes = True
@@ -0,0 +1,219 @@
+"""
+In-process, vectorized analytics over a store's sales.
+
+A store's sales lines are loaded once into columnar NumPy arrays and kept in a per-store cache, so the dashboard's
+group-bys (revenue by hour, weekday, product type and payment method) are a few `np.bincount` calls instead of Python
+loops over ORM objects. `crud.sale` invalidates a store's entry whenever it writes new sales for it, and `crud.product`
+whenever a product's price or type changes, inside the transaction that makes the change. Once it commits, the entry
+is dropped in this worker right away and in every other worker when the notification reaches it (see
+`notifications`).
+
+The cache lives in the worker's memory: every worker keeps its own copy. Entries are also dropped after `MAX_AGE`
+seconds and whenever the notification listener reconnects, in case a notification was lost.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from sqlalchemy import event, extract, select
+from sqlalchemy.orm import Session
+
+from ..models.product import Product
+from ..models.products_sales import ProductsSales
+from ..models.sale import Sale
+from ..utils import STORE_TIMEZONE
+from . import notifications
+
+CHANNEL = "analytics_invalidations"
+MAX_CACHED_STORES = 32
+MAX_AGE = 300  # seconds
+
+_STORE_UTC_OFFSET = int(STORE_TIMEZONE.utcoffset(None).total_seconds())
+_EPOCH_WEEKDAY = 3  # 1970-01-01 fue jueves (lunes = 0)
+
+
+class StoreSalesColumns:
+    """
+    A store's sales lines as parallel NumPy arrays (one element per `ProductsSales` row).
+
+    Attributes:
+        timestamps (np.ndarray): Unix timestamps (seconds) of the sales, as `int64`.
+        product_ids (np.ndarray): The IDs of the products sold, as `int64`.
+        product_types (np.ndarray): The `type` of the products sold, as `int64`.
+        quantities (np.ndarray): The quantities sold, as `float64`.
+        prices (np.ndarray): The products' unit prices, as `float64`.
+        payment_methods (np.ndarray): The sales' payment methods, as `int64`.
+        loaded_at (float): When they were loaded (`time.monotonic()`).
+    """
+
+    def __init__(self, rows: list[tuple]):
+        columns = list(zip(*rows)) if rows else [[] for _ in range(6)]
+        self.timestamps = np.array(columns[0], dtype=np.float64).astype(np.int64)
+        self.product_ids = np.array(columns[1], dtype=np.int64)
+        self.product_types = np.array(columns[2], dtype=np.int64)
+        self.quantities = np.array(columns[3], dtype=np.float64)
+        self.prices = np.array(columns[4], dtype=np.float64)
+        self.payment_methods = np.array(columns[5], dtype=np.int64)
+        self.loaded_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.timestamps)
+
+
+_cache: OrderedDict[int, StoreSalesColumns] = OrderedDict()
+_generations: dict[int, int] = {}
+_lock = threading.Lock()
+
+_SESSION_KEY = "analytics_invalidations"
+
+
+def _drop(store_id: int):
+    with _lock:
+        _cache.pop(store_id, None)
+        _generations[store_id] = _generations.get(store_id, 0) + 1
+
+
+def _drop_all():
+    with _lock:
+        for store_id in _cache:
+            _generations[store_id] = _generations.get(store_id, 0) + 1
+        _cache.clear()
+
+
+def invalidate(session: Session, store_id: int):
+    """
+    Drops the cached columns of a store in every worker once the session's transaction commits, so that the next
+    query reloads them.
+
+    Args:
+        session (Session): The SQLAlchemy session whose transaction changes the store's sales.
+        store_id (int): The ID of the store.
+    """
+    pending = session.info.setdefault(_SESSION_KEY, set())
+    store_id = int(store_id)
+    if store_id not in pending:
+        notifications.notify(session, CHANNEL, {"store_id": store_id})
+        pending.add(store_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session: Session):
+    for store_id in session.info.pop(_SESSION_KEY, ()):
+        _drop(store_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session: Session):
+    session.info.pop(_SESSION_KEY, None)
+
+
+notifications.subscribe(CHANNEL, lambda payload: _drop(int(payload["store_id"])))
+notifications.on_connect(_drop_all)
+
+
+def load(store_id: int, session: Session) -> StoreSalesColumns:
+    """
+    Loads a store's sales lines from the database with a single query.
+
+    `products_sales` doesn't store the unit price, so the products' current prices are used.
+
+    Args:
+        store_id (int): The ID of the store.
+        session (Session): The SQLAlchemy session to use for the query.
+    Returns:
+        StoreSalesColumns: The store's sales lines.
+    """
+    stmt = (
+        select(
+            extract("epoch", Sale.timestamp),
+            ProductsSales.product_id,
+            Product.type,
+            ProductsSales.quantity,
+            Product.price,
+            Sale.payment_method,
+        )
+        .join(ProductsSales, ProductsSales.sale_id == Sale.id)
+        .join(Product, Product.id == ProductsSales.product_id)
+        .where(Sale.store_id == store_id)
+    )
+    return StoreSalesColumns(session.execute(stmt).all())
+
+
+def get_columns(store_id: int, session: Session) -> StoreSalesColumns:
+    """
+    Returns a store's sales lines, from the cache if they are there (and aren't older than `MAX_AGE`) or from the
+    database otherwise.
+
+    Args:
+        store_id (int): The ID of the store.
+        session (Session): The SQLAlchemy session to use if the columns have to be loaded.
+    Returns:
+        StoreSalesColumns: The store's sales lines.
+    """
+    with _lock:
+        columns = _cache.get(store_id)
+        if columns is not None and time.monotonic() - columns.loaded_at > MAX_AGE:
+            _cache.pop(store_id)
+            columns = None
+        if columns is not None:
+            _cache.move_to_end(store_id)
+            return columns
+        generation = _generations.get(store_id, 0)
+
+    columns = load(store_id, session)
+
+    with _lock:
+        # si se invalidó mientras se cargaba, lo que se cargó puede estar viejo: no se guarda
+        if _generations.get(store_id, 0) == generation:
+            _cache[store_id] = columns
+            _cache.move_to_end(store_id)
+            while len(_cache) > MAX_CACHED_STORES:
+                _cache.popitem(last=False)
+    return columns
+
+
+def _group(keys: np.ndarray, revenue: np.ndarray, units: np.ndarray, size: int):
+    return [
+        {"key": key, "revenue": float(r), "units": float(u)}
+        for key, (r, u) in enumerate(
+            zip(
+                np.bincount(keys, weights=revenue, minlength=size),
+                np.bincount(keys, weights=units, minlength=size),
+            )
+        )
+    ]
+
+
+def summarize(columns: StoreSalesColumns) -> dict[str, list[dict]]:
+    """
+    Computes the revenue and units sold of a store grouped by hour of the day, weekday, product type and payment method.
+
+    Hours and weekdays are in `utils.STORE_TIMEZONE`; weekdays go from 0 (Monday) to 6 (Sunday).
+
+    Args:
+        columns (StoreSalesColumns): The store's sales lines.
+    Returns:
+        dict[str, list[dict]]: For each of `"by_hour"`, `"by_weekday"`, `"by_type"` and `"by_payment_method"`, a list of `{"key", "revenue", "units"}` buckets.
+    """
+    revenue = columns.prices * columns.quantities
+    units = columns.quantities
+
+    local = columns.timestamps + _STORE_UTC_OFFSET
+    hours = (local // 3600) % 24
+    weekdays = (local // 86400 + _EPOCH_WEEKDAY) % 7
+
+    types, type_index = np.unique(columns.product_types, return_inverse=True)
+    by_type = _group(type_index, revenue, units, len(types))
+    for bucket in by_type:
+        bucket["key"] = int(types[bucket["key"]])
+
+    return {
+        "by_hour": _group(hours, revenue, units, 24),
+        "by_weekday": _group(weekdays, revenue, units, 7),
+        "by_type": by_type,
+        "by_payment_method": _group(columns.payment_methods, revenue, units, 4),
+    }
@@ -0,0 +1,85 @@
+"""
+Per-store barcode -> product ID maps, so a POS scan resolves its product without searching the store's catalogue.
+
+A store's map is loaded with one query the first time one of its barcodes is scanned and kept in a per-store cache.
+`crud.product` invalidates a store's entry whenever it creates, updates or deletes one of its products.
+
+The cache lives in the worker's memory: every worker keeps (and invalidates) its own copy, so a map may be stale if
+another worker changed the store's products. `crud.product.get_by_barcode` checks every hit against the product it
+loads and falls back to the database on misses, so a stale map only costs an extra query.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..models.product import Product
+
+MAX_CACHED_STORES = 256
+
+_cache: OrderedDict[int, dict[str, int]] = OrderedDict()
+_generations: dict[int, int] = {}
+_lock = threading.Lock()
+
+
+def invalidate(store_id: int):
+    """
+    Drops the cached barcode map of a store, so that the next scan reloads it.
+
+    Args:
+        store_id (int): The ID of the store.
+    """
+    with _lock:
+        _cache.pop(store_id, None)
+        _generations[store_id] = _generations.get(store_id, 0) + 1
+
+
+def load(store_id: int, session: Session) -> dict[str, int]:
+    """
+    Loads a store's barcodes from the database with a single query.
+
+    Args:
+        store_id (int): The ID of the store.
+        session (Session): The SQLAlchemy session to use for the query.
+    Returns:
+        dict[str, int]: The ID of the product with each barcode, keyed by barcode.
+    """
+    rows = session.execute(
+        select(Product.barcode, Product.id).where(
+            Product.store_id == store_id, Product.barcode.is_not(None)
+        )
+    )
+    return {barcode: int(product_id) for barcode, product_id in rows}
+
+
+def get_map(store_id: int, session: Session) -> dict[str, int]:
+    """
+    Returns a store's barcode map, from the cache if it's there or from the database otherwise.
+
+    Args:
+        store_id (int): The ID of the store.
+        session (Session): The SQLAlchemy session to use if the map has to be loaded.
+    Returns:
+        dict[str, int]: The ID of the product with each barcode, keyed by barcode. It must not be modified.
+    """
+    with _lock:
+        barcodes = _cache.get(store_id)
+        if barcodes is not None:
+            _cache.move_to_end(store_id)
+            return barcodes
+        generation = _generations.get(store_id, 0)
+
+    barcodes = load(store_id, session)
+
+    with _lock:
+        # if it was invalidated while loading, what was loaded may be stale: don't keep it
+        if _generations.get(store_id, 0) == generation:
+            _cache[store_id] = barcodes
+            _cache.move_to_end(store_id)
+            while len(_cache) > MAX_CACHED_STORES:
+                _cache.popitem(last=False)
+    return barcodes
@@ -0,0 +1,198 @@
+"""
+Per-store cache of the serialized product catalogue (`GET /products/store/{id}`), with a strong ETag.
+
+A store's catalogue is loaded with one query, serialized once and kept as bytes, along with an ETag that is the hash
+of those bytes (so every worker computes the same one for the same catalogue). Requests whose `If-None-Match` has
+the cached ETag are answered with a `304` without touching the database; the rest get the cached bytes.
+
+Whatever changes a store's products (`crud.product` writes, sales, and the stock reservations of orders) or their
+discounts calls `invalidate()` inside its transaction; discounts count too because `pricing` keeps its cache only
+while this one's entry is unchanged. Once the transaction commits, the store's entry is dropped in this worker
+right away and in every other worker when the notification reaches it (see `notifications`). Entries are also
+dropped after `MAX_AGE` seconds and whenever the notification listener reconnects, in case a notification was lost.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from ..models.product import Product
+from ..schemas.product import GetAllProductsResponse, ProductRead
+from . import notifications
+
+CHANNEL = "catalogue_invalidations"
+MAX_CACHED_STORES = 256
+MAX_AGE = 300  # seconds
+
+_SESSION_KEY = "catalogue_invalidations"
+
+
+class CatalogueEntry:
+    """
+    A store's serialized catalogue.
+
+    Attributes:
+        body (bytes): The JSON body of the `GetAllProductsResponse`.
+        etag (str): A strong ETag of the body (quoted, as sent in the `ETag` header).
+        loaded_at (float): When it was loaded (`time.monotonic()`).
+    """
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        self.loaded_at = time.monotonic()
+
+
+_cache: OrderedDict[int, CatalogueEntry] = OrderedDict()
+_generations: dict[int, int] = {}
+_lock = threading.Lock()
+
+
+def _drop(store_id: int):
+    with _lock:
+        _cache.pop(store_id, None)
+        _generations[store_id] = _generations.get(store_id, 0) + 1
+
+
+def _drop_all():
+    with _lock:
+        for store_id in _cache:
+            _generations[store_id] = _generations.get(store_id, 0) + 1
+        _cache.clear()
+
+
+def invalidate(session: Session, store_id: int):
+    """
+    Drops a store's cached catalogue in every worker once the session's transaction commits.
+
+    Args:
+        session (Session): The SQLAlchemy session whose transaction changes the store's products.
+        store_id (int): The ID of the store.
+    """
+    invalidate_many(session, {store_id})
+
+
+def invalidate_many(session: Session, store_ids: set[int]):
+    """
+    Like `invalidate`, for many stores at once.
+
+    Args:
+        session (Session): The SQLAlchemy session whose transaction changes the stores' products.
+        store_ids (set[int]): The IDs of the stores.
+    """
+    pending = session.info.setdefault(_SESSION_KEY, set())
+    for store_id in sorted(int(store_id) for store_id in store_ids):
+        if store_id not in pending:
+            notifications.notify(session, CHANNEL, {"store_id": store_id})
+            pending.add(store_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session: Session):
+    for store_id in session.info.pop(_SESSION_KEY, ()):
+        _drop(store_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session: Session):
+    session.info.pop(_SESSION_KEY, None)
+
+
+notifications.subscribe(CHANNEL, lambda payload: _drop(int(payload["store_id"])))
+notifications.on_connect(_drop_all)
+
+
+def get(store_id: int) -> CatalogueEntry | None:
+    """
+    Returns a store's cached catalogue, without touching the database.
+
+    Args:
+        store_id (int): The ID of the store.
+    Returns:
+        CatalogueEntry | None: The cached catalogue, or `None` if it isn't cached (or is older than `MAX_AGE`).
+    """
+    with _lock:
+        entry = _cache.get(store_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.loaded_at > MAX_AGE:
+            _cache.pop(store_id)
+            return None
+        _cache.move_to_end(store_id)
+        return entry
+
+
+def load(store_id: int, session: Session) -> CatalogueEntry:
+    """
+    Loads and serializes a store's catalogue (its products, except the anonymized ones, by ID).
+
+    Args:
+        store_id (int): The ID of the store.
+        session (Session): The SQLAlchemy session to use for the query.
+    Returns:
+        CatalogueEntry: The serialized catalogue.
+    """
+    products = (
+        session.query(Product)
+        .filter(Product.store_id == store_id, Product.deleted_at.is_(None))
+        .order_by(Product.id)
+        .all()
+    )
+    response = GetAllProductsResponse(
+        successful=True,
+        data=[ProductRead.model_validate(p) for p in products],
+        message=f"Successfully retrieved all Products with store id {store_id}.",
+    )
+    return CatalogueEntry(response.model_dump_json().encode())
+
+
+def get_or_load(store_id: int, session: Session) -> CatalogueEntry:
+    """
+    Returns a store's catalogue, from the cache if it's there or from the database otherwise.
+
+    Args:
+        store_id (int): The ID of the store.
+        session (Session): The SQLAlchemy session to use if the catalogue has to be loaded.
+    Returns:
+        CatalogueEntry: The serialized catalogue.
+    """
+    entry = get(store_id)
+    if entry is not None:
+        return entry
+    with _lock:
+        generation = _generations.get(store_id, 0)
+
+    entry = load(store_id, session)
+
+    with _lock:
+        # if it was invalidated while loading, what was loaded may be stale: don't keep it
+        if _generations.get(store_id, 0) == generation:
+            _cache[store_id] = entry
+            _cache.move_to_end(store_id)
+            while len(_cache) > MAX_CACHED_STORES:
+                _cache.popitem(last=False)
+    return entry
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Args:
+        if_none_match (str | None): The request's `If-None-Match` header.
+        etag (str): The current ETag.
+    Returns:
+        bool: Whether the client already has the current version (so a `304` can be sent).
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison: W/"x" matches "x"
+    return any(
+        tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(",")
+    )
@@ -0,0 +1,98 @@
+"""
+`Idempotency-Key` support for create endpoints.
+
+A client that didn't get an answer (e.g. the network dropped) can safely retry a create request with the same key:
+the first request's response is stored (`crud.idempotency_key`) and returned to every retry, without running the
+creation again. The response is stored in the same transaction as what the request created, so a key is never left
+unanswered for a creation that was committed. Keys are per user and expire after `settings.idempotency_ttl_hours`.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from typing import Callable
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from ..crud import idempotency_key as idempotency_crud
+from ..schemas.general import APIResponse
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def run(
+    key: str | None,
+    user_id: int,
+    endpoint: str,
+    payload: BaseModel,
+    session: Session,
+    create: Callable[[bool], APIResponse],
+    status_code: int = 201,
+) -> APIResponse | JSONResponse:
+    """
+    Runs `create` at most once per user and idempotency key.
+
+    Successful responses and client errors (4xx, e.g. not enough stock) are stored and replayed. If `create` fails
+    with anything else the key is released, so the request can be retried. When there's a key, `create` must not
+    commit: its writes are committed along with the stored response.
+    Args:
+        key (str | None): The `Idempotency-Key` header. If `None`, `create` is simply run.
+        user_id (int): The ID of the user sending the request.
+        endpoint (str): The endpoint the request was sent to, e.g. `"POST /orders/"`.
+        payload (BaseModel): The request's body. Reusing a key with a different body is rejected.
+        session (Session): The SQLAlchemy session `create` uses.
+        create (Callable[[bool], APIResponse]): Processes the request. It's called with whether it should commit.
+        status_code (int): The status code of `create`'s successful responses. Defaults to 201.
+    Returns:
+        APIResponse | JSONResponse: `create`'s response, or the stored one (with an `Idempotent-Replayed: true`
+            header) if the key was already used.
+    Raises:
+        HTTPException(422): If the key was already used for a different endpoint or request body.
+        HTTPException(409): If a request with the same key is still being processed.
+    """
+    if key is None:
+        return create(True)
+
+    request_hash = hashlib.sha256(payload.model_dump_json().encode()).hexdigest()
+    claimed_id, record = idempotency_crud.claim(
+        user_id, key, endpoint, request_hash, session
+    )
+    if record is not None:
+        if record.status_code >= 400:
+            raise HTTPException(
+                record.status_code,
+                record.response["message"],
+                headers={REPLAYED_HEADER: "true"},
+            )
+        return JSONResponse(
+            record.response,
+            status_code=record.status_code,
+            headers={REPLAYED_HEADER: "true"},
+        )
+
+    try:
+        response = create(False)
+    except HTTPException as ex:
+        if ex.status_code >= 500:
+            idempotency_crud.release(claimed_id, session)
+        else:
+            session.rollback()
+            idempotency_crud.complete(
+                claimed_id, ex.status_code, {"message": ex.detail}, session
+            )
+        raise
+    except Exception:
+        idempotency_crud.release(claimed_id, session)
+        raise
+
+    try:
+        idempotency_crud.complete(
+            claimed_id, status_code, response.model_dump(mode="json"), session
+        )
+    except Exception:
+        idempotency_crud.release(claimed_id, session)
+        raise
+    return response
@@ -0,0 +1,41 @@
+"""
+The app's periodic jobs, registered with the `scheduler` on import.
+"""
+
+from __future__ import annotations
+
+import logging
+
+from ..crud import idempotency_key as idempotency_crud
+from ..crud import order as orders_crud
+from ..database.session import SessionLocal
+from . import scheduler
+
+logger = logging.getLogger(__name__)
+
+
+def cancel_stale_orders() -> int:
+    """
+    Releases the expired stock reservations and cancels the stale pending orders (see `crud.order.cancel_stale`).
+    Returns:
+        int: How many orders were touched (released and/or cancelled).
+    """
+    with SessionLocal() as session:
+        released, cancelled = orders_crud.cancel_stale(session)
+    if cancelled:
+        logger.info("Cancelled %d stale pending orders", len(cancelled))
+    return len(released | set(cancelled))
+
+
+def purge_idempotency_keys() -> int:
+    """
+    Deletes the expired idempotency keys.
+    Returns:
+        int: How many keys were deleted.
+    """
+    with SessionLocal() as session:
+        return idempotency_crud.purge_expired(session)
+
+
+scheduler.register("cancel_stale_orders", 60, cancel_stale_orders)
+scheduler.register("purge_idempotency_keys", 60 * 60, purge_idempotency_keys)
@@ -0,0 +1,157 @@
+"""
+Cross-worker notifications over Postgres `LISTEN`/`NOTIFY`.
+
+Writers call `notify()` inside their transaction: Postgres only delivers the notification once (and if) that
+transaction commits, so listeners never hear about changes that were rolled back. Every worker runs a single listener
+thread (`start()`/`stop()`, wired into the app's lifespan) holding one dedicated connection that `LISTEN`s on every
+channel with a registered handler, and hands each payload to those handlers. Notifications sent while the listener
+is (re)connecting are lost, so it also calls the `on_connect` handlers every time it starts listening.
+
+Handlers run on the listener thread, so they must be quick and thread-safe (e.g. hand the event off to an event loop).
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import threading
+from typing import Callable
+
+import psycopg
+from psycopg import sql
+from sqlalchemy import Text, bindparam, func, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session
+
+from ..database.session import engine
+
+RECONNECT_DELAY = 5  # seconds
+POLL_TIMEOUT = 1.0  # seconds; how often the listener checks if it was asked to stop
+
+logger = logging.getLogger(__name__)
+
+_handlers: dict[str, list[Callable[[dict], None]]] = {}
+_connect_handlers: list[Callable[[], None]] = []
+_handlers_lock = threading.Lock()
+_thread: threading.Thread | None = None
+_stop = threading.Event()
+
+
+def notify(session: Session, channel: str, payload: dict):
+    """
+    Queues a notification on the session's current transaction. It's delivered to every listening worker (this one
+    included) when the transaction commits, and dropped if it's rolled back.
+
+    Args:
+        session (Session): The SQLAlchemy session whose transaction the notification belongs to.
+        channel (str): The channel to notify.
+        payload (dict): A JSON-serializable payload. Postgres limits it to 8000 bytes, so keep it small (IDs, not rows).
+    """
+    session.execute(select(func.pg_notify(channel, json.dumps(payload))))
+
+
+def notify_many(session: Session, channel: str, payloads: list[dict]):
+    """
+    Like `notify`, for many payloads on the same channel at once, in a single statement.
+
+    Args:
+        session (Session): The SQLAlchemy session whose transaction the notifications belong to.
+        channel (str): The channel to notify.
+        payloads (list[dict]): The JSON-serializable payloads, in the order they're delivered.
+    """
+    if not payloads:
+        return
+    rows = func.unnest(
+        bindparam(
+            "payloads", [json.dumps(payload) for payload in payloads], ARRAY(Text)
+        )
+    ).table_valued("payload")
+    session.execute(select(func.pg_notify(channel, rows.c.payload)))
+
+
+def subscribe(channel: str, handler: Callable[[dict], None]):
+    """
+    Registers a handler for a channel's notifications. Handlers must be registered before `start()` is called.
+
+    Args:
+        channel (str): The channel to listen on.
+        handler (Callable[[dict], None]): Called (on the listener thread) with each decoded payload.
+    """
+    with _handlers_lock:
+        _handlers.setdefault(channel, []).append(handler)
+
+
+def on_connect(handler: Callable[[], None]):
+    """
+    Registers a handler called (on the listener thread) every time the listener starts listening, including after
+    a reconnection, e.g. to drop state that a lost notification could have left stale.
+
+    Args:
+        handler (Callable[[], None]): The handler.
+    """
+    with _handlers_lock:
+        _connect_handlers.append(handler)
+
+
+def _dispatch(channel: str, payload: str):
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        logger.warning("Ignoring malformed notification on %s: %r", channel, payload)
+        return
+    with _handlers_lock:
+        handlers = list(_handlers.get(channel, ()))
+    for handler in handlers:
+        try:
+            handler(data)
+        except Exception:
+            logger.exception("Notification handler for %s failed", channel)
+
+
+def _listen():
+    conninfo = engine.url.set(drivername="postgresql").render_as_string(
+        hide_password=False
+    )
+    while not _stop.is_set():
+        try:
+            with psycopg.connect(conninfo, autocommit=True) as conn:
+                with _handlers_lock:
+                    channels = list(_handlers)
+                    connect_handlers = list(_connect_handlers)
+                for channel in channels:
+                    conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(channel)))
+                for handler in connect_handlers:
+                    try:
+                        handler()
+                    except Exception:
+                        logger.exception("Notification connect handler failed")
+                while not _stop.is_set():
+                    for notification in conn.notifies(timeout=POLL_TIMEOUT):
+                        _dispatch(notification.channel, notification.payload)
+        except psycopg.Error:
+            # Notifications sent while reconnecting are lost: subscribers have to tolerate gaps (see `on_connect`).
+            logger.exception("Notification listener lost its connection, reconnecting")
+            _stop.wait(RECONNECT_DELAY)
+
+
+def start():
+    """
+    Starts this worker's listener thread. Does nothing if it's already running.
+    """
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_listen, name="pg-listener", daemon=True)
+    _thread.start()
+
+
+def stop():
+    """
+    Stops this worker's listener thread and waits for it to close its connection.
+    """
+    global _thread
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout=POLL_TIMEOUT + 1)
+        _thread = None
@@ -0,0 +1,125 @@
+"""
+Pushes order events (new orders, status changes, cancellations) to the store dashboards subscribed to them.
+
+`crud.order` calls `publish()` inside its transactions; the event travels through Postgres (`notifications`) to every
+worker, and each worker's `broadcaster` forwards it to the SSE connections it holds for that store.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+
+from sqlalchemy.orm import Session
+
+from ..models.order import Order
+from . import notifications
+
+CHANNEL = "order_events"
+QUEUE_SIZE = 100
+
+
+class OrderBroadcaster:
+    """
+    In-process fan-out of order events to per-store `asyncio.Queue`s.
+
+    `publish` may be called from any thread: events are handed to each subscriber's own event loop.
+    """
+
+    def __init__(self):
+        self._subscribers: dict[
+            int, set[tuple[asyncio.AbstractEventLoop, asyncio.Queue]]
+        ] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, store_id: int) -> asyncio.Queue:
+        """
+        Subscribes to a store's order events. Must be called from within the subscriber's event loop.
+
+        Args:
+            store_id (int): The ID of the store.
+        Returns:
+            asyncio.Queue: The queue the store's events will be put into.
+        """
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(store_id, set()).add(
+                (asyncio.get_running_loop(), queue)
+            )
+        return queue
+
+    def unsubscribe(self, store_id: int, queue: asyncio.Queue):
+        """
+        Removes a queue previously returned by `subscribe`.
+
+        Args:
+            store_id (int): The ID of the store.
+            queue (asyncio.Queue): The subscriber's queue.
+        """
+        with self._lock:
+            subscribers = self._subscribers.get(store_id, set())
+            subscribers.difference_update({s for s in subscribers if s[1] is queue})
+            if not subscribers:
+                self._subscribers.pop(store_id, None)
+
+    def publish(self, event: dict):
+        """
+        Forwards an event to every subscriber of its store.
+
+        Args:
+            event (dict): The event. Must have a `store_id` key.
+        """
+        with self._lock:
+            subscribers = list(self._subscribers.get(event["store_id"], ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(_put, queue, event)
+
+
+def _put(queue: asyncio.Queue, event: dict):
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        pass  # the client isn't keeping up; it'll see the current state when it reloads the orders
+
+
+broadcaster = OrderBroadcaster()
+notifications.subscribe(CHANNEL, broadcaster.publish)
+
+
+def publish(session: Session, order: Order, event_type: str):
+    """
+    Queues an order event, delivered to the order's store subscribers once the session's transaction commits.
+
+    Args:
+        session (Session): The SQLAlchemy session the order was changed in.
+        order (Order): The order (must have an ID already, i.e. be flushed).
+        event_type (str): What happened to it (`"created"`, `"status_changed"`, `"products_updated"`, `"cancelled"`).
+    """
+    publish_many(session, [(order.id, order.store_id)], order.status.value, event_type)
+
+
+def publish_many(
+    session: Session, orders: list[tuple[int, int]], status: str, event_type: str
+):
+    """
+    Queues the same event for many orders (e.g. after a bulk `UPDATE ... RETURNING`), without loading them.
+
+    Args:
+        session (Session): The SQLAlchemy session the orders were changed in.
+        orders (list[tuple[int, int]]): The `(order_id, store_id)` of every order.
+        status (str): The orders' current status.
+        event_type (str): What happened to them.
+    """
+    notifications.notify_many(
+        session,
+        CHANNEL,
+        [
+            {
+                "type": event_type,
+                "order_id": int(order_id),
+                "store_id": int(store_id),
+                "status": status,
+            }
+            for order_id, store_id in orders
+        ],
+    )
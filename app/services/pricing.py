@@ -0,0 +1,152 @@
+"""
+Effective prices: a store's products with the discount that applies to them today, in one response.
+
+A discount applies on a day if the day is between its `start_date` and `end_date` (both included) and is one of its
+`days_usable` (index 0 is Monday, as in `date.weekday()`), to purchases of between `min_amount` and `max_amount` units.
+`load` evaluates those rules for a whole store in one pass over a single query that joins its products with their
+discounts, so a shelf doesn't need a discount request per product.
+
+The serialized result is cached per store for the current day (in `STORE_TIMEZONE`). It is derived from the store's
+cached catalogue (see `catalogue`), and is only used while that catalogue entry is still the cached one: whatever
+drops the catalogue (product or discount changes, in any worker) drops the prices with it.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+
+from sqlalchemy import and_, select
+from sqlalchemy.orm import Session
+
+from ..models.discount import Discount
+from ..models.product import Product
+from ..schemas.discount import DiscountRead
+from ..schemas.product import GetPricedProductsResponse, PricedProduct, ProductRead
+from ..utils import store_today
+from . import catalogue
+from .catalogue import CatalogueEntry
+
+MAX_CACHED_STORES = 256
+
+# store ID -> (the catalogue entry it was built with, the day it was built for, the serialized prices)
+_cache: OrderedDict[int, tuple[CatalogueEntry, date, CatalogueEntry]] = OrderedDict()
+_lock = threading.Lock()
+
+
+def is_active(discount: Discount, day: date) -> bool:
+    """
+    Args:
+        discount (Discount): The discount.
+        day (date): The day.
+    Returns:
+        bool: Whether the discount can be used on that day (ignoring the purchased amount).
+    """
+    return discount.start_date <= day <= discount.end_date and bool(
+        discount.days_usable[day.weekday()]
+    )
+
+
+def discounted_price(price: Decimal, pct_off: int) -> Decimal:
+    """
+    Args:
+        price (Decimal): The price of a unit.
+        pct_off (int): The percentage taken off (1 to 100).
+    Returns:
+        Decimal: The price of a unit with the discount, rounded half-up to cents.
+    """
+    return (price * (100 - pct_off) / 100).quantize(
+        Decimal("0.01"), rounding=ROUND_HALF_UP
+    )
+
+
+def load(store_id: int, day: date, session: Session) -> CatalogueEntry:
+    """
+    Loads a store's products (except the deleted ones, by ID) with their best discount on a day, and serializes them.
+
+    Each product's `effective_price` is the price of a unit when its discount applies (it may require buying at least
+    `min_amount` units), or its price if it has no discount that day.
+    Args:
+        store_id (int): The ID of the store.
+        day (date): The day to evaluate the discounts on.
+        session (Session): The SQLAlchemy session to use for the query.
+    Returns:
+        CatalogueEntry: The serialized `GetPricedProductsResponse`.
+    """
+    rows = session.execute(
+        select(Product, Discount)
+        .outerjoin(
+            Discount,
+            and_(
+                Discount.product_id == Product.id,
+                Discount.start_date <= day,
+                Discount.end_date >= day,
+            ),
+        )
+        .where(Product.store_id == store_id, Product.deleted_at.is_(None))
+        .order_by(Product.id)
+    )
+
+    best: OrderedDict[int, tuple[Product, Discount | None]] = OrderedDict()
+    for product, discount in rows:
+        if discount is not None and not is_active(discount, day):
+            discount = None
+        current = best.get(product.id)
+        if current is None or (
+            discount is not None
+            and (current[1] is None or discount.pct_off > current[1].pct_off)
+        ):
+            best[product.id] = (product, discount)
+
+    response = GetPricedProductsResponse(
+        successful=True,
+        data=[
+            PricedProduct(
+                product=ProductRead.model_validate(product),
+                effective_price=float(
+                    discounted_price(product.price, discount.pct_off)
+                    if discount is not None
+                    else product.price
+                ),
+                discount=(
+                    DiscountRead.model_validate(discount)
+                    if discount is not None
+                    else None
+                ),
+            )
+            for product, discount in best.values()
+        ],
+        message=f"Successfully retrieved all Products with store id {store_id} and their prices for {day}.",
+    )
+    return CatalogueEntry(response.model_dump_json().encode())
+
+
+def get_or_load(store_id: int, session: Session) -> CatalogueEntry:
+    """
+    Returns a store's products with today's prices, from the cache if they're there or from the database otherwise.
+    Args:
+        store_id (int): The ID of the store.
+        session (Session): The SQLAlchemy session to use if they have to be loaded.
+    Returns:
+        CatalogueEntry: The serialized `GetPricedProductsResponse`.
+    """
+    day = store_today()
+    source = catalogue.get_or_load(store_id, session)
+    with _lock:
+        cached = _cache.get(store_id)
+        if cached is not None and cached[0] is source and cached[1] == day:
+            _cache.move_to_end(store_id)
+            return cached[2]
+
+    entry = load(store_id, day, session)
+
+    # if the catalogue was dropped while loading, what was loaded may be stale: don't keep it
+    if catalogue.get(store_id) is source:
+        with _lock:
+            _cache[store_id] = (source, day, entry)
+            _cache.move_to_end(store_id)
+            while len(_cache) > MAX_CACHED_STORES:
+                _cache.popitem(last=False)
+    return entry
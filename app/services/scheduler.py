@@ -0,0 +1,158 @@
+"""
+In-process periodic job runner.
+
+Jobs are registered with `register()` (at import time) and run one after another on a single background thread per
+worker, started and stopped from the app's lifespan (`start()`/`stop()`). Every job returns how many rows it touched;
+that, the run's duration and any failure are logged and kept in `JobStats` (see `get_stats()`).
+
+Jobs run in every worker, so they must be safe to run concurrently with themselves (e.g. a single
+`UPDATE ... RETURNING` that only touches rows still matching its condition).
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from copy import copy
+from datetime import datetime, timezone
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class JobStats:
+    """
+    Metrics of a job's runs in this worker since it started.
+
+    Attributes:
+        runs (int): How many times the job ran (including failed runs).
+        failures (int): How many runs raised an exception.
+        rows_total (int): How many rows the successful runs touched in total.
+        last_rows (int | None): How many rows the last run touched (`None` if it failed or never ran).
+        last_duration (float | None): How long the last run took, in seconds.
+        last_run_at (datetime | None): When the last run finished.
+        last_error (str | None): The exception raised by the last run, if it failed.
+    """
+
+    def __init__(self):
+        self.runs = 0
+        self.failures = 0
+        self.rows_total = 0
+        self.last_rows: int | None = None
+        self.last_duration: float | None = None
+        self.last_run_at: datetime | None = None
+        self.last_error: str | None = None
+
+
+class Job:
+    def __init__(self, name: str, interval: float, run: Callable[[], int]):
+        self.name = name
+        self.interval = interval  # seconds
+        self.run = run
+        self.next_run = 0.0  # time.monotonic()
+        self.stats = JobStats()
+
+
+_jobs: dict[str, Job] = {}
+_lock = threading.Lock()
+_thread: threading.Thread | None = None
+_stop = threading.Event()
+
+
+def register(name: str, interval: float, run: Callable[[], int]):
+    """
+    Registers a periodic job. Its first run happens one `interval` after the scheduler starts.
+    Args:
+        name (str): A unique name for the job.
+        interval (float): Seconds between the end of a run and the start of the next one.
+        run (Callable[[], int]): The job. Returns how many rows it touched.
+    """
+    with _lock:
+        _jobs[name] = Job(name=name, interval=interval, run=run)
+
+
+def run_job(job: Job) -> int | None:
+    """
+    Runs a job once, recording its metrics.
+    Args:
+        job (Job): The job to run.
+    Returns:
+        int | None: How many rows the job touched, or `None` if it failed.
+    """
+    started = time.monotonic()
+    rows = None
+    error = None
+    try:
+        rows = job.run()
+    except Exception as e:
+        error = repr(e)
+        logger.exception("Job %s failed", job.name)
+    duration = time.monotonic() - started
+
+    with _lock:
+        stats = job.stats
+        stats.runs += 1
+        stats.last_run_at = datetime.now(timezone.utc)
+        stats.last_duration = duration
+        stats.last_rows = rows
+        stats.last_error = error
+        if error is None:
+            stats.rows_total += rows
+        else:
+            stats.failures += 1
+    if error is None:
+        logger.info("Job %s touched %d rows in %.3fs", job.name, rows, duration)
+    return rows
+
+
+def _loop():
+    while not _stop.is_set():
+        with _lock:
+            jobs = list(_jobs.values())
+        now = time.monotonic()
+        for job in jobs:
+            if _stop.is_set():
+                return
+            if job.next_run <= now:
+                run_job(job)
+                job.next_run = time.monotonic() + job.interval
+        with _lock:
+            next_run = min((job.next_run for job in _jobs.values()), default=None)
+        _stop.wait(60 if next_run is None else max(0, next_run - time.monotonic()))
+
+
+def start():
+    """
+    Starts this worker's scheduler thread. Does nothing if it's already running.
+    """
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    now = time.monotonic()
+    with _lock:
+        for job in _jobs.values():
+            job.next_run = now + job.interval
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="scheduler", daemon=True)
+    _thread.start()
+
+
+def stop():
+    """
+    Stops this worker's scheduler thread, waiting for a job in progress to finish.
+    """
+    global _thread
+    _stop.set()
+    if _thread is not None:
+        _thread.join()
+        _thread = None
+
+
+def get_stats() -> dict[str, JobStats]:
+    """
+    Returns:
+        dict[str, JobStats]: A snapshot of every registered job's metrics in this worker, keyed by job name.
+    """
+    with _lock:
+        return {name: copy(job.stats) for name, job in _jobs.items()}
@@ -9,10 +9,30 @@ from app.models.user import StoreRoleEnum
 from fastapi import HTTPException
 
 
+STORE_TIMEZONE = datetime.timezone(datetime.timedelta(hours=-3))
+"""
+The timezone the stores operate in (Argentina, which has no DST). Used to decide which day a sale belongs to.
+"""
+
+
 def utcnow():
     return datetime.datetime.now(datetime.timezone.utc)
 
 
+def as_utc(moment: datetime.datetime) -> datetime.datetime:
+    """
+    Returns `moment` as an aware datetime. Naive datetimes are assumed to be in UTC.
+    """
+    return moment if moment.tzinfo else moment.replace(tzinfo=datetime.timezone.utc)
+
+
+def store_today() -> datetime.date:
+    """
+    Returns the current date in `STORE_TIMEZONE`.
+    """
+    return datetime.datetime.now(STORE_TIMEZONE).date()
+
+
 def owns_a_store(user: User, allow_cashiers: bool = False) -> bool:
     """
     Checks if the user owns a store.
@@ -13,6 +13,7 @@ from ..utils import (
     get_json_data,
 )
 from app.schemas.discount import GetAllDiscountsResponse, GetDiscountResponse
+from app.utils import store_today
 from .test_users import (
     leading_zero_md,
     leading_zero_y,
@@ -93,6 +94,27 @@ def test_get_discount_by_product_id_allownull():
     schema_test(response.json(), GetDiscountResponse)
 
 
+def test_get_all_discounts_from_store():
+    product = random.choice(get_json_data("/api/v1/products", client))
+    store_id = product["store_id"]
+    store_product_ids = {
+        p["id"] for p in get_json_data(f"/api/v1/products/store/{store_id}", client)
+    }
+
+    response = client.get(f"/api/v1/discounts/store/{store_id}")
+    assert response.status_code == 200
+    schema_test(response.json(), GetAllDiscountsResponse)
+    discounts = response.json()["data"]
+    assert all(d["product_id"] in store_product_ids for d in discounts)
+
+    response = client.get(f"/api/v1/discounts/store/{store_id}?active_only=true")
+    assert response.status_code == 200
+    today = store_today()
+    for discount in response.json()["data"]:
+        assert discount in discounts
+        assert discount["start_date"] <= today.isoformat() <= discount["end_date"]
+
+
 def test_create_discount():
     discount = _random_discount()
     response = client.post("/api/v1/discounts/", data=json.dumps(discount))
@@ -0,0 +1,42 @@
+from datetime import date
+from decimal import Decimal
+
+import app.main  # noqa: F401 (maps every model, so their relationships resolve)
+
+from app.models.discount import Discount
+from app.services import pricing
+
+MONDAY = date(2026, 10, 19)
+
+
+def _discount(**kwargs):
+    values = {
+        "product_id": 1,
+        "pct_off": 25,
+        "start_date": date(2026, 10, 18),
+        "end_date": date(2026, 10, 25),
+        "days_usable": [True] * 7,
+        "min_amount": 1,
+        "max_amount": 10,
+    }
+    values.update(kwargs)
+    return Discount(**values)
+
+
+def test_discount_is_active_between_its_dates_on_its_days():
+    discount = _discount()
+    assert pricing.is_active(discount, MONDAY)
+    assert pricing.is_active(discount, date(2026, 10, 25))  # the end date is included
+    assert not pricing.is_active(discount, date(2026, 10, 26))
+    assert not pricing.is_active(discount, date(2026, 10, 17))
+
+    # days_usable[0] is Monday
+    discount = _discount(days_usable=[False] + [True] * 6)
+    assert not pricing.is_active(discount, MONDAY)
+    assert pricing.is_active(discount, date(2026, 10, 20))
+
+
+def test_discounted_price_rounds_half_up_to_cents():
+    price = Decimal("3.33")
+    assert pricing.discounted_price(price, 50) == Decimal("1.67")
+    assert pricing.discounted_price(price, 100) == Decimal("0.00")
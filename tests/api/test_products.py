@@ -3,7 +3,12 @@ import pytest
 from fastapi.testclient import TestClient
 
 from app.main import app
-from app.schemas.product import GetAllProductsResponse, GetProductResponse
+from app.schemas.product import (
+    GetAllProductsResponse,
+    GetPricedProductsResponse,
+    GetProductResponse,
+    StockTakeResponse,
+)
 
 from ..utils import (
     get_json,
@@ -20,6 +25,9 @@ from ..utils import (
 import json
 
 import random
+import string
+
+from urllib.parse import quote
 
 client = TestClient(app)
 
@@ -193,3 +201,240 @@ def test_delete_product_when_in_pa_orders():
 
     response = client.delete(f"/api/v1/products/{product['id']}")
     bad_request_test(response)
+
+
+def test_delete_product_in_cancelled_order_anonymizes_it():
+    product = random_product()
+    response = client.post("/api/v1/products/", data=json.dumps(product))
+    successful_post_response_test(response)
+    product_id = response.json()["data"]["id"]
+
+    order_post_response = client.post(
+        "/api/v1/orders/",
+        data=json.dumps(
+            {
+                "store_id": product["store_id"],
+                "products": [{"product_id": product_id, "quantity": 1}],
+                "payment_method": random.randint(0, 3),
+                "user_id": 1,
+            }
+        ),
+    )
+    order_id = order_post_response.json()["data"]["id"]
+    client.patch(f"/api/v1/orders/{order_id}/cancel")
+
+    # the cancelled order still references it, so it's kept but hidden
+    response = client.delete(f"/api/v1/products/{product_id}")
+    successful_ud_response_test(response)
+    not_found_response_test(client.get(f"/api/v1/products/{product_id}"))
+    response = client.get(f"/api/v1/products/{product_id}?allow_anonymized=true")
+    assert response.status_code == 200
+    assert response.json()["data"]["name"] == "Deleted Product"
+
+
+def test_get_product_by_barcode():
+    products = [
+        p
+        for p in get_json_data("/api/v1/products/", client)
+        if p["barcode"] is not None
+    ]
+    if products == []:
+        pytest.skip("No products have a barcode")
+    product = random.choice(products)
+    code = quote(product["barcode"], safe="")
+    response = client.get(
+        f"/api/v1/products/store/{product['store_id']}/barcode/{code}"
+    )
+    assert response.status_code == 200
+    schema_test(response.json(), GetProductResponse)
+    assert response.json()["data"]["id"] == product["id"]
+
+
+def test_get_product_by_not_existing_barcode():
+    store_id = random.choice(get_json_data("/api/v1/stores/", client))["id"]
+    code = quote(random_string(129, 140), safe="")
+    response = client.get(f"/api/v1/products/store/{store_id}/barcode/{code}")
+    not_found_response_test(response)
+
+
+def test_create_product_with_repeated_barcode_400():
+    product = random_product()
+    product["barcode"] = random_string(64, 128)
+    successful_post_response_test(
+        client.post("/api/v1/products/", data=json.dumps(product))
+    )
+    response = client.post("/api/v1/products/", data=json.dumps(product))
+    bad_request_test(response)
+
+
+def test_search_products():
+    products = [
+        p for p in get_json_data("/api/v1/products/", client) if not p["hidden"]
+    ]
+    if products == []:
+        pytest.skip("No visible products")
+    product = random.choice(products)
+    response = client.get(
+        "/api/v1/products/search",
+        params={"q": product["name"], "store_id": product["store_id"], "limit": 100},
+    )
+    assert response.status_code == 200
+    schema_test(response.json(), GetAllProductsResponse)
+    results = response.json()["data"]
+    assert product["id"] in [p["id"] for p in results]
+    assert all(p["store_id"] == product["store_id"] for p in results)
+    assert not any(p["hidden"] for p in results)
+
+
+def test_search_products_tolerates_typos():
+    product = random_product()
+    word = "".join(random.choices(string.ascii_lowercase, k=12))
+    product["name"] = f"Yerba {word}"
+    product["hidden"] = False
+    response = client.post("/api/v1/products/", data=json.dumps(product))
+    successful_post_response_test(response)
+    id = response.json()["data"]["id"]
+    store_id = get_json_data(f"/api/v1/products/{id}", client)["store_id"]
+
+    typo = word[:5] + word[6:]  # a missing letter
+    response = client.get(
+        "/api/v1/products/search",
+        params={"q": typo, "store_id": store_id, "limit": 100},
+    )
+    assert response.status_code == 200
+    assert id in [p["id"] for p in response.json()["data"]]
+
+
+def test_get_products_by_store_id_revalidates_with_etag():
+    product = random.choice(get_json_data("/api/v1/products/", client))
+    url = f"/api/v1/products/store/{product['store_id']}"
+    response = client.get(url)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+
+    # any change to the store's products gives the catalogue a new ETag
+    update = random_product()
+    update["barcode"] = None
+    successful_ud_response_test(
+        client.put(f"/api/v1/products/{product['id']}", data=json.dumps(update))
+    )
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    schema_test(response.json(), GetAllProductsResponse)
+
+
+def test_import_products_upserts_by_barcode():
+    products = [random_product() for _ in range(3)]
+    for product in products:
+        product["barcode"] = random_string(64, 128)
+        product.pop("store_id")
+    body = "\n".join(json.dumps(p) for p in products) + "\n{not json\n"
+    response = client.post(
+        "/api/v1/products/import",
+        content=body.encode(),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    result = response.json()["data"]
+    assert (result["created"], result["updated"], result["failed"]) == (3, 0, 1)
+    assert result["errors"][0]["row"] == 4
+
+    # importing them again updates them (matched by barcode) instead of creating them
+    products[0]["name"] = random_string()
+    response = client.post(
+        "/api/v1/products/import",
+        content="\n".join(json.dumps(p) for p in products).encode(),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    result = response.json()["data"]
+    assert (result["created"], result["updated"], result["failed"]) == (0, 3, 0)
+
+
+def test_import_products_reports_where_an_invalid_upload_stops():
+    product = random_product()
+    product.pop("store_id")
+    product["barcode"] = random_string(64, 128)
+    body = json.dumps(product).encode() + b"\n\xff\xfe\n" + json.dumps(product).encode()
+    response = client.post(
+        "/api/v1/products/import",
+        content=body,
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    result = response.json()["data"]
+    # the rows before the invalid UTF-8 are imported, and nothing after it is read
+    assert (result["created"], result["updated"], result["failed"]) == (1, 0, 1)
+    assert result["errors"][0]["row"] == 2
+
+
+def test_stock_take_returns_variances():
+    product = random_product()
+    product["barcode"] = random_string(64, 128)
+    response = client.post("/api/v1/products/", data=json.dumps(product))
+    successful_post_response_test(response)
+    product_id = response.json()["data"]["id"]
+
+    counts = [{"barcode": product["barcode"], "counted_quantity": 7}]
+    response = client.post("/api/v1/products/stock-take", json={"counts": counts})
+    assert response.status_code == 200
+    schema_test(response.json(), StockTakeResponse)
+    variance = response.json()["data"]["variances"][0]
+    assert variance["product_id"] == product_id
+    assert variance["previous_quantity"] == product["quantity"]
+    assert variance["variance"] == 7 - product["quantity"]
+    assert get_json_data(f"/api/v1/products/{product_id}", client)["quantity"] == 7
+
+    # counting the same product twice (by ID and by barcode) changes nothing
+    counts = [
+        {"product_id": product_id, "counted_quantity": 1},
+        {"barcode": product["barcode"], "counted_quantity": 2},
+    ]
+    response = client.post("/api/v1/products/stock-take", json={"counts": counts})
+    bad_request_test(response)
+    assert get_json_data(f"/api/v1/products/{product_id}", client)["quantity"] == 7
+
+
+def test_stock_take_below_reserved_units_400():
+    product = random_product()
+    product["barcode"] = random_string(64, 128)
+    product["quantity"] = 10
+    response = client.post("/api/v1/products/", data=json.dumps(product))
+    successful_post_response_test(response)
+    product_id = response.json()["data"]["id"]
+    store_id = get_json_data(f"/api/v1/products/{product_id}", client)["store_id"]
+
+    order = {
+        "user_id": random.choice(get_json_data("/api/v1/users/", client))["id"],
+        "store_id": store_id,
+        "payment_method": 0,
+        "products": [{"product_id": product_id, "quantity": 4}],
+    }
+    successful_post_response_test(
+        client.post("/api/v1/orders/", data=json.dumps(order))
+    )
+
+    # the pending order's 4 units are still on the shelf
+    counts = [{"product_id": product_id, "counted_quantity": 3}]
+    response = client.post("/api/v1/products/stock-take", json={"counts": counts})
+    bad_request_test(response)
+    assert get_json_data(f"/api/v1/products/{product_id}", client)["quantity"] == 10
+
+
+def test_get_priced_products_by_store_id():
+    store_id = random.choice(get_json_data("/api/v1/stores/", client))["id"]
+    response = client.get(f"/api/v1/products/store/{store_id}/priced")
+    assert response.status_code == 200
+    schema_test(response.json(), GetPricedProductsResponse)
+    for priced in response.json()["data"]:
+        assert priced["product"]["store_id"] == store_id
+        if priced["discount"] is None:
+            assert priced["effective_price"] == priced["product"]["price"]
+        else:
+            assert priced["effective_price"] <= priced["product"]["price"]
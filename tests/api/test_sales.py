@@ -0,0 +1,46 @@
+import pytest
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from ..utils import get_json_data, schema_test
+from app.schemas.sale import CreateSalesBatchResponse
+
+import json
+
+from datetime import datetime, timedelta, timezone
+
+client = TestClient(app)
+
+
+def test_create_sales_batch_from_ndjson():
+    products = [
+        p
+        for p in get_json_data("/api/v1/products/", client)
+        if p["quantity"] - p["reserved_quantity"] >= 1
+    ]
+    if products == []:
+        pytest.skip("No products have enough qty")
+    product = products[0]
+    sale = {
+        "store_id": product["store_id"],
+        "products": [{"product_id": product["id"], "quantity": 1}],
+        "payment_method": 0,
+        "user_id": None,
+    }
+    rung_up_at = datetime.now(timezone.utc) - timedelta(hours=5)
+    lines = [
+        json.dumps({**sale, "timestamp": rung_up_at.isoformat()}),
+        "{not json",
+        json.dumps({**sale, "products": []}),
+    ]
+    response = client.post(
+        "/api/v1/sales/batch",
+        content="\n".join(lines).encode(),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 201
+    schema_test(response.json(), CreateSalesBatchResponse)
+    results = response.json()["data"]
+    assert [r["index"] for r in results] == [0, 1, 2]
+    assert [r["successful"] for r in results] == [True, False, False]
@@ -0,0 +1,65 @@
+from datetime import date, datetime, timezone
+
+import app.main  # noqa: F401 (maps every model, so their relationships resolve)
+
+from app.api.serialization import discount_to_dict, order_to_dict, sale_to_dict
+from app.models.discount import Discount
+from app.models.order import Order, StatusEnum
+from app.models.orders_products import OrdersProducts
+from app.models.products_sales import ProductsSales
+from app.models.sale import Sale
+from app.schemas.discount import DiscountRead
+from app.schemas.order import OrderRead
+from app.schemas.sale import SaleRead
+
+
+# The fast path skips validation, so its output must be exactly what validating it would produce
+def test_order_to_dict_matches_order_read():
+    order = Order(
+        id=1,
+        user_id=2,
+        store_id=3,
+        created_at=datetime(2026, 10, 17, 12, 30, tzinfo=timezone.utc),
+        status=StatusEnum.RECEIVED,
+        received_at=datetime(2026, 10, 17, 13, 0, tzinfo=timezone.utc),
+        payment_method=1,
+    )
+    order.orders_products = [
+        OrdersProducts(order_id=1, product_id=4, quantity=2.0),
+        OrdersProducts(order_id=1, product_id=5, quantity=0.5),
+    ]
+    data = order_to_dict(order)
+    assert OrderRead.model_validate(data).model_dump(mode="json") == data
+
+    order.received_at = None
+    data = order_to_dict(order)
+    assert data["received_at"] is None
+    assert OrderRead.model_validate(data).model_dump(mode="json") == data
+
+
+def test_sale_to_dict_matches_sale_read():
+    sale = Sale(
+        id=1,
+        user_id=None,
+        store_id=3,
+        payment_method=0,
+        timestamp=datetime(2026, 10, 17, 12, 30, tzinfo=timezone.utc),
+    )
+    sale.products_sales = [ProductsSales(sale_id=1, product_id=4, quantity=3.0)]
+    data = sale_to_dict(sale)
+    assert SaleRead.model_validate(data).model_dump(mode="json") == data
+
+
+def test_discount_to_dict_matches_discount_read():
+    discount = Discount(
+        id=1,
+        product_id=4,
+        pct_off=15,
+        start_date=date(2026, 10, 1),
+        end_date=date(2026, 10, 31),
+        days_usable=[True, False, True, False, True, False, True],
+        min_amount=1,
+        max_amount=10,
+    )
+    data = discount_to_dict(discount)
+    assert DiscountRead.model_validate(data).model_dump(mode="json") == data
@@ -0,0 +1,112 @@
+import pytest
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+from app.database.session import SessionLocal
+from app.models.user import User
+from app.schemas.general import APIResponse
+from app.schemas.order import OrderUpdate, ProductOrder
+from app.services import idempotency
+
+THREADS = 8
+
+
+def _user_id():
+    with SessionLocal() as session:
+        user = session.query(User).filter(User.deleted_at.is_(None)).first()
+        if user is None:
+            pytest.skip("No users")
+        return int(user.id)
+
+
+def test_concurrent_duplicates_run_once():
+    user_id = _user_id()
+    key = uuid.uuid4().hex
+    payload = OrderUpdate(products=[ProductOrder(product_id=1, quantity=1)])
+    calls = []
+    lock = threading.Lock()
+
+    def create(commit: bool):
+        assert not commit  # committed along with the stored response
+        with lock:
+            calls.append(1)
+        time.sleep(0.5)  # keep the claim open while the duplicates arrive
+        return APIResponse(successful=True, data={"id": 1}, message="Created.")
+
+    def submit(_):
+        with SessionLocal() as session:
+            try:
+                response = idempotency.run(
+                    key, user_id, "POST /test/", payload, session, create
+                )
+                return getattr(response, "status_code", 201)
+            except HTTPException as e:
+                return e.status_code
+
+    with ThreadPoolExecutor(THREADS) as executor:
+        statuses = list(executor.map(submit, range(THREADS)))
+
+    assert len(calls) == 1
+    assert statuses.count(201) >= 1
+    assert set(statuses) <= {201, 409}
+
+    # a later retry gets the stored response without running create again
+    with SessionLocal() as session:
+        response = idempotency.run(
+            key, user_id, "POST /test/", payload, session, create
+        )
+    assert response.status_code == 201
+    assert response.headers[idempotency.REPLAYED_HEADER] == "true"
+    assert len(calls) == 1
+
+
+def test_key_reused_for_a_different_request():
+    user_id = _user_id()
+    key = uuid.uuid4().hex
+
+    def create(commit: bool):
+        return APIResponse(successful=True, data=None, message="Created.")
+
+    with SessionLocal() as session:
+        idempotency.run(
+            key,
+            user_id,
+            "POST /test/",
+            OrderUpdate(products=[ProductOrder(product_id=1, quantity=1)]),
+            session,
+            create,
+        )
+        with pytest.raises(HTTPException) as ex:
+            idempotency.run(
+                key,
+                user_id,
+                "POST /test/",
+                OrderUpdate(products=[ProductOrder(product_id=1, quantity=2)]),
+                session,
+                create,
+            )
+        assert ex.value.status_code == 422
+
+
+def test_client_errors_are_replayed():
+    user_id = _user_id()
+    key = uuid.uuid4().hex
+    payload = OrderUpdate(products=[ProductOrder(product_id=1, quantity=1)])
+    calls = []
+
+    def create(commit: bool):
+        calls.append(1)
+        raise HTTPException(400, "Not enough stock")
+
+    with SessionLocal() as session:
+        for _ in range(2):
+            with pytest.raises(HTTPException) as ex:
+                idempotency.run(key, user_id, "POST /test/", payload, session, create)
+            assert ex.value.status_code == 400
+            assert ex.value.detail == "Not enough stock"
+    assert len(calls) == 1
@@ -0,0 +1,356 @@
+import pytest
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+from app.config import settings
+from app.database.session import SessionLocal
+from app.crud import order as crud
+from app.crud import stock_reservation as reservations_crud
+from app.models.order import Order, StatusEnum
+from app.models.product import Product
+from app.models.stock_reservation import StockReservation
+from app.models.user import User
+from app.schemas.order import OrderCreate, OrderUpdate, ProductOrder
+from app.services import notifications, order_events
+
+import random
+
+THREADS = 8
+UPDATES_PER_THREAD = 5
+HOT_STOCK = 10
+CHECKOUTS = 24
+
+
+def _stock_and_reserved_by_others(
+    product_ids: list[int], order_ids: list[int], session
+):
+    """
+    Returns, for each product, its on-hand stock and the quantity reserved by orders other than the given ones.
+    Updating the orders' products only moves quantity between their reservations and the available stock, so both
+    must stay constant.
+    """
+    totals = {
+        int(p.id): (p.quantity, p.reserved_quantity)
+        for p in session.query(Product).filter(Product.id.in_(product_ids))
+    }
+    for r in session.query(StockReservation).filter(
+        StockReservation.order_id.in_(order_ids),
+        StockReservation.product_id.in_(product_ids),
+    ):
+        quantity, reserved = totals[int(r.product_id)]
+        totals[int(r.product_id)] = (quantity, reserved - r.quantity)
+    return totals
+
+
+def test_update_products_concurrently():
+    with SessionLocal() as session:
+        products = (
+            session.query(Product)
+            .filter(
+                Product.quantity - Product.reserved_quantity >= THREADS * 2 + 1,
+                Product.deleted_at.is_(None),
+            )
+            .all()
+        )
+        by_store: dict[int, list[Product]] = {}
+        for p in products:
+            by_store.setdefault(int(p.store_id), []).append(p)
+        candidates = [ps for ps in by_store.values() if len(ps) >= 2]
+        user = session.query(User).filter(User.deleted_at.is_(None)).first()
+        if candidates == [] or user is None:
+            pytest.skip("No store has at least 2 products with enough qty")
+
+        store_products = random.choice(candidates)[:4]
+        product_ids = [int(p.id) for p in store_products]
+        order_ids = [
+            crud.create(
+                OrderCreate(
+                    store_id=store_products[0].store_id,
+                    products=[
+                        ProductOrder(product_id=pid, quantity=1) for pid in product_ids
+                    ],
+                    payment_method=0,
+                ),
+                session,
+                user,
+            )
+            for _ in range(THREADS)
+        ]
+        before = _stock_and_reserved_by_others(product_ids, order_ids, session)
+
+    def hammer(order_id: int):
+        with SessionLocal() as session:
+            for _ in range(UPDATES_PER_THREAD):
+                chosen = random.sample(
+                    product_ids, k=random.randint(1, len(product_ids))
+                )
+                crud.update_products(
+                    order_id,
+                    OrderUpdate(
+                        products=[
+                            ProductOrder(product_id=pid, quantity=random.randint(1, 2))
+                            for pid in chosen
+                        ]
+                    ),
+                    session,
+                )
+
+    with ThreadPoolExecutor(THREADS) as executor:
+        list(executor.map(hammer, order_ids))  # re-raises any deadlock or error
+
+    with SessionLocal() as session:
+        after = _stock_and_reserved_by_others(product_ids, order_ids, session)
+        for product_id in product_ids:
+            assert after[product_id] == pytest.approx(before[product_id])
+        for order_id in order_ids:
+            order = session.get(Order, order_id)
+            assert order.status == StatusEnum.PENDING
+            assert len(order.orders_products) == len(
+                {op.product_id for op in order.orders_products}
+            )
+            assert reservations_crud.get_by_order_id(order_id, session) == {
+                int(op.product_id): op.quantity for op in order.orders_products
+            }
+            crud.cancel(order_id, session)
+
+
+def test_order_events_reach_store_subscribers():
+    with SessionLocal() as session:
+        product = (
+            session.query(Product)
+            .filter(
+                Product.quantity - Product.reserved_quantity >= 1,
+                Product.deleted_at.is_(None),
+            )
+            .first()
+        )
+        user = session.query(User).filter(User.deleted_at.is_(None)).first()
+        if product is None or user is None:
+            pytest.skip("No product with enough qty")
+        store_id = int(product.store_id)
+        product_id = int(product.id)
+
+    def create_and_cancel():
+        with SessionLocal() as session:
+            order_id = crud.create(
+                OrderCreate(
+                    store_id=store_id,
+                    products=[ProductOrder(product_id=product_id, quantity=1)],
+                    payment_method=0,
+                ),
+                session,
+                user,
+            )
+            crud.cancel(order_id, session)
+            return order_id
+
+    async def run():
+        queue = order_events.broadcaster.subscribe(store_id)
+        try:
+            await asyncio.sleep(1)  # let the listener LISTEN
+            order_id = await asyncio.to_thread(create_and_cancel)
+            received = []
+            while len(received) < 2:
+                event = await asyncio.wait_for(queue.get(), timeout=5)
+                if event["order_id"] == order_id:
+                    received.append((event["type"], event["status"]))
+            return received
+        finally:
+            order_events.broadcaster.unsubscribe(store_id, queue)
+
+    notifications.start()
+    try:
+        assert asyncio.run(run()) == [
+            ("created", "pending"),
+            ("cancelled", "cancelled"),
+        ]
+    finally:
+        notifications.stop()
+
+
+@pytest.mark.parametrize("stock_locking", ["pessimistic", "optimistic"])
+def test_concurrent_checkouts_of_a_hot_product(stock_locking, monkeypatch):
+    """
+    Many checkouts of the same product at once: exactly `HOT_STOCK` of them must succeed, whatever the locking mode.
+    (Compare both modes' wall time with `pytest --durations`.)
+    """
+    monkeypatch.setattr(settings, "stock_locking", stock_locking)
+    with SessionLocal() as session:
+        product = session.query(Product).filter(Product.deleted_at.is_(None)).first()
+        user = session.query(User).filter(User.deleted_at.is_(None)).first()
+        if product is None or user is None:
+            pytest.skip("No products")
+        product_id, store_id = int(product.id), int(product.store_id)
+        original_quantity = product.quantity
+        product.quantity = product.reserved_quantity + HOT_STOCK
+        session.commit()
+
+    def checkout(_):
+        with SessionLocal() as session:
+            try:
+                return crud.create(
+                    OrderCreate(
+                        store_id=store_id,
+                        products=[ProductOrder(product_id=product_id, quantity=1)],
+                        payment_method=0,
+                    ),
+                    session,
+                    user,
+                )
+            except HTTPException as e:
+                assert e.status_code == 400
+                return None
+
+    order_ids = []
+    try:
+        with ThreadPoolExecutor(THREADS) as executor:
+            results = list(executor.map(checkout, range(CHECKOUTS)))
+        order_ids = [order_id for order_id in results if order_id is not None]
+
+        assert len(order_ids) == HOT_STOCK
+        with SessionLocal() as session:
+            product = session.get(Product, product_id)
+            assert product.quantity - product.reserved_quantity == pytest.approx(0)
+    finally:
+        with SessionLocal() as session:
+            for order_id in order_ids:
+                crud.cancel(order_id, session)
+            session.get(Product, product_id).quantity = original_quantity
+            session.commit()
+
+
+def _place_order(session, quantity: float = 1):
+    product = (
+        session.query(Product)
+        .filter(
+            Product.quantity - Product.reserved_quantity >= quantity,
+            Product.deleted_at.is_(None),
+        )
+        .first()
+    )
+    user = session.query(User).filter(User.deleted_at.is_(None)).first()
+    if product is None or user is None:
+        pytest.skip("No product with enough available qty")
+    order_id = crud.create(
+        OrderCreate(
+            store_id=product.store_id,
+            products=[ProductOrder(product_id=product.id, quantity=quantity)],
+            payment_method=0,
+        ),
+        session,
+        user,
+    )
+    return order_id, int(product.id)
+
+
+def _stock(product_id: int, session):
+    session.expire_all()
+    product = session.get(Product, product_id)
+    return product.quantity, product.reserved_quantity
+
+
+def test_cancel_releases_the_reservation():
+    with SessionLocal() as session:
+        order_id, product_id = _place_order(session)
+        quantity, reserved = _stock(product_id, session)
+        assert reservations_crud.get_by_order_id(order_id, session) == {product_id: 1}
+
+        crud.cancel(order_id, session)
+        assert _stock(product_id, session) == pytest.approx((quantity, reserved - 1))
+        assert reservations_crud.get_by_order_id(order_id, session) == {}
+
+
+def _expire(order_id: int, session):
+    session.query(StockReservation).filter(
+        StockReservation.order_id == order_id
+    ).update({"expires_at": datetime.now(timezone.utc) - timedelta(minutes=1)})
+    session.commit()
+
+
+def test_expired_reservations_are_released():
+    with SessionLocal() as session:
+        order_id, product_id = _place_order(session)
+        quantity, reserved = _stock(product_id, session)
+        store = session.get(Order, order_id).store
+        timeout = store.pending_order_timeout
+        store.pending_order_timeout = None
+        session.commit()
+        try:
+            _expire(order_id, session)
+
+            released, cancelled = crud.cancel_stale(session)
+            assert order_id in released and order_id not in cancelled
+            assert _stock(product_id, session) == pytest.approx(
+                (quantity, reserved - 1)
+            )
+            assert session.get(Order, order_id).status == StatusEnum.PENDING
+        finally:
+            session.get(Order, order_id).store.pending_order_timeout = timeout
+            session.commit()
+
+
+def test_stale_orders_are_cancelled():
+    with SessionLocal() as session:
+        order_id, product_id = _place_order(session)
+        quantity, reserved = _stock(product_id, session)
+        store = session.get(Order, order_id).store
+        timeout = store.pending_order_timeout
+        store.pending_order_timeout = 5
+        session.commit()
+        try:
+            session.get(Order, order_id).created_at = datetime.now(
+                timezone.utc
+            ) - timedelta(minutes=10)
+            session.commit()
+
+            released, cancelled = crud.cancel_stale(session)
+            assert order_id in released and order_id in cancelled
+            assert _stock(product_id, session) == pytest.approx(
+                (quantity, reserved - 1)
+            )
+            session.expire_all()
+            assert session.get(Order, order_id).status == StatusEnum.CANCELLED
+        finally:
+            session.get(Order, order_id).store.pending_order_timeout = timeout
+            session.commit()
+
+
+def test_received_order_takes_stock_once():
+    with SessionLocal() as session:
+        order_id, product_id = _place_order(session)
+        quantity, reserved = _stock(product_id, session)
+
+        crud.update_status(order_id, session)  # accepted
+        assert reservations_crud.get_by_order_id(order_id, session) == {product_id: 1}
+        crud.update_status(order_id, session)  # received
+        assert _stock(product_id, session) == pytest.approx(
+            (quantity - 1, reserved - 1)
+        )
+
+
+def test_get_all_by_store_id_filters():
+    with SessionLocal() as session:
+        order_id, _ = _place_order(session)
+        order = session.get(Order, order_id)
+        store_id, created_at = int(order.store_id), order.created_at
+
+        pending = crud.get_all_by_store_id(
+            store_id, session, [StatusEnum.PENDING], created_at
+        )
+        assert order_id in [o.id for o in pending]
+        assert all(o.status == StatusEnum.PENDING for o in pending)
+        assert all(o.created_at >= created_at for o in pending)
+        assert [o.created_at for o in pending] == sorted(
+            (o.created_at for o in pending), reverse=True
+        )
+        assert order_id not in [
+            o.id
+            for o in crud.get_all_by_store_id(
+                store_id, session, [StatusEnum.ACCEPTED, StatusEnum.CANCELLED]
+            )
+        ]
+        crud.cancel(order_id, session)
@@ -0,0 +1,74 @@
+import pytest
+
+from app.database.session import SessionLocal
+from app.crud import product_sales_stats as crud
+from app.crud import sale as sales_crud
+from app.models.product import Product
+from app.models.product_sales_stats import ProductSalesTotal, ProductDailySales
+from app.schemas.sale import SaleCreate, ProductSale
+
+import random
+
+
+def _counters_test(store_id: int, session):
+    """
+    Asserts that the counters of every product of the store match a full recount of its sales.
+    """
+    expected = crud.recount(store_id, session)
+    totals = {
+        int(t.product_id): t
+        for t in session.query(ProductSalesTotal).filter(
+            ProductSalesTotal.store_id == store_id
+        )
+    }
+    assert totals.keys() == expected.keys()
+
+    for product_id, (units, last_sold_at) in expected.items():
+        assert totals[product_id].units == pytest.approx(units)
+        assert totals[product_id].last_sold_at == last_sold_at
+
+        daily_units = sum(
+            d.units
+            for d in session.query(ProductDailySales).filter(
+                ProductDailySales.product_id == product_id
+            )
+        )
+        assert daily_units == pytest.approx(units)
+
+
+def test_counters_match_full_recount():
+    with SessionLocal() as session:
+        store_ids = [
+            int(s) for (s,) in session.query(Product.store_id).distinct().all()
+        ]
+        if store_ids == []:
+            pytest.skip("There are no products.")
+
+        for store_id in store_ids:
+            _counters_test(store_id, session)
+
+
+def test_counters_after_sale():
+    with SessionLocal() as session:
+        products = (
+            session.query(Product)
+            .filter(
+                Product.quantity - Product.reserved_quantity >= 1,
+                Product.deleted_at.is_(None),
+            )
+            .all()
+        )
+        if products == []:
+            pytest.skip("No products have enough qty")
+        product = random.choice(products)
+
+        sales_crud.create(
+            SaleCreate(
+                store_id=product.store_id,
+                products=[ProductSale(product_id=product.id, quantity=1)],
+                payment_method=random.randint(0, 2),
+                user_id=None,
+            ),
+            session,
+        )
+        _counters_test(int(product.store_id), session)
@@ -0,0 +1,196 @@
+import pytest
+
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+
+from app.database.session import SessionLocal
+from app.crud import sale as crud
+from app.crud.points import get_user_points, points_enabled
+from app.models.product import Product
+from app.models.products_sales import ProductsSales
+from app.models.sale import Sale
+from app.models.store import Store
+from app.models.user import User
+from app.schemas.sale import BatchSaleCreate, ProductSale, SaleCreate
+
+
+def _live_user(session):
+    return session.query(User).filter(User.deleted_at.is_(None)).first()
+
+
+def _stocked_products(session, min_available: float = 2):
+    """
+    Returns the live products of a store that has at least 2 with `min_available` available units.
+    """
+    products = (
+        session.query(Product)
+        .filter(
+            Product.quantity - Product.reserved_quantity >= min_available,
+            Product.deleted_at.is_(None),
+        )
+        .order_by(Product.id)
+        .all()
+    )
+    by_store: dict[int, list[Product]] = {}
+    for p in products:
+        by_store.setdefault(int(p.store_id), []).append(p)
+    for store_products in by_store.values():
+        if len(store_products) >= 2:
+            return store_products[:2]
+    return None
+
+
+def _points(user_id: int, store_id: int, session) -> int:
+    if not points_enabled(store_id, session):
+        return 0
+    entry = get_user_points(user_id, store_id, session, True)
+    return 0 if entry is None else int(entry.amount)
+
+
+def test_create_sale_deducts_stock_and_adds_points():
+    with SessionLocal() as session:
+        products = _stocked_products(session)
+        user = _live_user(session)
+        if products is None or user is None:
+            pytest.skip("No store has 2 products with enough stock")
+        store_id = int(products[0].store_id)
+        user_id = int(user.id)
+        before = {int(p.id): p.quantity for p in products}
+        points_before = _points(user_id, store_id, session)
+        expected_points = 0
+        if points_enabled(store_id, session):
+            ps_value = session.get(Store, store_id).ps_value
+            expected_points = sum(int(p.price / ps_value) for p in products)
+
+        sale_id = crud.create(
+            SaleCreate(
+                store_id=store_id,
+                products=[ProductSale(product_id=p.id, quantity=1) for p in products],
+                payment_method=0,
+                user_id=user_id,
+            ),
+            session,
+        )
+
+    with SessionLocal() as session:
+        for product_id, quantity in before.items():
+            assert session.get(Product, product_id).quantity == pytest.approx(
+                quantity - 1
+            )
+        lines = session.query(ProductsSales).filter(ProductsSales.sale_id == sale_id)
+        assert sorted(int(line.product_id) for line in lines) == sorted(before)
+        assert _points(user_id, store_id, session) == points_before + expected_points
+
+
+def test_create_sale_with_insufficient_stock_writes_nothing():
+    with SessionLocal() as session:
+        products = _stocked_products(session, min_available=1)
+        if products is None:
+            pytest.skip("No store has 2 products with stock")
+        store_id = int(products[0].store_id)
+        before = {int(p.id): p.quantity for p in products}
+        available = products[1].quantity - products[1].reserved_quantity
+
+        with pytest.raises(HTTPException) as ex:
+            crud.create(
+                SaleCreate(
+                    store_id=store_id,
+                    products=[
+                        ProductSale(product_id=products[0].id, quantity=1),
+                        ProductSale(product_id=products[1].id, quantity=available + 1),
+                    ],
+                    payment_method=0,
+                    user_id=None,
+                ),
+                session,
+            )
+        assert ex.value.status_code == 400
+
+    # the whole basket is validated before writing: the first product's stock is untouched
+    with SessionLocal() as session:
+        for product_id, quantity in before.items():
+            assert session.get(Product, product_id).quantity == pytest.approx(quantity)
+
+
+def test_create_sale_with_product_from_another_store_400():
+    with SessionLocal() as session:
+        products = _stocked_products(session, min_available=1)
+        if products is None:
+            pytest.skip("No store has 2 products with stock")
+        other = (
+            session.query(Product)
+            .filter(
+                Product.store_id != products[0].store_id,
+                Product.deleted_at.is_(None),
+                Product.quantity - Product.reserved_quantity >= 1,
+            )
+            .first()
+        )
+        if other is None:
+            pytest.skip("There are no products of another store")
+
+        with pytest.raises(HTTPException) as ex:
+            crud.create(
+                SaleCreate(
+                    store_id=products[0].store_id,
+                    products=[
+                        ProductSale(product_id=products[0].id, quantity=1),
+                        ProductSale(product_id=other.id, quantity=1),
+                    ],
+                    payment_method=0,
+                    user_id=None,
+                ),
+                session,
+            )
+        assert ex.value.status_code == 400
+
+
+def test_create_sale_with_empty_basket_400():
+    with SessionLocal() as session:
+        product = session.query(Product).filter(Product.deleted_at.is_(None)).first()
+        if product is None:
+            pytest.skip("There are no products")
+
+        with pytest.raises(HTTPException) as ex:
+            crud.create(
+                SaleCreate(
+                    store_id=product.store_id,
+                    products=[],
+                    payment_method=0,
+                    user_id=None,
+                ),
+                session,
+            )
+        assert ex.value.status_code == 400
+
+
+def test_create_batch_keeps_each_sale_timestamp():
+    with SessionLocal() as session:
+        products = _stocked_products(session)
+        if products is None:
+            pytest.skip("No store has 2 products with enough stock")
+        store_id = int(products[0].store_id)
+        rung_up_at = datetime.now(timezone.utc) - timedelta(hours=5)
+        sale = {
+            "store_id": store_id,
+            "products": [ProductSale(product_id=products[0].id, quantity=1)],
+            "payment_method": 0,
+            "user_id": None,
+        }
+
+        results = crud.create_batch(
+            [
+                # naive timestamps are taken as UTC
+                BatchSaleCreate(**sale, timestamp=rung_up_at.replace(tzinfo=None)),
+                BatchSaleCreate(**sale, timestamp=rung_up_at + timedelta(days=1)),
+                BatchSaleCreate(**sale),
+            ],
+            store_id,
+            session,
+        )
+        assert [r.successful for r in results] == [True, False, True]
+
+    with SessionLocal() as session:
+        assert session.get(Sale, results[0].id).timestamp == rung_up_at
+        assert session.get(Sale, results[2].id).timestamp > rung_up_at
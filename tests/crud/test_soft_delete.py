@@ -0,0 +1,120 @@
+import pytest
+
+import random
+import string
+from datetime import date
+
+from fastapi import HTTPException
+
+from app.database.session import SessionLocal
+from app.crud import product as products_crud
+from app.crud import sale as sales_crud
+from app.crud import user as users_crud
+from app.models.product import Product
+from app.models.store import Store
+from app.models.user import User
+from app.schemas.product import ProductCreate
+from app.schemas.sale import ProductSale, SaleCreate
+
+
+def _random_string(length: int = 12) -> str:
+    return "".join(random.choices(string.ascii_lowercase, k=length))
+
+
+def _store_id(session) -> int:
+    store = session.query(Store).first()
+    if store is None:
+        pytest.skip("There are no stores")
+    return int(store.id)
+
+
+def _sell(product_id: int, store_id: int, user_id: int | None, session):
+    sales_crud.create(
+        SaleCreate(
+            store_id=store_id,
+            products=[ProductSale(product_id=product_id, quantity=1)],
+            payment_method=0,
+            user_id=user_id,
+        ),
+        session,
+    )
+
+
+def test_deleting_a_sold_product_hides_it():
+    with SessionLocal() as session:
+        store_id = _store_id(session)
+        product_id = products_crud.create(
+            ProductCreate(
+                name=_random_string(),
+                brand=_random_string(),
+                price=10,
+                points_price=None,
+                type=1,
+                quantity=5,
+                desc=_random_string(),
+                barcode=None,
+            ),
+            session,
+            store_id,
+        )
+        _sell(product_id, store_id, None, session)
+
+        products_crud.delete(product_id, session)
+
+    with SessionLocal() as session:
+        # referenced by the sale, so it's anonymized rather than erased
+        assert session.get(Product, product_id).deleted_at is not None
+        with pytest.raises(HTTPException) as ex:
+            products_crud.get_by_id(product_id, session)
+        assert ex.value.status_code == 404
+        assert products_crud.get_by_id(product_id, session, allow_anonymized=True)
+        assert product_id not in {
+            p.id for p in products_crud.get_all_by_store_id(store_id, session)
+        }
+        assert product_id not in {p.id for p in products_crud.get_all(session)}
+
+
+def test_deleting_a_user_with_sales_hides_them():
+    email = f"{_random_string()}@test.invalid"
+    with SessionLocal() as session:
+        store_id = _store_id(session)
+        product = (
+            session.query(Product)
+            .filter(
+                Product.store_id == store_id,
+                Product.quantity - Product.reserved_quantity >= 1,
+                Product.deleted_at.is_(None),
+            )
+            .first()
+        )
+        if product is None:
+            pytest.skip("The store has no products with stock")
+        user = User(
+            first_names=_random_string(),
+            last_name=_random_string(),
+            email=email,
+            password=_random_string(),
+            birthdate=date(2000, 1, 1),
+            gender="X",
+            res_area=_random_string(),
+            is_admin=False,
+        )
+        session.add(user)
+        session.commit()
+        user_id = int(user.id)
+        _sell(int(product.id), store_id, user_id, session)
+
+        users_crud.delete(user_id, session)
+
+    with SessionLocal() as session:
+        assert session.get(User, user_id).deleted_at is not None
+        with pytest.raises(HTTPException) as ex:
+            users_crud.get_by_id(user_id, session)
+        assert ex.value.status_code == 404
+        assert user_id not in {u.id for u in users_crud.get_all(session)}
+        # login looks users up by email: neither the old nor the anonymized one finds them
+        assert users_crud.get_by_email(email, session, raise_404=False) is None
+        assert (
+            users_crud.get_by_email("deleted@example.com", session, raise_404=False)
+            is None
+        )